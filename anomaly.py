@@ -0,0 +1,163 @@
+import math
+from array import array
+from sqlite3 import Connection
+from typing import Callable, Dict, List, Optional
+
+import metrics
+
+
+class RollingWindow:
+    """
+    Mean and variance of the last `size` values, kept in a ring buffer together with the running sum and
+    sum of squares, so adding a value costs O(1) and the memory does not grow with the number of values.
+    The sums are recomputed from the buffer every `size` values, so rounding errors do not pile up.
+    """
+    __slots__ = ['values', 'size', 'count', 'position', 'total', 'squares']
+
+    def __init__(self, size: int):
+        if size < 2:
+            raise ValueError("A rolling window needs room for at least two values!")
+        self.values = array("d", bytes(8 * size))
+        self.size = size
+        self.count = 0
+        self.position = 0  # where the next value goes
+        self.total = 0.0
+        self.squares = 0.0
+
+    def add(self, value: float):
+        if self.count == self.size:
+            oldest = self.values[self.position]
+            self.total -= oldest
+            self.squares -= oldest * oldest
+        else:
+            self.count += 1
+        self.values[self.position] = value
+        self.position = (self.position + 1) % self.size
+        if self.position == 0:
+            self.total = math.fsum(self.values)
+            self.squares = math.fsum(v * v for v in self.values)
+        else:
+            self.total += value
+            self.squares += value * value
+
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+    def variance(self) -> Optional[float]:
+        """
+        Population variance of the values in the window.
+        """
+        if not self.count:
+            return None
+        mean = self.total / self.count
+        return max(0.0, self.squares / self.count - mean * mean)
+
+
+class Anomaly:
+    """
+    A reading that does not fit the recent behaviour of its sensor: a SPIKE deviates by more than the
+    threshold in standard deviations from the rolling mean, STUCK is the reading that completes a run of
+    identical values long enough to suspect a hung sensor.
+    """
+    __slots__ = ['kind', 'serial_no', 'time_stamp', 'value', 'score']
+
+    SPIKE = "spike"
+    STUCK = "stuck"
+
+    def __init__(self, kind: str, serial_no: str, time_stamp: str, value: float, score: float):
+        self.kind = kind
+        self.serial_no = serial_no
+        self.time_stamp = time_stamp
+        self.value = value
+        self.score = score  # standard deviations from the mean for spikes, length of the run for stuck sensors
+
+    def __repr__(self):
+        return f"Anomaly({self.kind} {self.serial_no} at {self.time_stamp}: {self.value})"
+
+
+class _SensorState:
+    __slots__ = ['window', 'last', 'run']
+
+    def __init__(self, window: int):
+        self.window = RollingWindow(window)
+        self.last: Optional[float] = None
+        self.run = 0  # consecutive readings equal to last
+
+
+class AnomalyDetector:
+    """
+    Flags spikes and stuck sensors as readings are ingested. Every watched sensor has a fixed-size rolling
+    window, so the memory per sensor is constant and each reading is checked in O(1).
+    load() picks the sensors to watch from the devices table, register on_measurement as measurement
+    listener of SmartHousePersistence (see attach()) to check every ingested reading.
+    """
+
+    SENSOR_TYPES = ("Temperatursensor", "Fuktighetssensor", "Luftkvalitetssensor")
+
+    def __init__(self, window: int = 60, threshold: float = 4.0, min_count: int = 10, stuck_after: int = 30,
+                 tolerance: float = 1e-9, min_std: float = 0.1):
+        self.window = window
+        self.threshold = threshold
+        self.min_count = min_count  # readings in the window before spikes are reported
+        # lower bound of the standard deviation spikes are measured in, so that after a run of (nearly)
+        # identical readings a small change is no spike: it must deviate by at least threshold * min_std
+        self.min_std = min_std
+        self.stuck_after = stuck_after
+        self.tolerance = tolerance  # readings closer than this count as identical
+        self.sensors: Dict[str, _SensorState] = {}
+        self.listeners: List[Callable[[Anomaly], None]] = []
+
+    def watch(self, serial_no: str):
+        if serial_no not in self.sensors:
+            self.sensors[serial_no] = _SensorState(self.window)
+
+    def unwatch(self, serial_no: str):
+        self.sensors.pop(serial_no, None)
+
+    def load(self, connection: Connection):
+        """
+        Watches all temperature, humidity and air quality sensors in the database.
+        """
+        for (serial_no,) in connection.execute(
+                f"SELECT serial_no FROM devices WHERE type IN ({', '.join('?' * len(self.SENSOR_TYPES))})",
+                self.SENSOR_TYPES).fetchall():
+            self.watch(serial_no)
+
+    def check(self, serial_no: str, time_stamp: str, value: Optional[float]) -> Optional[Anomaly]:
+        """
+        Adds the reading to the window of its sensor and returns the anomaly it represents, if any.
+        Readings of sensors that are not watched are ignored.
+        """
+        state = self.sensors.get(serial_no)
+        if state is None or value is None:
+            return None
+        anomaly = None
+        window = state.window
+        if window.count >= self.min_count:
+            deviation = abs(value - window.total / window.count)
+            std = max(math.sqrt(window.variance()), self.min_std)
+            if deviation > self.threshold * std:
+                anomaly = Anomaly(Anomaly.SPIKE, serial_no, time_stamp, value, deviation / std)
+        if state.last is not None and abs(value - state.last) <= self.tolerance:
+            state.run += 1
+            if state.run == self.stuck_after and anomaly is None:
+                anomaly = Anomaly(Anomaly.STUCK, serial_no, time_stamp, value, state.run)
+        else:
+            state.run = 1
+        state.last = value
+        window.add(value)
+        if anomaly is not None:
+            metrics.ANOMALIES.inc(kind=anomaly.kind)
+            for listener in self.listeners:
+                listener(anomaly)
+        return anomaly
+
+    def on_measurement(self, time_stamp: str, device: int, value: Optional[float], serial_no: str):
+        self.check(serial_no, time_stamp, value)
+
+    def attach(self, persistence):
+        """
+        Checks every reading ingested through the given SmartHousePersistence.
+        """
+        if self.on_measurement not in persistence.measurement_listeners:
+            persistence.measurement_listeners.append(self.on_measurement)
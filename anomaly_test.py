@@ -0,0 +1,75 @@
+import math
+import random
+import statistics
+import unittest
+from anomaly import Anomaly, AnomalyDetector, RollingWindow
+from persistence import SmartHousePersistence
+from testcase import DemoDatabaseTestCase
+
+
+class AnomalyTest(DemoDatabaseTestCase):
+    def test_rolling_window(self):
+        rng = random.Random(1)
+        values = [rng.gauss(20, 2) for _ in range(100)]
+        window = RollingWindow(8)
+        self.assertIsNone(window.mean())
+        for i, v in enumerate(values):
+            window.add(v)
+            last = values[max(0, i - 7):i + 1]
+            self.assertEqual(len(last), window.count)
+            self.assertAlmostEqual(statistics.mean(last), window.mean())
+            self.assertAlmostEqual(statistics.pvariance(last), window.variance())
+        self.assertEqual(8, len(window.values))
+        # the sums do not drift away from the values in the window
+        window = RollingWindow(4)
+        for _ in range(10_000):
+            window.add(rng.uniform(0, 1e9))
+        for _ in range(4):
+            window.add(0.5)
+        self.assertEqual(0.5, window.mean())
+        self.assertEqual(0.0, window.variance())
+
+    def test_spikes_and_stuck_sensors(self):
+        rng = random.Random(2)
+        detector = AnomalyDetector(window=30, threshold=5, min_count=10, stuck_after=20)
+        detector.watch("t")
+        found = []
+        detector.listeners.append(found.append)
+        for i in range(200):
+            value = 21 + rng.gauss(0, 0.3)
+            if i == 100:
+                value = 40.0
+            detector.check("t", f"t{i}", value)
+        for i in range(200, 250):
+            detector.check("t", f"t{i}", 21.0)
+        # unwatched sensors are ignored
+        self.assertIsNone(detector.check("other", "t0", 1000.0))
+        self.assertEqual([(Anomaly.SPIKE, "t100"), (Anomaly.STUCK, "t219")],
+                         [(a.kind, a.time_stamp) for a in found])
+        self.assertGreater(found[0].score, 5)
+        self.assertEqual(20, found[1].score)
+        # after identical readings a small change is no spike, a large one has a finite score
+        self.assertIsNone(detector.check("t", "t250", 21.2))
+        spike = detector.check("t", "t251", 30.0)
+        self.assertEqual(Anomaly.SPIKE, spike.kind)
+        self.assertTrue(math.isfinite(spike.score))
+
+    def test_ingested_readings(self):
+        p = SmartHousePersistence(self.db_file)
+        detector = AnomalyDetector(min_count=5)
+        detector.load(p.connection)
+        self.assertIn("e237beec-2675-4cb0", detector.sensors)
+        found = []
+        detector.listeners.append(found.append)
+        detector.attach(p)
+        detector.attach(p)
+        self.assertEqual(1, p.measurement_listeners.count(detector.on_measurement))
+        rows = [(f"2023-02-16T08:{i:02}:00", 8, 20 + math.sin(i), "e237beec-2675-4cb0") for i in range(30)]
+        rows.append(("2023-02-16T08:30:00", 8, 60.0, "e237beec-2675-4cb0"))
+        p.add_measurements(rows)
+        p.connection.rollback()
+        self.assertEqual(["2023-02-16T08:30:00"], [a.time_stamp for a in found])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+import bisect
+import itertools
+import os
+import struct
+import sys
+import zlib
+from array import array
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+# Chunk file layout: header followed by the zlib-compressed timestamp column and value column.
+# Timestamps are stored as int64 seconds since the epoch, delta-encoded (the first entry is the absolute
+# timestamp), values as float64 with NaN for NULL. Both columns are little-endian.
+MAGIC = b"SHMA"
+VERSION = 1
+HEADER = struct.Struct("<4sBIqqII")  # magic, version, count, first ts, last ts, len(timestamps), len(values)
+CHUNK_SUFFIX = ".chunk"
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def file_name(serial_no: str) -> str:
+    """
+    Returns the serial number with all characters that are unsafe in file names replaced by '_'.
+    """
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in serial_no)
+
+
+def to_epoch(time_stamp) -> int:
+    """
+    Converts a datetime or an ISO 8601 string as stored in the measurements table to epoch seconds.
+    """
+    if isinstance(time_stamp, str):
+        time_stamp = datetime.fromisoformat(time_stamp)
+    return int((time_stamp - EPOCH).total_seconds())
+
+
+def from_epoch(seconds: int) -> datetime:
+    return EPOCH + timedelta(seconds=seconds)
+
+
+def _little_endian(a: array) -> bytes:
+    if sys.byteorder == "big":
+        a = array(a.typecode, a)
+        a.byteswap()
+    return a.tobytes()
+
+
+def _from_little_endian(typecode: str, data: bytes) -> array:
+    a = array(typecode)
+    a.frombytes(data)
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a
+
+
+def encode_chunk(timestamps: List[int], values: List[float]) -> bytes:
+    deltas = array("q", [timestamps[0]] + [b - a for a, b in zip(timestamps, timestamps[1:])])
+    column_ts = zlib.compress(_little_endian(deltas), 6)
+    column_values = zlib.compress(_little_endian(array("d", values)), 6)
+    header = HEADER.pack(MAGIC, VERSION, len(timestamps), timestamps[0], timestamps[-1], len(column_ts),
+                         len(column_values))
+    return header + column_ts + column_values
+
+
+def decode_chunk(data: bytes) -> Tuple[array, array]:
+    magic, version, count, _, _, ts_len, values_len = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a measurement archive chunk!")
+    offset = HEADER.size
+    deltas = _from_little_endian("q", zlib.decompress(data[offset:offset + ts_len]))
+    values = _from_little_endian("d", zlib.decompress(data[offset + ts_len:offset + ts_len + values_len]))
+    return array("q", itertools.accumulate(deltas)), values
+
+
+class MeasurementArchive:
+    """
+    Cold storage tier for old measurements: one directory per sensor containing compressed, columnar
+    chunk files named <first ts>_<last ts>_<sequence no>.chunk, so a range read only opens the chunks that
+    overlap it. The sequence number tells apart chunks with the same bounds.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _device_dir(self, serial_no: str) -> str:
+        return os.path.join(self.directory, file_name(serial_no))
+
+    def chunks(self, serial_no: str) -> List[Tuple[int, int, str]]:
+        """
+        Returns (first ts, last ts, file path) of all chunks of the sensor in time order.
+        """
+        device_dir = self._device_dir(serial_no)
+        if not os.path.isdir(device_dir):
+            return []
+        result = []
+        for name in os.listdir(device_dir):
+            if name.endswith(CHUNK_SUFFIX):
+                first, last, sequence_no = name[:-len(CHUNK_SUFFIX)].split("_")
+                result.append((int(first), int(last), int(sequence_no), os.path.join(device_dir, name)))
+        return [(first, last, file_path) for first, last, _, file_path in sorted(result)]
+
+    def write(self, serial_no: str, rows: Iterable[Tuple[str, float]]) -> int:
+        """
+        Writes (time_stamp, value) rows, sorted by time stamp, as a new chunk. Existing chunks are never
+        overwritten, even if they have the same bounds. Returns the number of rows.
+        """
+        timestamps = []
+        values = []
+        for time_stamp, value in rows:
+            timestamps.append(to_epoch(time_stamp))
+            values.append(float("nan") if value is None else value)
+        if not timestamps:
+            return 0
+        device_dir = self._device_dir(serial_no)
+        os.makedirs(device_dir, exist_ok=True)
+        sequence_no = 0
+        while True:
+            file_path = os.path.join(device_dir, f"{timestamps[0]}_{timestamps[-1]}_{sequence_no}{CHUNK_SUFFIX}")
+            if not os.path.exists(file_path):
+                break
+            sequence_no += 1
+        with open(file_path + ".tmp", "wb") as f:
+            f.write(encode_chunk(timestamps, values))
+        os.replace(file_path + ".tmp", file_path)
+        return len(timestamps)
+
+    def read(self, serial_no: str, from_ts: datetime, to_ts: datetime) -> Tuple[array, array]:
+        """
+        Returns the epoch timestamps and values of the sensor within [from_ts, to_ts] in time order.
+        """
+        start = to_epoch(from_ts)
+        end = to_epoch(to_ts)
+        timestamps = array("q")
+        values = array("d")
+        for first, last, file_path in self.chunks(serial_no):
+            if last < start or first > end:
+                continue
+            chunk_ts, chunk_values = self._load(file_path)
+            lo = bisect.bisect_left(chunk_ts, start)
+            hi = bisect.bisect_right(chunk_ts, end)
+            timestamps.extend(chunk_ts[lo:hi])
+            values.extend(chunk_values[lo:hi])
+        return timestamps, values
+
+    def last_before(self, serial_no: str, time_stamp: datetime) -> Optional[Tuple[int, float]]:
+        """
+        Returns the epoch timestamp and value of the last reading of the sensor before the given time, if any.
+        """
+        start = to_epoch(time_stamp)
+        for first, last, file_path in reversed(self.chunks(serial_no)):
+            if first < start:
+                chunk_ts, chunk_values = self._load(file_path)
+                i = bisect.bisect_left(chunk_ts, start) - 1
+                return chunk_ts[i], chunk_values[i]
+        return None
+
+    def first_after(self, serial_no: str, time_stamp: datetime) -> Optional[Tuple[int, float]]:
+        """
+        Returns the epoch timestamp and value of the first reading of the sensor after the given time, if any.
+        """
+        end = to_epoch(time_stamp)
+        for first, last, file_path in self.chunks(serial_no):
+            if last > end:
+                chunk_ts, chunk_values = self._load(file_path)
+                i = bisect.bisect_right(chunk_ts, end)
+                return chunk_ts[i], chunk_values[i]
+        return None
+
+    @staticmethod
+    def _load(file_path: str) -> Tuple[array, array]:
+        with open(file_path, "rb") as f:
+            return decode_chunk(f.read())
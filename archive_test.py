@@ -0,0 +1,78 @@
+import math
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+import resample
+from archive import MeasurementArchive, encode_chunk, decode_chunk, to_epoch
+from persistence import SmartHousePersistence, SmartHouseAnalytics
+from devices import TemperatureSensor
+from testcase import DemoDatabaseTestCase
+
+
+class ArchiveTest(DemoDatabaseTestCase):
+    file_path = str(Path(__file__).parent.absolute()) + "/db.sqlite"
+
+    def test_chunk_encoding(self):
+        timestamps = [to_epoch("2023-02-13T06:01:01"), to_epoch("2023-02-13T06:02:01"), to_epoch("2023-02-13T06:04:00")]
+        ts, values = decode_chunk(encode_chunk(timestamps, [1.5, 2.25, -3.0]))
+        self.assertEqual(timestamps, list(ts))
+        self.assertEqual([1.5, 2.25, -3.0], list(values))
+
+    def test_reading_across_tiers(self):
+        sensor = TemperatureSensor("d16d84de-79f1-4f9a")
+        from_ts = datetime.fromisoformat("2023-02-13T12:00:00")
+        to_ts = datetime.fromisoformat("2023-02-15T12:00:00")
+        expected = SmartHouseAnalytics(SmartHousePersistence(ArchiveTest.file_path)) \
+            .get_sensor_readings_in_timespan(sensor, from_ts, to_ts)
+        p = SmartHousePersistence(self.db_file, os.path.join(self.tmp_dir, "archive"))
+        total = p.cursor.execute("SELECT COUNT(*) FROM measurements").fetchone()[0]
+        moved = p.archive_measurements(datetime.fromisoformat("2023-02-14T12:00:00"), chunk_rows=500)
+        self.assertTrue(moved > 0)
+        self.assertEqual(total - moved, p.cursor.execute("SELECT COUNT(*) FROM measurements").fetchone()[0])
+        self.assertTrue(len(p.archive.chunks(sensor.serial_no)) > 1)
+        self.assertEqual(expected, SmartHouseAnalytics(p).get_sensor_readings_in_timespan(sensor, from_ts, to_ts))
+
+    def test_resampling_across_tiers(self):
+        sensor = TemperatureSensor("d16d84de-79f1-4f9a")
+        step = timedelta(minutes=1)
+        # within the archive, across the cutoff and after it
+        timespans = [(datetime(2023, 2, 13, 12, 0, 30), datetime(2023, 2, 13, 13)),
+                     (datetime(2023, 2, 14, 11, 30, 30), datetime(2023, 2, 14, 12, 30)),
+                     (datetime(2023, 2, 14, 12, 0, 30), datetime(2023, 2, 14, 13))]
+        analytics = SmartHouseAnalytics(SmartHousePersistence(ArchiveTest.file_path))
+        expected = [analytics.resample_sensor(sensor, f, t, step, resample.LINEAR)[1] for f, t in timespans]
+        p = SmartHousePersistence(self.db_file, os.path.join(self.tmp_dir, "archive"))
+        p.archive_measurements(datetime(2023, 2, 14, 12), chunk_rows=500)
+        archived = SmartHouseAnalytics(p)
+        for (from_ts, to_ts), values in zip(timespans, expected):
+            actual = archived.resample_sensor(sensor, from_ts, to_ts, step, resample.LINEAR)[1]
+            # the readings around the timespan fill both ends
+            self.assertFalse(math.isnan(actual[0]) or math.isnan(actual[-1]))
+            self.assertEqual(list(values), list(actual))
+
+    def test_reading_unknown_sensor(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            ts, values = MeasurementArchive(tmp).read("unknown", datetime(2023, 1, 1), datetime(2023, 2, 1))
+            self.assertEqual(0, len(ts))
+
+    def test_chunks_with_same_bounds(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            archive = MeasurementArchive(tmp)
+            for value in (1.0, 2.0):
+                archive.write("sensor", [("2023-02-14T00:00:00", value), ("2023-02-14T01:00:00", value)])
+            self.assertEqual(2, len(archive.chunks("sensor")))
+            _, values = archive.read("sensor", datetime(2023, 2, 14), datetime(2023, 2, 15))
+            self.assertEqual([1.0, 1.0, 2.0, 2.0], sorted(values))
+
+    def test_archiving_inside_transaction(self):
+        p = SmartHousePersistence(self.db_file, os.path.join(self.tmp_dir, "archive"))
+        with self.assertRaises(RuntimeError):
+            with p.transaction():
+                p.archive_measurements(datetime(2023, 2, 14, 12))
+        self.assertEqual([], p.archive.chunks("e237beec-2675-4cb0"))
+
+
+if __name__ == '__main__':
+    unittest.main()
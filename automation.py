@@ -0,0 +1,125 @@
+import operator
+from typing import Callable, Dict, List, Optional
+
+import metrics
+from devices import Device, DeviceVisitor
+from events import StateChangeEvent
+from smarthouse import SmartHouse
+
+OPERATORS: Dict[str, Callable[[float, float], bool]] = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+
+class Rule:
+    """
+    "If the reading of the sensor <op> threshold, apply the visitor to the targets". The action runs when the
+    condition becomes true, `otherwise` (if given) when it becomes false again, so a rule does not fire on every
+    reading while its condition holds.
+    """
+
+    def __init__(self, name: str, serial_no: str, op: str, threshold: float, action: DeviceVisitor,
+                 targets: List[Device], otherwise: Optional[DeviceVisitor] = None):
+        if op not in OPERATORS:
+            raise ValueError(f"Unknown operator {op}!")
+        self.name = name
+        self.serial_no = serial_no
+        self.op = op
+        self.threshold = threshold
+        self.action = action
+        self.targets = targets
+        self.otherwise = otherwise
+        self.active: Optional[bool] = None  # unknown until the first reading
+        self._compare = OPERATORS[op]
+
+    def evaluate(self, value: Optional[float]) -> bool:
+        """
+        Checks a new reading and runs the action on a change of the condition. Returns True if anything ran.
+        """
+        if value is None:
+            return False
+        active = self._compare(value, self.threshold)
+        if active == self.active:
+            return False
+        self.active = active
+        visitor = self.action if active else self.otherwise
+        if visitor is None:
+            return False
+        for device in self.targets:
+            device.accept(visitor)
+        return True
+
+    def __repr__(self):
+        return f"Rule({self.name}: {self.serial_no} {self.op} {self.threshold})"
+
+
+class AutomationEngine:
+    """
+    Evaluates rules on the readings ingested for a house. Rules are indexed by the serial number of the sensor
+    they reference, so a reading is only checked against its own rules no matter how many rules exist.
+    """
+
+    def __init__(self, house: SmartHouse):
+        self.house = house
+        self.rules: Dict[str, List[Rule]] = {}
+        self._subscription = None
+
+    def __len__(self):
+        return sum(len(rules) for rules in self.rules.values())
+
+    def add_rule(self, rule: Rule) -> Rule:
+        self.rules.setdefault(rule.serial_no, []).append(rule)
+        return rule
+
+    def remove_rule(self, rule: Rule):
+        rules = self.rules.get(rule.serial_no, [])
+        if rule in rules:
+            rules.remove(rule)
+        if not rules:
+            self.rules.pop(rule.serial_no, None)
+
+    def add_room_rule(self, room_name: str, sensor_type: str, op: str, threshold: float, action: DeviceVisitor,
+                      target_type: str, otherwise: Optional[DeviceVisitor] = None) -> List[Rule]:
+        """
+        Adds a rule for every sensor of the given type in the room, acting on all devices of target_type there,
+        e.g. add_room_rule("Bathroom 2", "Fuktighetssensor", ">", 70, TurnOnVisitor(), "Luftavfukter").
+        """
+        room = next((r for r in self.house.get_all_rooms() if r.name == room_name), None)
+        if room is None:
+            raise LookupError(f"Room {room_name} does not exist!")
+        targets = [d for d in room if d.get_type_name() == target_type]
+        return [self.add_rule(Rule(f"{room_name}: {sensor_type} {op} {threshold}", sensor.serial_no, op, threshold,
+                                   action, targets, otherwise))
+                for sensor in room if sensor.get_type_name() == sensor_type]
+
+    def on_reading(self, serial_no: str, value: Optional[float]) -> int:
+        """
+        Evaluates the rules of one sensor and returns the number of rules that ran an action.
+        """
+        fired = 0
+        for rule in self.rules.get(serial_no, ()):
+            if rule.evaluate(value):
+                metrics.RULES_FIRED.inc(rule=rule.name)
+                fired += 1
+        return fired
+
+    def _on_event(self, event: StateChangeEvent):
+        if event.source == StateChangeEvent.MEASUREMENT:
+            self.on_reading(event.serial_no, event.value)
+
+    def start(self):
+        """
+        Evaluates the rules on every reading published by the house, see SmartHouse.attach().
+        """
+        if self._subscription is None:
+            self._subscription = self.house.subscribe(self._on_event)
+
+    def stop(self):
+        if self._subscription is not None:
+            self.house.unsubscribe(self._subscription)
+            self._subscription = None
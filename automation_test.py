@@ -0,0 +1,51 @@
+import unittest
+from automation import AutomationEngine, Rule
+from devices import Dehumidifier, HumiditySensor
+from smarthouse import TurnOffVisitor, TurnOnVisitor
+from testcase import DemoDatabaseTestCase
+
+
+class AutomationTest(DemoDatabaseTestCase):
+    def test_room_rule(self):
+        house = self.build_demo_house()
+        engine = AutomationEngine(house)
+        rules = engine.add_room_rule("Bathroom 2", "Fuktighetssensor", ">", 70, TurnOnVisitor(), "Luftavfukter",
+                                     otherwise=TurnOffVisitor())
+        self.assertEqual(1, len(rules))
+        sensor = house.find_device_by_serial_no(rules[0].serial_no)
+        self.assertIsInstance(sensor, HumiditySensor)
+        dehumidifier = rules[0].targets[0]
+        self.assertIsInstance(dehumidifier, Dehumidifier)
+        commands = []
+        house.subscribe(commands.append, serial_no=dehumidifier.serial_no)
+        engine.start()
+
+        house.on_measurement("2030-01-01T00:00:00", sensor.device_id, 65.0, sensor.serial_no)
+        house.on_measurement("2030-01-01T00:01:00", sensor.device_id, 72.0, sensor.serial_no)
+        house.on_measurement("2030-01-01T00:02:00", sensor.device_id, 75.0, sensor.serial_no)
+        house.on_measurement("2030-01-01T00:03:00", sensor.device_id, 60.0, sensor.serial_no)
+        # off for the first reading, on when crossing the threshold, not again while above, off when below
+        self.assertEqual([0, 1, 0], [e.value for e in commands])
+
+        engine.stop()
+        house.on_measurement("2030-01-01T00:04:00", sensor.device_id, 80.0, sensor.serial_no)
+        self.assertEqual(3, len(commands))
+
+    def test_readings_only_reach_their_rules(self):
+        house = self.build_demo_house()
+        engine = AutomationEngine(house)
+        for i in range(1000):
+            engine.add_rule(Rule(f"rule {i}", f"sensor-{i}", ">=", 10, TurnOnVisitor(), []))
+        self.assertEqual(1000, len(engine))
+        self.assertEqual(1, engine.on_reading("sensor-7", 12))
+        self.assertEqual(0, engine.on_reading("sensor-7", 13))
+        self.assertEqual(0, engine.on_reading("unknown", 13))
+        self.assertTrue(engine.rules["sensor-7"][0].active)
+        self.assertIsNone(engine.rules["sensor-8"][0].active)
+        engine.remove_rule(engine.rules["sensor-7"][0])
+        self.assertNotIn("sensor-7", engine.rules)
+        self.assertRaises(ValueError, Rule, "bad", "sensor-1", "~", 1, TurnOnVisitor(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import date, datetime
+from typing import Callable, List, Dict
+
+from persistence import SmartHousePersistence, SmartHouseAnalytics
+from devices import *
+import datagen
+import main
+
+
+def measure(fn: Callable, repeat: int) -> Dict[str, float]:
+    timings = []
+    error = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            fn()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            break
+        timings.append(time.perf_counter() - start)
+    result = {"repeat": len(timings)}
+    if timings:
+        result.update(min=min(timings), median=statistics.median(timings), mean=statistics.mean(timings))
+    if error:
+        result["error"] = error
+    return result
+
+
+def benchmark_house(db_file: str, no_of_devices: int, no_of_rows: int, repeat: int, devices_per_room: int = 8,
+                    rooms_per_floor: int = 10) -> List[dict]:
+    results = []
+
+    def record(name: str, fn: Callable, n: int = repeat):
+        entry = {"name": name, "devices": no_of_devices, "rows": no_of_rows}
+        entry.update(measure(fn, n))
+        results.append(entry)
+
+    no_of_rooms = max(1, -(-no_of_devices // devices_per_room))
+    no_of_floors = -(-no_of_rooms // rooms_per_floor)
+    record("house_construction", lambda: datagen.generate_house(no_of_floors, no_of_rooms, no_of_devices))
+    datagen.generate_database(db_file, no_of_floors, no_of_rooms, no_of_devices, no_of_rows)
+    persistence = SmartHousePersistence(db_file)
+    record("load_house", lambda: main.load_house(persistence))
+    house = main.load_house(persistence)
+
+    devices = house.get_all_devices()
+    rooms = house.get_all_rooms()
+    last_serial = devices[-1].serial_no
+    record("find_device_by_serial_no", lambda: house.find_device_by_serial_no(last_serial))
+    record("get_all_devices", house.get_all_devices)
+    record("get_all_rooms", house.get_all_rooms)
+    record("scene_turn_on_lights", lambda: [house.turn_on_lights_in_room(r) for r in rooms])
+    record("scene_set_temperature", lambda: [house.set_temperature_in_room(r, 21.5) for r in rooms])
+    record("get_temperature_in_rooms", lambda: (house.invalidate_temperatures(), house.get_temperature_in_rooms()))
+    record("get_temperature_in_rooms_cached", house.get_temperature_in_rooms)
+    with contextlib.redirect_stdout(io.StringIO()):
+        record("device_listing", lambda: main.do_device_list(house))
+    actuators = [d for d in devices if d.is_actuator()]
+    switches = [d for d in actuators if isinstance(d, SimpleOnOffActuator)]
+    heaters = [d for d in actuators if isinstance(d, HeatControlActuator)]
+    record("state_update_turn_on", lambda: [d.turn_on() for d in switches])
+    record("state_update_set_temperature", lambda: [d.set_temperature(19.0) for d in heaters])
+
+    def commands_in_transaction():
+        # the same commands sharing one connection and a single commit
+        with persistence.transaction():
+            [d.turn_on() for d in switches]
+            [d.set_temperature(19.0) for d in heaters]
+    record("state_update_per_command", lambda: ([d.turn_on() for d in switches],
+                                                [d.set_temperature(19.0) for d in heaters]))
+    record("state_update_in_transaction", commands_in_transaction)
+
+    analytics = SmartHouseAnalytics(persistence)
+    sensor = next(d for d in devices if isinstance(d, TemperatureSensor))
+    day = date(2023, 1, 1)
+    record("get_most_recent_sensor_reading", lambda: analytics.get_most_recent_sensor_reading(sensor))
+    record("get_coldest_room", analytics.get_coldest_room)
+    record("get_sensor_readings_in_timespan",
+           lambda: analytics.get_sensor_readings_in_timespan(sensor, datetime(2023, 1, 1), datetime(2023, 1, 2)))
+
+    def describe_temperature_in_rooms_cold():
+        # forces the statistics to be loaded from the measurements again
+        analytics._room_temperatures_version = None
+        return analytics.describe_temperature_in_rooms()
+    record("describe_temperature_in_rooms", describe_temperature_in_rooms_cold)
+    record("describe_temperature_in_rooms_cached", analytics.describe_temperature_in_rooms)
+    record("get_hours_when_humidity_above_average",
+           lambda: analytics.get_hours_when_humidity_above_average(rooms[0].name, day))
+    return results
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return "unknown"
+
+
+def run(device_counts: List[int], row_counts: List[int], repeat: int) -> dict:
+    report = {
+        "commit": current_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "started": datetime.now().isoformat(),
+        "results": []
+    }
+    for no_of_devices in device_counts:
+        for no_of_rows in row_counts:
+            # every case generates its own database in a fresh directory
+            with tempfile.TemporaryDirectory() as tmp:
+                report["results"].extend(benchmark_house(os.path.join(tmp, "db.sqlite"), no_of_devices, no_of_rows,
+                                                         repeat))
+    return report
+
+
+def compare(baseline: dict, report: dict) -> List[str]:
+    """
+    Compares the median timings of two reports and returns a line per benchmark that exists in both.
+    """
+    old = {(r["name"], r["devices"], r["rows"]): r for r in baseline["results"] if "median" in r}
+    lines = []
+    for r in report["results"]:
+        key = (r["name"], r["devices"], r["rows"])
+        if key in old and "median" in r:
+            ratio = r["median"] / old[key]["median"] if old[key]["median"] else float("inf")
+            lines.append(f"{r['name']:40} {r['devices']:>8} {r['rows']:>10} {ratio:8.2f}x")
+    return lines
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks the smart house core and persistence layer")
+    parser.add_argument("--devices", type=int, nargs="+", default=[10, 100, 1000],
+                        help="house sizes (number of devices), e.g. 10 1000 100000")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000],
+                        help="sizes of the measurements table, e.g. 10000 1000000 100000000")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", help="earlier results file to compare the median timings against")
+    args = parser.parse_args()
+    report = run(args.devices, args.rows, args.repeat)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    for r in report["results"]:
+        timing = f"{r['median'] * 1000:10.3f} ms" if "median" in r else r.get("error")
+        print(f"{r['name']:40} {r['devices']:>8} {r['rows']:>10} {timing}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"Compared to {baseline['commit']}:")
+        for line in compare(baseline, report):
+            print(line)
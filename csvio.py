@@ -0,0 +1,134 @@
+import argparse
+import csv
+import gzip
+import io
+from typing import Dict, Iterator, List, Optional, TextIO
+
+import database
+from persistence import SmartHousePersistence
+
+# Columns of the tables that can be imported and exported, in table order
+TABLES = {
+    "rooms": ["id", "floor", "area", "name"],
+    "devices": ["id", "room", "type", "producer", "product_name", "serial_no"],
+    "measurements": ["time_stamp", "device", "value", "serial_no"],
+}
+
+# Alternative header names accepted on import, e.g. the device inventory in demohus-devices.csv
+HEADER_ALIASES = {
+    "No": "id",
+    "Typ": "type",
+    "Produsent": "producer",
+    "Produkt Navn": "product_name",
+    "Serienummer": "serial_no",
+}
+
+
+def open_csv(file_path: str, mode: str) -> TextIO:
+    """
+    Opens a CSV file for reading ("r") or writing ("w"), transparently (de)compressing files ending in .gz.
+    """
+    if file_path.endswith(".gz"):
+        return io.TextIOWrapper(gzip.open(file_path, mode + "b"), encoding="utf-8", newline="")
+    return open(file_path, mode, encoding="utf-8", newline="")
+
+
+def read_rows(f: TextIO, table: str) -> Iterator[tuple]:
+    """
+    Yields one tuple per CSV record with the values in table column order.
+    Columns are matched by the header line, missing columns and empty fields become NULL.
+    """
+    reader = csv.reader(f)
+    header = [HEADER_ALIASES.get(h.strip(), h.strip()) for h in next(reader)]
+    unknown = [h for h in header if h not in TABLES[table]]
+    if unknown:
+        raise ValueError(f"Unknown columns for table {table}: {', '.join(unknown)}")
+    positions = [header.index(c) if c in header else None for c in TABLES[table]]
+    for record in reader:
+        if not record:
+            continue
+        yield tuple(record[p] if p is not None and record[p] != "" else None for p in positions)
+
+
+def import_csv(persistence: SmartHousePersistence, table: str, file_path: str, chunk_size: int = 50_000,
+               on_conflict: str = "REPLACE") -> int:
+    """
+    Streams the given CSV file into the table with one executemany and commit per chunk of rows,
+    so memory use does not grow with the file size. Returns the number of imported rows.
+    """
+    if table not in TABLES:
+        raise LookupError(f"Table {table} cannot be imported!")
+    columns = TABLES[table]
+    sql = f"INSERT OR {on_conflict} INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    count = 0
+    chunk: List[tuple] = []
+    with open_csv(file_path, "r") as f:
+        for row in read_rows(f, table):
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                persistence.cursor.executemany(sql, chunk)
+                persistence.save()
+                count += len(chunk)
+                chunk.clear()
+    if chunk:
+        persistence.cursor.executemany(sql, chunk)
+        persistence.save()
+        count += len(chunk)
+    return count
+
+
+def export_csv(persistence: SmartHousePersistence, table: str, file_path: str, chunk_size: int = 50_000,
+               where: Optional[str] = None, parameters: tuple = ()) -> int:
+    """
+    Streams the table (optionally restricted by a WHERE clause) into a CSV file with a header line,
+    fetching chunk_size rows at a time. Returns the number of exported rows.
+    """
+    if table not in TABLES:
+        raise LookupError(f"Table {table} cannot be exported!")
+    columns = TABLES[table]
+    sql = f"SELECT {', '.join(columns)} FROM {table}"
+    if where:
+        sql += f" WHERE {where}"
+    cursor = persistence.connection.cursor()
+    cursor.execute(sql, parameters)
+    count = 0
+    with open_csv(file_path, "w") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        rows = cursor.fetchmany(chunk_size)
+        while rows:
+            writer.writerows(rows)
+            count += len(rows)
+            rows = cursor.fetchmany(chunk_size)
+    cursor.close()
+    return count
+
+
+def read_devices_map(file_path: str) -> Dict[int, tuple]:
+    """
+    Reads a device inventory (No,Typ,Produsent,Produkt Navn,Serienummer) into a dictionary
+    from number to (producer, product name, serial no).
+    """
+    result = {}
+    with open_csv(file_path, "r") as f:
+        for row in read_rows(f, "devices"):
+            # row: id, room, type, producer, product_name, serial_no
+            result[int(row[0])] = (row[3], row[4], row[5].strip())
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Imports or exports smart house tables as (gzipped) CSV")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("table", choices=list(TABLES))
+    parser.add_argument("file_path")
+    parser.add_argument("--db", default=database.DEFAULT_DB_FILE)
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    args = parser.parse_args()
+    persistence = SmartHousePersistence(args.db)
+    if args.command == "import":
+        persistence.create_tables()
+        n = import_csv(persistence, args.table, args.file_path, args.chunk_size)
+    else:
+        n = export_csv(persistence, args.table, args.file_path, args.chunk_size)
+    print(f"{args.command.capitalize()}ed {n} rows")
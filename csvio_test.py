@@ -0,0 +1,41 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from persistence import SmartHousePersistence
+import csvio
+
+
+class CsvIoTest(unittest.TestCase):
+    file_path = str(Path(__file__).parent.absolute()) + "/db.sqlite"
+
+    def test_reading_devices_map(self):
+        devices = csvio.read_devices_map(str(Path(__file__).parent.absolute()) + "/demohus-devices.csv")
+        self.assertEqual(31, len(devices))
+        self.assertEqual(("Jast, Hansen and Halvorson", "Charge It 9000", "0cae4f01-4ad9-47aa"), devices[6])
+
+    def test_round_trip(self):
+        source = SmartHousePersistence(CsvIoTest.file_path)
+        with tempfile.TemporaryDirectory() as tmp:
+            target = SmartHousePersistence(os.path.join(tmp, "copy.sqlite"))
+            target.create_tables()
+            for table, file_name in [("rooms", "rooms.csv"), ("devices", "devices.csv"),
+                                     ("measurements", "measurements.csv.gz")]:
+                exported = csvio.export_csv(source, table, os.path.join(tmp, file_name), chunk_size=1000)
+                imported = csvio.import_csv(target, table, os.path.join(tmp, file_name), chunk_size=1000)
+                self.assertEqual(exported, imported)
+                query = f"SELECT * FROM {table} ORDER BY 1, 2"
+                self.assertEqual(source.cursor.execute(query).fetchall(), target.cursor.execute(query).fetchall())
+
+    def test_unknown_columns(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            file_path = os.path.join(tmp, "rooms.csv")
+            with open(file_path, "w") as f:
+                f.write("id,floor,size\n1,1,20\n")
+            p = SmartHousePersistence(os.path.join(tmp, "db.sqlite"))
+            p.create_tables()
+            self.assertRaises(ValueError, csvio.import_csv, p, "rooms", file_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
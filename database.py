@@ -0,0 +1,80 @@
+import contextlib
+import os
+import threading
+from sqlite3 import Connection
+from typing import Iterator, Optional
+from urllib.parse import quote
+
+# The demo database next to the sources, independent of the working directory
+DEFAULT_DB_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "db.sqlite")
+
+# Callable used to open every database connection in the application.
+# Replaced while profiling, see profiling.QueryProfiler.
+connection_factory = Connection
+
+
+def connect(db_file: Optional[str] = None) -> Connection:
+    return connection_factory(db_file or DEFAULT_DB_FILE)
+
+
+def connect_read_only(db_file: Optional[str] = None) -> Connection:
+    """
+    Opens a connection that cannot write, e.g. for analytics running in worker processes.
+    """
+    path = os.path.abspath(db_file or DEFAULT_DB_FILE)
+    return connection_factory(f"file:{quote(path)}?mode=ro", uri=True)
+
+
+# Connections of the transactions opened with transaction_scope() in the current thread, by database path
+_scopes = threading.local()
+
+
+def _key(db_file: Optional[str]) -> str:
+    return os.path.abspath(db_file or DEFAULT_DB_FILE)
+
+
+def active_connection(db_file: Optional[str] = None) -> Optional[Connection]:
+    """
+    Returns the connection of the transaction open on the database in this thread, if any.
+    """
+    connections = getattr(_scopes, "connections", None)
+    return connections.get(_key(db_file)) if connections else None
+
+
+@contextlib.contextmanager
+def transaction_scope(db_file: Optional[str], connection: Connection) -> Iterator[Connection]:
+    """
+    Makes session() use the given connection for the database in this thread until the scope is left.
+    Committing or rolling back is up to the owner of the connection.
+    """
+    if not hasattr(_scopes, "connections"):
+        _scopes.connections = {}
+    key = _key(db_file)
+    outer = _scopes.connections.get(key)
+    _scopes.connections[key] = connection
+    try:
+        yield connection
+    finally:
+        if outer is None:
+            del _scopes.connections[key]
+        else:
+            _scopes.connections[key] = outer
+
+
+@contextlib.contextmanager
+def session(db_file: Optional[str] = None) -> Iterator[Connection]:
+    """
+    Connection for a single read or write: the one of the open transaction on the database if there is one,
+    so reads see the uncommitted writes and writes are committed with the transaction, otherwise a new
+    connection committed and closed when the block is left.
+    """
+    connection = active_connection(db_file)
+    if connection is not None:
+        yield connection
+        return
+    connection = connect(db_file)
+    try:
+        yield connection
+        connection.commit()
+    finally:
+        connection.close()
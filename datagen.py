@@ -0,0 +1,196 @@
+import argparse
+import math
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Iterator, List, Tuple
+
+from persistence import SmartHousePersistence
+from smarthouse import SmartHouse, Room
+from devices import *
+
+
+# Room templates: name, (min area, max area) and the device classes typically installed in such a room
+ROOM_TEMPLATES = [
+    ("Living Room", (20, 45), [LightBulb, LightBulb, TemperatureSensor, HeatPump, SmartOutlet, AirQualitySensor]),
+    ("Kitchen", (10, 25), [LightBulb, SmartOutlet, SmartOutlet, TemperatureSensor, SmartMeter]),
+    ("Bedroom", (8, 20), [LightBulb, LightBulb, TemperatureSensor, HeatOven]),
+    ("Bathroom", (4, 10), [LightBulb, HumiditySensor, Dehumidifier, FloorHeatingPanel]),
+    ("Office", (8, 15), [LightBulb, HeatOven, SmartOutlet, TemperatureSensor]),
+    ("Entrance", (6, 15), [LightBulb, TemperatureSensor, SmartMeter]),
+    ("Garage", (15, 40), [LightBulb, SmartCharger, SmartMeter]),
+    ("Hallway", (5, 12), [LightBulb]),
+]
+
+PRODUCERS = ["Fritsch Group", "Bernhard-Roberts", "Larkin-Nitzsche", "Moen Inc", "Osinski Inc", "Wiza Ltd"]
+
+
+def generate_house(no_of_floors: int, no_of_rooms: int, no_of_devices: int, seed: int = 0) -> SmartHouse:
+    """
+    Builds a house with the given number of floors, rooms and devices. Rooms are spread evenly across the
+    floors and devices are installed following the room templates until the wanted number of devices is reached.
+    The same seed always produces the same house. Raises ValueError if any of the numbers is less than 1.
+    """
+    if min(no_of_floors, no_of_rooms, no_of_devices) < 1:
+        raise ValueError("A house needs at least one floor, one room and one device!")
+    rng = random.Random(seed)
+    house = SmartHouse()
+    for _ in range(no_of_floors):
+        house.create_floor()
+    rooms = []
+    counters = {}
+    for i in range(no_of_rooms):
+        name, (min_area, max_area), _ = ROOM_TEMPLATES[i % len(ROOM_TEMPLATES)]
+        counters[name] = counters.get(name, 0) + 1
+        room = house.create_room(i * no_of_floors // no_of_rooms + 1, round(rng.uniform(min_area, max_area), 2),
+                                 f"{name} {counters[name]}")
+        rooms.append((room, ROOM_TEMPLATES[i % len(ROOM_TEMPLATES)][2]))
+    for i in range(no_of_devices):
+        room, template = rooms[i % no_of_rooms]
+        cls = template[(i // no_of_rooms) % len(template)]
+        serial_no = f"{rng.getrandbits(32):08x}-{rng.getrandbits(16):04x}-{rng.getrandbits(16):04x}"
+        device = cls(serial_no, rng.choice(PRODUCERS), f"Model {rng.randint(1, 9)}", device_id=i + 1)
+        house.register_device(device, room)
+    return house
+
+
+def write_house(persistence: SmartHousePersistence, house: SmartHouse):
+    """
+    Writes rooms, devices and an initial device state for the given house into the database, which must not
+    have any rooms or devices yet (the generated devices have fixed ids).
+    """
+    persistence.create_tables()
+    if persistence.cursor.execute("SELECT EXISTS (SELECT 1 FROM rooms) OR EXISTS (SELECT 1 FROM devices)").fetchall()[0][0]:
+        raise ValueError(f"{persistence.db_file} already holds a house!")
+    persistence.save_topology(house)
+
+
+class _Series:
+    """
+    Produces the next value of a single sensor each time step.
+    """
+
+    def __init__(self, sensor: Device, rng: random.Random, interval: float):
+        self.sensor = sensor
+        self.rng = rng
+        self.interval = interval  # minutes between two readings
+        if isinstance(sensor, TemperatureSensor):
+            self.base = rng.uniform(16, 23)
+            self.amplitude = rng.uniform(1, 4)
+            self.next = self._next_temperature
+        elif isinstance(sensor, HumiditySensor):
+            self.base = rng.uniform(35, 55)
+            self.spike = 0.0
+            self.decay = 0.9 ** interval
+            self.next = self._next_humidity
+        elif isinstance(sensor, SmartMeter):
+            self.base = rng.uniform(0.3, 1.5)  # kW base load
+            self.value = rng.uniform(0, 100)
+            self.next = self._next_meter
+        else:
+            self.base = rng.uniform(0.02, 0.1)
+            self.next = self._next_air_quality
+
+    def _next_temperature(self, day_phase: float) -> float:
+        # coldest early in the morning, warmest in the afternoon
+        return self.base + self.amplitude * math.sin(2 * math.pi * (day_phase - 0.375)) + self.rng.gauss(0, 0.3)
+
+    def _next_humidity(self, day_phase: float) -> float:
+        if self.rng.random() < self.interval / 480:  # roughly three showers a day
+            self.spike = self.rng.uniform(20, 40)
+        self.spike *= self.decay
+        return min(100.0, self.base + self.spike + self.rng.gauss(0, 1))
+
+    def _next_meter(self, day_phase: float) -> float:
+        # load peaks in the morning and in the evening
+        load = self.base * (1 + math.exp(-((day_phase - 0.3) * 20) ** 2) + 2 * math.exp(-((day_phase - 0.75) * 15) ** 2))
+        self.value += load * self.interval / 60 * self.rng.uniform(0.8, 1.2)
+        return self.value
+
+    def _next_air_quality(self, day_phase: float) -> float:
+        return max(0.0, self.base + self.rng.gauss(0, 0.01))
+
+
+def generate_measurements(house: SmartHouse, no_of_rows: int, start: datetime = datetime(2023, 1, 1),
+                          interval: float = 1.0, seed: int = 0) -> Iterator[Tuple[str, int, float, str]]:
+    """
+    Yields (time_stamp, device, value, serial_no) rows for all sensors of the house, one reading per sensor
+    every `interval` minutes in time order, until `no_of_rows` rows have been produced.
+    """
+    rng = random.Random(seed)
+    series = [_Series(d, rng, interval) for d in house.get_all_devices() if d.is_sensor()]
+    if not series:
+        return
+    step = timedelta(minutes=interval)
+    produced = 0
+    ts = start
+    while produced < no_of_rows:
+        time_stamp = ts.isoformat()
+        day_phase = (ts.hour * 60 + ts.minute) / 1440
+        for s in series:
+            yield time_stamp, s.sensor.device_id, round(s.next(day_phase), 4), s.sensor.serial_no
+            produced += 1
+            if produced == no_of_rows:
+                return
+        ts += step
+
+
+def write_measurements(persistence: SmartHousePersistence, rows: Iterator[Tuple[str, int, float, str]],
+                       chunk_size: int = 100_000) -> int:
+    """
+    Bulk inserts the given rows in chunks. Journaling and syncing are switched off while loading,
+    so this must only be used on freshly generated databases.
+    """
+    cursor = persistence.cursor
+    persistence.save()
+    cursor.execute("PRAGMA journal_mode = OFF")
+    cursor.execute("PRAGMA synchronous = OFF")
+    count = 0
+    chunk: List[Tuple[str, int, float, str]] = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            cursor.executemany("INSERT INTO measurements VALUES (?, ?, ?, ?)", chunk)
+            count += len(chunk)
+            chunk.clear()
+    if chunk:
+        cursor.executemany("INSERT INTO measurements VALUES (?, ?, ?, ?)", chunk)
+        count += len(chunk)
+    persistence.save()
+    cursor.execute("PRAGMA synchronous = FULL")
+    cursor.execute("PRAGMA journal_mode = DELETE")
+    return count
+
+
+def generate_database(db_file: str, no_of_floors: int, no_of_rooms: int, no_of_devices: int, no_of_rows: int,
+                      start: datetime = datetime(2023, 1, 1), interval: float = 1.0,
+                      seed: int = 0) -> SmartHouse:
+    """
+    Creates a new database file with a generated house and its measurements. Raises FileExistsError if the
+    file already exists and is not empty, as loading switches off journaling.
+    """
+    if os.path.exists(db_file) and os.path.getsize(db_file) > 0:
+        raise FileExistsError(f"{db_file} already exists, the generator only writes new databases!")
+    persistence = SmartHousePersistence(db_file)
+    house = generate_house(no_of_floors, no_of_rooms, no_of_devices, seed)
+    write_house(persistence, house)
+    write_measurements(persistence, generate_measurements(house, no_of_rows, start, interval, seed))
+    return house
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generates a synthetic smart house database")
+    parser.add_argument("db_file")
+    parser.add_argument("--floors", type=int, default=2)
+    parser.add_argument("--rooms", type=int, default=12)
+    parser.add_argument("--devices", type=int, default=31)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--start", type=datetime.fromisoformat, default=datetime(2023, 1, 1))
+    parser.add_argument("--interval", type=float, default=1.0, help="minutes between two readings of a sensor")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    started = time.perf_counter()
+    generate_database(args.db_file, args.floors, args.rooms, args.devices, args.rows, args.start, args.interval,
+                      args.seed)
+    print(f"Generated {args.rows} measurements in {time.perf_counter() - started:.1f} s")
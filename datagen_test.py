@@ -0,0 +1,49 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+import datagen
+from persistence import SmartHousePersistence
+
+
+class DatagenTest(unittest.TestCase):
+
+    def test_generate_house(self):
+        house = datagen.generate_house(2, 5, 17, seed=3)
+        self.assertEqual(2, len(house.floors))
+        self.assertEqual(5, len(house.get_all_rooms()))
+        self.assertEqual(17, house.get_no_of_devices())
+        same = datagen.generate_house(2, 5, 17, seed=3)
+        self.assertEqual([d.serial_no for d in house.get_all_devices()], [d.serial_no for d in same.get_all_devices()])
+        self.assertRaises(ValueError, datagen.generate_house, 0, 5, 17)
+        self.assertRaises(ValueError, datagen.generate_house, 2, 0, 17)
+        self.assertRaises(ValueError, datagen.generate_house, 2, 5, 0)
+
+    def test_generate_database(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_file = os.path.join(tmp, "db.sqlite")
+            house = datagen.generate_database(db_file, 1, 4, 20, 5000, start=datetime(2023, 1, 1), interval=5.0)
+            p = SmartHousePersistence(db_file)
+            cursor = p.cursor
+            self.assertEqual(5000, cursor.execute("SELECT COUNT(*) FROM measurements").fetchall()[0][0])
+            sensors = [d for d in house.get_all_devices() if d.is_sensor()]
+            rows = cursor.execute("SELECT time_stamp, device, value, serial_no FROM measurements ORDER BY rowid").fetchall()
+            self.assertEqual("2023-01-01T00:00:00", rows[0][0])
+            self.assertEqual(sorted(r[0] for r in rows), [r[0] for r in rows])
+            self.assertEqual({d.serial_no for d in sensors}, {r[3] for r in rows})
+            for serial_no in {d.serial_no for d in sensors if d.get_type_name() == "Strømmåler"}:
+                counters = [r[2] for r in rows if r[3] == serial_no]
+                self.assertEqual(sorted(counters), counters)
+            # every reading belongs to the stored device with its serial number
+            self.assertEqual(0, cursor.execute("SELECT COUNT(*) FROM measurements m LEFT JOIN devices d "
+                                               "ON d.id = m.device AND d.serial_no = m.serial_no "
+                                               "WHERE d.id IS NULL").fetchall()[0][0])
+            # an existing database is never overwritten
+            self.assertRaises(FileExistsError, datagen.generate_database, db_file, 1, 4, 20, 10)
+            self.assertRaises(ValueError, datagen.write_house, p,
+                              datagen.generate_house(1, 1, 1))
+            self.assertEqual(5000, cursor.execute("SELECT COUNT(*) FROM measurements").fetchall()[0][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
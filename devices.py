@@ -1,6 +1,8 @@
 import abc
-from typing import Optional
-from sqlite3 import Connection
+from typing import Callable, Optional
+import database
+import metrics
+from events import StateChangeEvent
 
 # Visitor Design Patter
 class DeviceVisitor:
@@ -40,7 +42,7 @@ class DeviceVisitor:
 
 
 class Device:
-    __slots__ = ['serial_no', 'producer', 'product_type', 'nickname']
+    __slots__ = ['serial_no', 'producer', 'product_type', 'nickname', 'observers', 'db_file']
 
     def __init__(self, serial_no: str, producer: str = None, product_type: str = None, nickname: str = None, device_id: int = None):
         self.serial_no = serial_no
@@ -48,6 +50,24 @@ class Device:
         self.product_type = product_type
         self.nickname = nickname
         self.device_id = device_id
+        self.observers = []
+        self.db_file = None  # database holding the device state, None for database.DEFAULT_DB_FILE
+
+    # Observer Pattern: callbacks are notified about every state change of the device
+    def subscribe(self, callback: Callable[[StateChangeEvent], None]):
+        self.observers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback: Callable[[StateChangeEvent], None]):
+        if callback in self.observers:
+            self.observers.remove(callback)
+
+    def notify(self, value, source: str = StateChangeEvent.ACTUATOR, time_stamp: str = None):
+        if not self.observers:
+            return
+        event = StateChangeEvent(self, value, source, time_stamp)
+        for observer in list(self.observers):
+            observer(event)
 
     @abc.abstractmethod
     def get_status_message(self):
@@ -119,15 +139,11 @@ class TemperatureSensor(Sensor):
         super().__init__(serial_no, producer, product_type, nickname, device_id)
         self.temperature = temperature
 
+    @metrics.timed(metrics.SENSOR_READS, sensor="temperature")
     def get_current_value(self) -> Optional[float]:
-        conn = Connection('db.sqlite')
-        cursor = conn.cursor()
-
-        cursor.execute(f"SELECT value FROM device_state WHERE serial_no='{self.serial_no}'")
-
-        self.temperature = cursor.fetchall()
-        cursor.close()
-        return self.temperature[0][2]
+        with database.session(self.db_file) as conn:
+            self.temperature = conn.execute(f"SELECT value FROM device_state WHERE serial_no='{self.serial_no}'").fetchall()
+        return self.temperature[0][0]
 
     def get_type_name(self):
         return "Temperatursensor"
@@ -152,15 +168,11 @@ class HumiditySensor(Sensor):
         super().__init__(serial_no, producer, product_type, nickname, device_id)
         self.humidity = humidity
 
+    @metrics.timed(metrics.SENSOR_READS, sensor="humidity")
     def get_current_value(self) -> Optional[float]:
-        conn = Connection('db.sqlite')
-        cursor = conn.cursor()
-
-        cursor.execute(f"SELECT value FROM device_state WHERE serial_no='{self.serial_no}'")
-
-        self.humidity = cursor.fetchall()
-        cursor.close()
-        return self.humidity[0][2]
+        with database.session(self.db_file) as conn:
+            self.humidity = conn.execute(f"SELECT value FROM device_state WHERE serial_no='{self.serial_no}'").fetchall()
+        return self.humidity[0][0]
 
     def get_type_name(self):
         return "Fuktighetssensor"
@@ -185,15 +197,11 @@ class SmartMeter(Sensor):
         super().__init__(serial_no, producer, product_type, nickname, device_id)
         self.energy_consumption = energy_consumption
 
+    @metrics.timed(metrics.SENSOR_READS, sensor="energy")
     def get_current_value(self) -> Optional[float]:
-        conn = Connection('db.sqlite')
-        cursor = conn.cursor()
-
-        cursor.execute(f"SELECT value FROM device_state WHERE serial_no='{self.serial_no}'")
-
-        self.energy_consumption = cursor.fetchall()
-        cursor.close()
-        return self.energy_consumption[0][2]
+        with database.session(self.db_file) as conn:
+            self.energy_consumption = conn.execute(f"SELECT value FROM device_state WHERE serial_no='{self.serial_no}'").fetchall()
+        return self.energy_consumption[0][0]
 
     def get_type_name(self):
         return "Strømmåler"
@@ -218,15 +226,11 @@ class AirQualitySensor(Sensor):
         super().__init__(serial_no, producer, product_type, nickname, device_id)
         self.air_quality = air_quality
 
+    @metrics.timed(metrics.SENSOR_READS, sensor="air_quality")
     def get_current_value(self) -> float:
-        conn = Connection('db.sqlite')
-        cursor = conn.cursor()
-
-        cursor.execute(f"SELECT value FROM device_state WHERE serial_no='{self.serial_no}'")
-
-        self.air_quality = cursor.fetchall()
-        cursor.close()
-        return self.air_quality[0][2]
+        with database.session(self.db_file) as conn:
+            self.air_quality = conn.execute(f"SELECT value FROM device_state WHERE serial_no='{self.serial_no}'").fetchall()
+        return self.air_quality[0][0]
 
     def get_type_name(self):
         return "Luftkvalitetssensor"
@@ -259,34 +263,23 @@ class SimpleOnOffActuator(Actuator):
         super().__init__(serial_no, producer, product_type, nickname, device_id)
         self.is_active = False
 
+    @metrics.timed(metrics.DEVICE_COMMANDS, command="turn_on")
     def turn_on(self):
-        conn = Connection('db.sqlite')
-        cursor = conn.cursor()
-
-        cursor.execute(f"UPDATE device_state SET value = 1 WHERE serial_no = '{self.serial_no}'")
-        conn.commit()
-
-        cursor.close()
+        with database.session(self.db_file) as conn:
+            conn.execute("UPDATE device_state SET value = ? WHERE serial_no = ?", (1, self.serial_no))
         self.is_active = True
+        self.notify(1)
 
+    @metrics.timed(metrics.DEVICE_COMMANDS, command="turn_off")
     def turn_off(self):
-        conn = Connection('db.sqlite')
-        cursor = conn.cursor()
-
-        cursor.execute(f"UPDATE device_state SET value = 0 WHERE serial_no = '{self.serial_no}'")
-        conn.commit()
-
-        cursor.close()
+        with database.session(self.db_file) as conn:
+            conn.execute("UPDATE device_state SET value = ? WHERE serial_no = ?", (0, self.serial_no))
         self.is_active = False
+        self.notify(0)
 
     def get_status_message(self):
-        conn = Connection('db.sqlite')
-        cursor = conn.cursor()
-
-        cursor.execute(f"SELECT value FROM device_state WHERE serial_no='{self.serial_no}'")
-
-        self.is_active = cursor.fetchall()
-        cursor.close()
+        with database.session(self.db_file) as conn:
+            self.is_active = conn.execute(f"SELECT value FROM device_state WHERE serial_no='{self.serial_no}'").fetchall()
 
         if self.is_active[0][0] == 1:
             return "ON"
@@ -304,13 +297,8 @@ class HeatControlActuator(Actuator):
         self.temperature = None
 
     def get_status_message(self):
-        conn = Connection('db.sqlite')
-        cursor = conn.cursor()
-
-        cursor.execute(f"SELECT value FROM device_state WHERE serial_no = '{self.serial_no}'")
-
-        self.temperature = cursor.fetchall()
-        cursor.close()
+        with database.session(self.db_file) as conn:
+            self.temperature = conn.execute(f"SELECT value FROM device_state WHERE serial_no = '{self.serial_no}'").fetchall()
 
         if self.temperature is not 0:
             return str(self.temperature[0][0]) + " °C"
@@ -319,25 +307,19 @@ class HeatControlActuator(Actuator):
         else:
             return "OFF"
 
+    @metrics.timed(metrics.DEVICE_COMMANDS, command="set_temperature")
     def set_temperature(self, temperature: float):
-        conn = Connection('db.sqlite')
-        cursor = conn.cursor()
-
-        cursor.execute(f"UPDATE device_state SET value = {str(temperature)} WHERE serial_no = '{self.serial_no}'")
-        conn.commit()
-
-        cursor.close()
+        with database.session(self.db_file) as conn:
+            conn.execute("UPDATE device_state SET value = ? WHERE serial_no = ?", (temperature, self.serial_no))
         self.temperature = temperature
+        self.notify(temperature)
 
+    @metrics.timed(metrics.DEVICE_COMMANDS, command="turn_off")
     def turn_off(self):
-        conn = Connection('db.sqlite')
-        cursor = conn.cursor()
-
-        cursor.execute(f"UPDATE device_state SET value = 0 WHERE serial_no = '{self.serial_no}'")
-        conn.commit()
-
-        cursor.close()
+        with database.session(self.db_file) as conn:
+            conn.execute("UPDATE device_state SET value = ? WHERE serial_no = ?", (0, self.serial_no))
         self.temperature = 0
+        self.notify(0)
 
 
 class HeatOven(HeatControlActuator):
@@ -455,4 +437,21 @@ class FloorHeatingPanel(HeatControlActuator):
         return "Gulvvarmepanel"
 
     def accept(self, visitor: DeviceVisitor):
-        visitor.handle_floor_heating(self)
\ No newline at end of file
+        visitor.handle_floor_heating(self)
+
+
+# Maps the type names stored in the devices table to the device classes
+DEVICE_TYPES = {
+    "Smart Lys": LightBulb,
+    "Fuktighetssensor": HumiditySensor,
+    "Billader": SmartCharger,
+    "Paneloven": HeatOven,
+    "Temperatursensor": TemperatureSensor,
+    "Strømmåler": SmartMeter,
+    "Smart Stikkkontakt": SmartOutlet,
+    "Smart Stikkontakt": SmartOutlet,  # spelling used in db.sqlite
+    "Varmepumpe": HeatPump,
+    "Luftkvalitetssensor": AirQualitySensor,
+    "Luftavfukter": Dehumidifier,
+    "Gulvvarmepanel": FloorHeatingPanel,
+}
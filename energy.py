@@ -0,0 +1,92 @@
+import bisect
+import math
+from array import array
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from archive import to_epoch
+
+# SmartMeter readings are cumulative counters in kWh. The consumption within an hour is the counter at the end
+# of the hour minus the counter at the end of the previous hour, so only the last reading of each hour matters
+# and hourly rollups (whose maximum is the last reading of a non-decreasing counter) are as good as raw readings.
+
+HOUR = timedelta(hours=1)
+
+
+def hour_grid(from_ts: datetime, to_ts: datetime) -> Tuple[datetime, int]:
+    """
+    Returns the start of the first hour and the number of whole or partial hours covering [from_ts, to_ts].
+    """
+    start = from_ts.replace(minute=0, second=0, microsecond=0)
+    return start, int((to_ts - start) / HOUR) + 1
+
+
+def consumption_from_counters(baseline: float, counters: Sequence[float]) -> array:
+    """
+    Turns the counter values at the end of consecutive hours (NaN where an hour has no reading) into the
+    consumption per hour. The first hour is measured against the baseline, the counter before the
+    window (NaN if unknown, then the first reading is the baseline).
+    """
+    result = array("d", bytes(8 * len(counters)))
+    previous = baseline
+    for i, counter in enumerate(counters):
+        if counter != counter:  # NaN: no reading in this hour
+            continue
+        if previous == previous:
+            result[i] = max(0.0, counter - previous)
+        previous = counter
+    return result
+
+
+def counters_from_series(timestamps: Sequence[int], values: Sequence[float], start: datetime,
+                         hours: int) -> Tuple[float, array]:
+    """
+    As-of lookup of the counter before `start` and at the end of each of the following hours in a
+    time-sorted series, one binary search per hour instead of a pass over the readings.
+    """
+    def as_of(epoch: int) -> float:
+        i = bisect.bisect_right(timestamps, epoch) - 1
+        return values[i] if i >= 0 else math.nan
+
+    first = to_epoch(start)
+    return as_of(first - 1), array("d", (as_of(first + 3600 * (h + 1) - 1) for h in range(hours)))
+
+
+def counters_from_hourly_maxima(maxima: Dict[str, float], start: datetime, hours: int) -> array:
+    """
+    Counter at the end of each hour from the maximum reading per hour keyed 'YYYY-MM-DDTHH', NaN for hours
+    without readings.
+    """
+    return array("d", (maxima.get((start + HOUR * h).strftime("%Y-%m-%dT%H"), math.nan) for h in range(hours)))
+
+
+def peak_hours(hourly: Sequence[float], start: datetime, top: int = 3) -> List[Tuple[int, float]]:
+    """
+    Sums the consumption per hour of the day and returns the `top` hours [0-23] with the highest total,
+    highest first.
+    """
+    totals = [0.0] * 24
+    for h, value in enumerate(hourly):
+        totals[(start.hour + h) % 24] += value
+    return sorted(((hour, total) for hour, total in enumerate(totals) if total > 0), key=lambda x: -x[1])[:top]
+
+
+def daily_totals(hourly: Sequence[float], start: datetime) -> List[Tuple[date, float, Optional[float]]]:
+    """
+    Returns (day, consumption, change from the previous day) per calendar day, the change is None for the first day.
+    """
+    totals: Dict[date, float] = {}
+    for h, value in enumerate(hourly):
+        day = (start + HOUR * h).date()
+        totals[day] = totals.get(day, 0.0) + value
+    result = []
+    previous = None
+    for day, total in totals.items():
+        result.append((day, total, None if previous is None else total - previous))
+        previous = total
+    return result
+
+
+def add_into(total: array, hourly: Sequence[float]):
+    for i, value in enumerate(hourly):
+        total[i] += value
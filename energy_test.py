@@ -0,0 +1,104 @@
+import os
+import tempfile
+import unittest
+from datetime import date, datetime, timedelta
+import datagen
+from devices import SmartMeter
+from persistence import SmartHousePersistence, SmartHouseAnalytics
+from retention import Compactor, RetentionPolicy
+from timeseries import TimeSeriesStore
+
+
+class EnergyTest(unittest.TestCase):
+
+    def test_energy_analytics(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_file = os.path.join(tmp, "db.sqlite")
+            # 5 minute readings over three days
+            house = datagen.generate_database(db_file, 1, 3, 32, 9 * 3 * 288, interval=5.0)
+            meters = [d for d in house.get_all_devices() if isinstance(d, SmartMeter)]
+            self.assertTrue(meters)
+            p = SmartHousePersistence(db_file)
+            analytics = SmartHouseAnalytics(p)
+            from_ts, to_ts = datetime(2023, 1, 1, 6), datetime(2023, 1, 2, 17, 59, 59)
+
+            def counter_at(meter, ts):
+                return p.cursor.execute("SELECT value FROM measurements WHERE serial_no = ? AND time_stamp < ? "
+                                        "ORDER BY time_stamp DESC LIMIT 1", (meter.serial_no, ts.isoformat())).fetchall()[0][0]
+
+            meter = meters[0]
+            expected = counter_at(meter, datetime(2023, 1, 2, 18)) - counter_at(meter, from_ts)
+            self.assertAlmostEqual(expected, analytics.get_energy_consumption(meter, from_ts, to_ts))
+            hourly = analytics.get_hourly_energy_consumption(meter, from_ts, to_ts)
+            self.assertEqual(36, len(hourly))
+            self.assertEqual(datetime(2023, 1, 1, 6), hourly[0][0])
+            self.assertAlmostEqual(counter_at(meter, datetime(2023, 1, 1, 7)) - counter_at(meter, from_ts), hourly[0][1])
+
+            per_device = analytics.get_energy_consumption_per_device(from_ts, to_ts)
+            self.assertEqual({m.serial_no for m in meters}, set(per_device))
+            per_room = analytics.get_energy_consumption_per_room(from_ts, to_ts)
+            self.assertAlmostEqual(sum(per_device.values()), sum(per_room.values()))
+            daily = analytics.get_daily_energy_consumption(from_ts, to_ts)
+            self.assertEqual([date(2023, 1, 1), date(2023, 1, 2)], [d[0] for d in daily])
+            self.assertIsNone(daily[0][2])
+            self.assertAlmostEqual(daily[1][1] - daily[0][1], daily[1][2])
+            self.assertAlmostEqual(sum(per_device.values()), sum(d[1] for d in daily))
+            peaks = analytics.get_energy_peak_hours(from_ts, to_ts, top=2)
+            # datagen puts the evening peak at 18:00, just outside the timespan, and the morning peak at 07:00
+            self.assertEqual(2, len(peaks))
+            self.assertIn(7, [hour for hour, _ in peaks])
+
+            # the memory-mapped store gives the same result
+            store = TimeSeriesStore(os.path.join(tmp, "store"))
+            store.build(p)
+            stored = SmartHouseAnalytics(p, store)
+            self.assertEqual(analytics.get_energy_consumption_per_device(from_ts, to_ts),
+                             stored.get_energy_consumption_per_device(from_ts, to_ts))
+            store.close()
+
+            # cached per window until the meter gets new readings
+            window = analytics._energy_cache[meter.serial_no][(from_ts, to_ts)]
+            self.assertIs(window, analytics._hourly_energy(meter.serial_no, from_ts, to_ts)[1])
+            p.add_measurements([("2023-01-02T17:30:30", meter.device_id, counter_at(meter, datetime(2023, 1, 2, 18)) + 5,
+                                 meter.serial_no)])
+            self.assertNotIn(meter.serial_no, analytics._energy_cache)
+            self.assertAlmostEqual(expected + 5, analytics.get_energy_consumption(meter, from_ts, to_ts))
+            # only the most recently used windows are kept
+            analytics.energy_cache_windows = 2
+            hours = [(from_ts + timedelta(hours=i), to_ts) for i in range(3)]
+            for window in [hours[0], hours[1], hours[0], hours[2]]:
+                analytics._hourly_energy(meter.serial_no, *window)
+            self.assertEqual([hours[0], hours[2]], list(analytics._energy_cache[meter.serial_no]))
+            p.connection.rollback()
+
+            # rollups of compacted readings answer the same
+            before = SmartHouseAnalytics(p).get_energy_consumption_per_device(from_ts, to_ts)
+            Compactor(p.connection, {"Strømmåler": RetentionPolicy(raw=timedelta(days=1), hourly=None)},
+                      default=None).compact(datetime(2023, 1, 3, 12))
+            self.assertEqual(0, p.cursor.execute(
+                "SELECT COUNT(*) FROM measurements WHERE serial_no = ? AND time_stamp < '2023-01-02T12'",
+                (meter.serial_no,)).fetchall()[0][0])
+            after = SmartHouseAnalytics(p).get_energy_consumption_per_device(from_ts, to_ts)
+            self.assertEqual(before.keys(), after.keys())
+            for serial_no in before:
+                self.assertAlmostEqual(before[serial_no], after[serial_no])
+
+            # and so do the readings moved to the archive
+            p.save()
+            hourly = SmartHouseAnalytics(p).get_hourly_energy_consumption(meter, from_ts, to_ts)
+            archived = SmartHousePersistence(db_file, os.path.join(tmp, "archive"))
+            self.assertTrue(archived.archive_measurements(datetime(2023, 1, 2, 15)) > 0)
+            archived_analytics = SmartHouseAnalytics(archived)
+            after = archived_analytics.get_energy_consumption_per_device(from_ts, to_ts)
+            for serial_no in before:
+                self.assertAlmostEqual(before[serial_no], after[serial_no])
+            for (hour, expected), (archived_hour, actual) in zip(
+                    hourly, archived_analytics.get_hourly_energy_consumption(meter, from_ts, to_ts)):
+                self.assertEqual(hour, archived_hour)
+                self.assertAlmostEqual(expected, actual)
+            self.assertAlmostEqual(sum(v for _, v in hourly[-6:]), archived_analytics.get_energy_consumption(
+                meter, datetime(2023, 1, 2, 12), to_ts))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import asyncio
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+
+class StateChangeEvent:
+    """
+    A device changed its state, either by an actuator command or by a new sensor reading.
+    """
+    ACTUATOR = "actuator"
+    MEASUREMENT = "measurement"
+
+    __slots__ = ['device', 'value', 'source', 'time_stamp', 'room']
+
+    def __init__(self, device, value, source: str, time_stamp: str = None, room=None):
+        self.device = device
+        self.value = value
+        self.source = source
+        self.time_stamp = time_stamp or datetime.now().isoformat(timespec="seconds")
+        self.room = room  # filled in by the house that dispatches the event
+
+    @property
+    def serial_no(self) -> str:
+        return self.device.serial_no
+
+    def __repr__(self):
+        return f"StateChangeEvent({self.serial_no} {self.source} {self.value} at {self.time_stamp} in {self.room})"
+
+
+class Subscription:
+
+    def __init__(self, callback: Callable[[StateChangeEvent], None], room=None, device_type: str = None,
+                 serial_no: str = None):
+        self.callback = callback
+        self.room = room  # a Room or a room name
+        self.device_type = device_type  # a type name like "Smart Lys" or a device class
+        self.serial_no = serial_no
+
+    def matches(self, event: StateChangeEvent) -> bool:
+        if self.serial_no is not None and self.serial_no != event.serial_no:
+            return False
+        if self.device_type is not None:
+            if isinstance(self.device_type, type):
+                if not isinstance(event.device, self.device_type):
+                    return False
+            elif self.device_type != event.device.get_type_name():
+                return False
+        if self.room is not None:
+            if isinstance(self.room, str):
+                if event.room is None or event.room.name != self.room:
+                    return False
+            elif self.room is not event.room:
+                return False
+        return True
+
+
+class EventBus:
+    """
+    Dispatches state change events to the subscriptions whose filters match. Subscriptions for a single
+    serial number are indexed, so they cost nothing for events of other devices.
+    """
+
+    def __init__(self):
+        self._by_serial_no: Dict[str, List[Subscription]] = {}
+        self._others: List[Subscription] = []
+
+    def __len__(self):
+        return len(self._others) + sum(len(s) for s in self._by_serial_no.values())
+
+    def subscribe(self, callback: Callable[[StateChangeEvent], None], room=None, device_type=None,
+                  serial_no: str = None) -> Subscription:
+        subscription = Subscription(callback, room, device_type, serial_no)
+        if serial_no is not None:
+            self._by_serial_no.setdefault(serial_no, []).append(subscription)
+        else:
+            self._others.append(subscription)
+        return subscription
+
+    def subscribe_queue(self, queue: asyncio.Queue, loop: Optional[asyncio.AbstractEventLoop] = None, room=None,
+                        device_type=None, serial_no: str = None) -> Subscription:
+        """
+        Puts matching events into an asyncio queue. Events may be published from any thread,
+        they are handed over to the queue's event loop (by default the running loop).
+        """
+        loop = loop or asyncio.get_running_loop()
+        return self.subscribe(lambda event: loop.call_soon_threadsafe(queue.put_nowait, event), room, device_type,
+                              serial_no)
+
+    def unsubscribe(self, subscription: Subscription):
+        if subscription.serial_no is not None:
+            subscriptions = self._by_serial_no.get(subscription.serial_no, [])
+            if subscription in subscriptions:
+                subscriptions.remove(subscription)
+            if not subscriptions:
+                self._by_serial_no.pop(subscription.serial_no, None)
+        elif subscription in self._others:
+            self._others.remove(subscription)
+
+    def publish(self, event: StateChangeEvent):
+        for subscription in self._by_serial_no.get(event.serial_no, ()):
+            if subscription.matches(event):
+                subscription.callback(event)
+        for subscription in self._others:
+            if subscription.matches(event):
+                subscription.callback(event)
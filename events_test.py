@@ -0,0 +1,76 @@
+import asyncio
+import unittest
+from devices import HeatOven, LightBulb
+from events import StateChangeEvent
+from main import load_demo_house
+from persistence import SmartHousePersistence
+from testcase import DemoDatabaseTestCase
+
+
+class EventsTest(DemoDatabaseTestCase):
+    def test_actuator_events_are_filtered(self):
+        house = self.build_demo_house()
+        bulb = house.find_device_by_serial_no("f11bb4fc-ba74-49cd")
+        room = house.get_room_with_device(bulb)
+        in_room = []
+        ovens = []
+        bulbs = []
+        house.subscribe(in_room.append, room=room)
+        house.subscribe(ovens.append, device_type=HeatOven)
+        house.subscribe(bulbs.append, device_type="Smart Lys", serial_no=bulb.serial_no)
+        device_events = []
+        bulb.subscribe(device_events.append)
+
+        bulb.turn_on()
+        bulb.turn_off()
+        self.assertEqual([1, 0], [e.value for e in in_room])
+        self.assertIs(room, in_room[0].room)
+        self.assertEqual(StateChangeEvent.ACTUATOR, in_room[0].source)
+        self.assertEqual(2, len(bulbs))
+        self.assertEqual(2, len(device_events))
+        self.assertEqual([], ovens)
+
+        house.set_temperature_in_room(room, 21.0)
+        ovens_in_room = [d for d in room if isinstance(d, HeatOven)]
+        self.assertEqual(len(ovens_in_room), len(ovens))
+        self.assertTrue(all(e.value == 21.0 for e in ovens))
+
+    def test_moved_and_unregistered_devices(self):
+        house = self.build_demo_house()
+        bulb = house.find_device_by_serial_no("f11bb4fc-ba74-49cd")
+        source = house.get_room_with_device(bulb)
+        target = [r for r in house.get_all_rooms() if r is not source][0]
+        received = []
+        subscription = house.subscribe(received.append, room=target.name)
+        house.move_device(bulb, source, target)
+        bulb.turn_off()
+        self.assertEqual(1, len(received))
+        house.unregister_device(bulb, target)
+        bulb.turn_off()
+        self.assertEqual(1, len(received))
+        house.unsubscribe(subscription)
+        self.assertEqual(0, len(house.events))
+
+    def test_ingested_readings_are_published(self):
+        p = SmartHousePersistence(self.db_file)
+        house = load_demo_house(p)
+        house.attach(p)
+        sensor = house.find_device_by_serial_no("e237beec-2675-4cb0")
+
+        async def consume():
+            queue = asyncio.Queue()
+            house.subscribe_queue(queue, device_type="Temperatursensor")
+            p.add_measurements([("2030-01-01T00:00:00", sensor.device_id, 4.5, sensor.serial_no),
+                                ("2030-01-01T00:00:00", 1, 1.0, "not-in-the-house")])
+            return await asyncio.wait_for(queue.get(), 1), queue.qsize()
+
+        event, remaining = asyncio.run(consume())
+        self.assertIs(sensor, event.device)
+        self.assertEqual(4.5, event.value)
+        self.assertEqual(StateChangeEvent.MEASUREMENT, event.source)
+        self.assertEqual("2030-01-01T00:00:00", event.time_stamp)
+        self.assertEqual(0, remaining)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from sqlite3 import Connection
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+from urllib.parse import quote, unquote
+
+import database
+from persistence import SmartHousePersistence
+from smarthouse import SmartHouse
+
+SHARD_SUFFIX = ".sqlite"
+
+T = TypeVar("T")
+
+
+class ShardRouter:
+    """
+    Maps house ids to their own SQLite database (shard) in a directory, <directory>/<house id>.sqlite with the
+    house id percent-encoded, so every id gets a file of its own. Keeps one SmartHousePersistence, and thereby
+    one connection, per house that has been routed to.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = os.path.abspath(directory)
+        self._persistences: Dict[str, SmartHousePersistence] = {}
+
+    def path(self, house_id: str) -> str:
+        house_id = str(house_id)
+        if not house_id:
+            raise ValueError("The house id must not be empty!")
+        return os.path.join(self.directory, quote(house_id, safe="-_") + SHARD_SUFFIX)
+
+    def house_ids(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(unquote(name[:-len(SHARD_SUFFIX)]) for name in os.listdir(self.directory)
+                      if name.endswith(SHARD_SUFFIX))
+
+    def persistence(self, house_id: str) -> SmartHousePersistence:
+        house_id = str(house_id)
+        persistence = self._persistences.get(house_id)
+        if persistence is None:
+            os.makedirs(self.directory, exist_ok=True)
+            persistence = self._persistences[house_id] = SmartHousePersistence(self.path(house_id))
+        return persistence
+
+    def connection(self, house_id: str) -> Connection:
+        return self.persistence(house_id).connection
+
+    def close(self):
+        for persistence in self._persistences.values():
+            persistence.close()
+        self._persistences.clear()
+
+
+def coldest_room_in_shard(db_file: str) -> Optional[Tuple[str, float]]:
+    """
+    Same ranking as SmartHouseAnalytics.get_coldest_room(), but also returns the average so that
+    results of several shards can be compared. Runs in worker processes on a read-only connection.
+    """
+    connection = database.connect_read_only(db_file)
+    try:
+        return connection.execute(
+            "SELECT r.name, AVG(m.value) FROM rooms r INNER JOIN devices d ON r.id = d.room "
+            "INNER JOIN measurements m ON d.serial_no = m.serial_no "
+            "GROUP BY r.name HAVING AVG(m.value) IS NOT NULL ORDER BY AVG(m.value) LIMIT 1").fetchone()
+    finally:
+        connection.close()
+
+
+class Fleet:
+    """
+    Many houses, each stored in its own shard. Cross-house analytics fan out over the shards in a process pool
+    and merge the per-house results.
+    """
+
+    def __init__(self, directory: str):
+        self.router = ShardRouter(directory)
+        self._houses: Dict[str, SmartHouse] = {}
+
+    def __len__(self):
+        return len(self.router.house_ids())
+
+    def add_house(self, house_id: str, house: SmartHouse) -> SmartHousePersistence:
+        """
+        Creates the shard of a new house and writes its topology.
+        """
+        persistence = self.router.persistence(house_id)
+        persistence.create_tables()
+        persistence.save_topology(house)
+        for device in house.get_all_devices():
+            device.db_file = persistence.db_file
+        self._houses[str(house_id)] = house
+        return persistence
+
+    def house(self, house_id: str) -> SmartHouse:
+        house_id = str(house_id)
+        house = self._houses.get(house_id)
+        if house is None:
+            if not os.path.exists(self.router.path(house_id)):
+                raise LookupError(f"House {house_id} does not exist!")
+            from main import load_house
+            house = self._houses[house_id] = load_house(self.router.persistence(house_id))
+        return house
+
+    def map(self, fn: Callable[[str], T], house_ids: Iterable[str] = None,
+            processes: Optional[int] = None) -> Dict[str, T]:
+        """
+        Calls fn (a module level function, so it can be pickled) with the database file of every house,
+        in a pool of `processes` worker processes (default: one per core, 1 runs in this process).
+        Pending writes to the shards should be saved before, workers only see committed data.
+        """
+        house_ids = self.router.house_ids() if house_ids is None else [str(h) for h in house_ids]
+        paths = [self.router.path(house_id) for house_id in house_ids]
+        if processes == 1 or len(paths) <= 1:
+            return dict(zip(house_ids, map(fn, paths)))
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            return dict(zip(house_ids, executor.map(fn, paths, chunksize=max(1, len(paths) // 64))))
+
+    def get_coldest_room(self, processes: Optional[int] = None) -> Optional[Tuple[str, str]]:
+        """
+        Finds the room with the lowest average reading across all houses, returns (house id, room name).
+        """
+        results = [(r[1], house_id, r[0]) for house_id, r in self.map(coldest_room_in_shard, None, processes).items()
+                   if r is not None]
+        if not results:
+            return None
+        _, house_id, room_name = min(results)
+        return house_id, room_name
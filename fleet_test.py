@@ -0,0 +1,67 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+import datagen
+from fleet import Fleet, coldest_room_in_shard
+from persistence import SmartHouseAnalytics
+
+
+class FleetTest(unittest.TestCase):
+
+    def test_fleet(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            fleet = Fleet(tmp)
+            for i, offset in enumerate([0.0, -20.0, 5.0]):
+                house = datagen.generate_house(1, 4, 12, seed=i)
+                p = fleet.add_house(f"house-{i}", house)
+                p.add_measurements((ts, device, value + offset, serial_no) for ts, device, value, serial_no
+                                   in datagen.generate_measurements(house, 2000, seed=i))
+                p.save()
+            self.assertEqual(["house-0", "house-1", "house-2"], fleet.router.house_ids())
+            self.assertEqual(3, len(fleet))
+
+            coldest = fleet.get_coldest_room(processes=2)
+            self.assertEqual("house-1", coldest[0])
+            expected = SmartHouseAnalytics(fleet.router.persistence("house-1")).get_coldest_room()
+            self.assertEqual(expected, coldest[1])
+            self.assertEqual(coldest, fleet.get_coldest_room(processes=1))
+
+            self.assertEqual(coldest[1], coldest_room_in_shard(fleet.router.path("house-1"))[0])
+            house = fleet.house("house-2")
+            self.assertIs(house, fleet.house("house-2"))
+            self.assertEqual(12, house.get_no_of_devices())
+            self.assertRaises(LookupError, fleet.house, "house-3")
+
+    def test_devices_use_their_shard(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            fleet = Fleet(tmp)
+            for i in range(2):
+                fleet.add_house(str(i), datagen.generate_house(1, 2, 6, seed=i)).save()
+            fleet = Fleet(tmp)  # reload the houses from the shards
+            switches = [[d for d in fleet.house(str(i)).get_all_devices() if hasattr(d, "turn_on")]
+                        for i in range(2)]
+            switches[0][0].turn_on()
+            switches[1][0].turn_off()
+            self.assertEqual("ON", switches[0][0].get_status_message())
+            self.assertEqual("OFF", switches[1][0].get_status_message())
+
+    def test_house_ids(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            fleet = Fleet(tmp)
+            ids = ["a b", "a_b", "a/b", "a%20b", "hus-ø"]
+            for i, house_id in enumerate(ids):
+                fleet.add_house(house_id, datagen.generate_house(1, 1, i + 1, seed=i)).save()
+            self.assertEqual(sorted(ids), fleet.router.house_ids())
+            self.assertEqual(len(ids), len(fleet))
+            self.assertEqual(len(ids), len(os.listdir(tmp)))
+            self.assertRaises(ValueError, fleet.router.path, "")
+            persistence = fleet.router.persistence("a b")
+            fleet.router.close()
+            self.assertRaises(sqlite3.ProgrammingError, persistence.connection.execute, "SELECT 1")
+            fleet = Fleet(tmp)
+            self.assertEqual([i + 1 for i in range(len(ids))], [fleet.house(h).get_no_of_devices() for h in ids])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import heapq
+import math
+from array import array
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+def union_timestamps(series: List[Sequence[int]], start: int, end: int) -> array:
+    """
+    Merges the sorted timestamps of several series into one sorted timeline without duplicates,
+    restricted to [start, end].
+    """
+    timeline = array("q")
+    last = None
+    for t in heapq.merge(*series):
+        if start <= t <= end and t != last:
+            timeline.append(t)
+            last = t
+    return timeline
+
+
+def asof(timestamps: Sequence[int], values: Sequence[float], timeline: Sequence[int],
+         tolerance: Optional[int] = None) -> array:
+    """
+    The last non-missing reading at or before each point of the sorted timeline, NaN if there is none or if
+    it is more than `tolerance` seconds old. Walks both sequences once.
+    """
+    result = array("d", [math.nan]) * len(timeline)
+    count = len(timestamps)
+    i = 0
+    last = -1  # index of the last non-missing reading seen so far
+    for p, t in enumerate(timeline):
+        while i < count and timestamps[i] <= t:
+            if values[i] == values[i]:
+                last = i
+            i += 1
+        if last >= 0 and (tolerance is None or t - timestamps[last] <= tolerance):
+            result[p] = values[last]
+    return result
+
+
+def correlation(a: Sequence[float], b: Sequence[float]) -> Optional[float]:
+    """
+    Pearson correlation over the positions where both columns have a value, None if it is undefined.
+    """
+    pairs = [(x, y) for x, y in zip(a, b) if x == x and y == y]
+    n = len(pairs)
+    if n < 2:
+        return None
+    mean_x = sum(x for x, _ in pairs) / n
+    mean_y = sum(y for _, y in pairs) / n
+    sxy = sum((x - mean_x) * (y - mean_y) for x, y in pairs)
+    sxx = sum((x - mean_x) ** 2 for x, _ in pairs)
+    syy = sum((y - mean_y) ** 2 for _, y in pairs)
+    if sxx == 0 or syy == 0:
+        return None
+    return sxy / math.sqrt(sxx * syy)
+
+
+class Frame:
+    """
+    Readings of several sensors aligned on one timeline: `timestamps` holds the epoch seconds at which any of
+    the sensors reported, `columns` the as-of value of every sensor (keyed by serial no) at those times.
+    """
+
+    def __init__(self, timestamps: array, columns: Dict[str, array], types: Dict[str, str] = None):
+        self.timestamps = timestamps
+        self.columns = columns
+        self.types = types or {}  # serial no -> device type name
+
+    @staticmethod
+    def join(series: Dict[str, Tuple[Sequence[int], Sequence[float]]], start: int, end: int,
+             tolerance: Optional[int] = None, types: Dict[str, str] = None) -> 'Frame':
+        """
+        As-of join of sorted (timestamps, values) series keyed by serial no within [start, end].
+        """
+        timeline = union_timestamps([timestamps for timestamps, _ in series.values()], start, end)
+        return Frame(timeline, {serial_no: asof(timestamps, values, timeline, tolerance)
+                                for serial_no, (timestamps, values) in series.items()}, types)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def columns_of_type(self, type_name: str) -> List[str]:
+        return [serial_no for serial_no in self.columns if self.types.get(serial_no) == type_name]
+
+    def rows(self) -> Iterator[tuple]:
+        """
+        Yields (timestamp, value of every column in column order) for each point of the timeline.
+        """
+        return zip(self.timestamps, *self.columns.values())
+
+    def correlation(self, a: str, b: str) -> Optional[float]:
+        return correlation(self.columns[a], self.columns[b])
@@ -0,0 +1,70 @@
+import math
+import os
+import tempfile
+import unittest
+from array import array
+from datetime import datetime, timedelta
+import datagen
+from archive import from_epoch, to_epoch
+from frame import Frame, asof, correlation, union_timestamps
+from persistence import SmartHousePersistence, SmartHouseAnalytics
+from timeseries import TimeSeriesStore
+
+
+class FrameTest(unittest.TestCase):
+
+    def test_asof_join(self):
+        a = (array("q", [10, 20, 30]), array("d", [1.0, math.nan, 3.0]))
+        b = (array("q", [5, 20, 25]), array("d", [7.0, 8.0, 9.0]))
+        self.assertEqual([10, 20, 25, 30], list(union_timestamps([a[0], b[0]], 10, 30)))
+        frame = Frame.join({"a": a, "b": b}, 0, 100)
+        self.assertEqual([5, 10, 20, 25, 30], list(frame.timestamps))
+        self.assertTrue(math.isnan(frame.columns["a"][0]))
+        # the missing reading at 20 keeps the one from 10
+        self.assertEqual([1.0, 1.0, 1.0, 3.0], list(frame.columns["a"][1:]))
+        self.assertEqual([7.0, 7.0, 8.0, 9.0, 9.0], list(frame.columns["b"]))
+        self.assertEqual((25, 1.0, 9.0), list(frame.rows())[3])
+        stale = asof(a[0], a[1], array("q", [15, 29]), tolerance=10)
+        self.assertEqual(1.0, stale[0])
+        self.assertTrue(math.isnan(stale[1]))
+        self.assertAlmostEqual(1.0, correlation([1, 2, 3, math.nan], [2, 4, 6, 1]))
+        self.assertIsNone(correlation([1, 1, 1], [1, 2, 3]))
+
+    def test_room_frame(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_file = os.path.join(tmp, "db.sqlite")
+            house = datagen.generate_database(db_file, 1, 3, 32, 9 * 2 * 288, interval=5.0)
+            room = max(house.get_all_rooms(), key=lambda r: sum(d.is_sensor() for d in r))
+            sensors = [d for d in room if d.is_sensor()]
+            self.assertGreater(len(sensors), 1)
+            p = SmartHousePersistence(db_file)
+            analytics = SmartHouseAnalytics(p)
+            from_ts, to_ts = datetime(2023, 1, 1, 12, 2, 30), datetime(2023, 1, 2, 12)
+            frame = analytics.get_room_frame(room, from_ts, to_ts)
+            self.assertEqual({s.serial_no for s in sensors}, set(frame.columns))
+            self.assertEqual(sorted(frame.timestamps), list(frame.timestamps))
+            self.assertTrue(to_epoch(from_ts) <= frame.timestamps[0] and frame.timestamps[-1] <= to_epoch(to_ts))
+            for sensor in sensors:
+                # readings from before the timespan fill the start of the frame
+                expected = p.cursor.execute(
+                    "SELECT value FROM measurements WHERE serial_no = ? AND time_stamp <= ? ORDER BY time_stamp DESC "
+                    "LIMIT 1", (sensor.serial_no, from_epoch(frame.timestamps[0]).isoformat())
+                ).fetchall()[0][0]
+                self.assertEqual(expected, frame.columns[sensor.serial_no][0])
+
+            temperatures = frame.columns_of_type("Temperatursensor")
+            only = analytics.get_room_frame(room.name, from_ts, to_ts, sensor_types=["Temperatursensor"],
+                                            tolerance=timedelta(minutes=1))
+            self.assertEqual(temperatures, list(only.columns))
+
+            store = TimeSeriesStore(os.path.join(tmp, "store"))
+            store.build(p)
+            stored = SmartHouseAnalytics(p, store).get_room_frame(room, from_ts, to_ts)
+            self.assertEqual(list(frame.timestamps), list(stored.timestamps))
+            for serial_no, column in frame.columns.items():
+                self.assertEqual(list(column), list(stored.columns[serial_no]))
+            store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
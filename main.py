@@ -1,24 +1,43 @@
 from persistence import SmartHousePersistence
 from smarthouse import SmartHouse
 from devices import *
-from pathlib import Path
-from sqlite3 import Connection
+import os
+import metrics
+import csvio
+import database
+import snapshot
 
 
 def load_demo_house_devices_map():
-    file_path = str(Path(__file__).parent.absolute()) + "/demohus-devices.csv"
-    result = {}
-    with open(file_path, "r") as f:
-        f.readline()  # header line: No,Typ,Produsent,Produkt Navn,Serienummer
-        for line in f.readlines():
-            data = line.split(",")
-            result[int(data[0])] = (data[2], data[3], data[4].strip())  # Supplier, Product, Serial No
+    file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "demohus-devices.csv")
+    return csvio.read_devices_map(file_path)  # Supplier, Product, Serial No
+
+
+def load_house(persistence: SmartHousePersistence) -> SmartHouse:
+    """
+    Loads an arbitrary house, i.e. all rooms and devices, from the database.
+    Rooms and devices are created in the order of their ids.
+    """
+    result = SmartHouse()
+    rooms = {}
+    # row: id, floor, area, name
+    for row in persistence.cursor.execute("SELECT id, floor, area, name FROM rooms ORDER BY id").fetchall():
+        while len(result.floors) < row[1]:
+            result.create_floor()
+        rooms[row[0]] = result.create_room(row[1], row[2], row[3])
+        rooms[row[0]].room_id = row[0]
+    # row: id, room, type, producer, product_name, serial_no
+    for row in persistence.cursor.execute("SELECT * FROM devices ORDER BY id").fetchall():
+        device = DEVICE_TYPES[row[2]](row[5], row[3], row[4], device_id=row[0])
+        device.db_file = persistence.db_file
+        result.register_device(device, rooms[row[1]])
+    result.changes.clear()  # the house is exactly what is stored
     return result
 
 
 def load_demo_house(persistence: SmartHousePersistence) -> SmartHouse:
     #Opening db connection
-    conn = Connection('db.sqlite')
+    conn = database.connect(persistence.db_file)
     cursor = conn.cursor()
 
     # Get all rooms
@@ -62,71 +81,75 @@ def load_demo_house(persistence: SmartHousePersistence) -> SmartHouse:
         elif row[0] == 12:
             bed = result.create_room(row[1], row[2], row[3])
 
+    room_ids = {row[3]: row[0] for row in rooms_data}
+    for room in result.get_all_rooms():
+        room.room_id = room_ids[room.name]
+
     #Register devices with attributes
     # row: id, room, type, producer, product_name, serial_no
     for row in devices_data:
         if row[0] == 1:
-            device1 = LightBulb(row[5], row[3], row[4], row[0])
+            device1 = LightBulb(row[5], row[3], row[4], device_id=row[0])
         elif row[0] == 2:
-            device2 = LightBulb(row[5], row[3], row[4], row[0])
+            device2 = LightBulb(row[5], row[3], row[4], device_id=row[0])
         elif row[0] == 3:
-            device3 = HumiditySensor(row[5], row[3], row[4], row[0])
+            device3 = HumiditySensor(row[5], row[3], row[4], device_id=row[0])
         elif row[0] == 4:
-            device4 = LightBulb(row[5], row[3], row[4], row[0])
+            device4 = LightBulb(row[5], row[3], row[4], device_id=row[0])
         elif row[0] == 5:
-            device5 = LightBulb(row[5], row[3], row[4], row[0])
+            device5 = LightBulb(row[5], row[3], row[4], device_id=row[0])
         elif row[0] == 6:
-            device6 = SmartCharger(row[5], row[3], row[4], row[0])
+            device6 = SmartCharger(row[5], row[3], row[4], device_id=row[0])
         elif row[0] == 7:
-            device7 = HeatOven(row[5], row[3], row[4], row[0])
+            device7 = HeatOven(row[5], row[3], row[4], device_id=row[0])
         elif row[0] == 8:
-            device8 = TemperatureSensor(row[5], row[3], row[4], row[0])
+            device8 = TemperatureSensor(row[5], row[3], row[4], device_id=row[0])
         elif row[0] == 9:
-            device9 = LightBulb(row[5], row[3], row[4], row[0])
+            device9 = LightBulb(row[5], row[3], row[4], device_id=row[0])
         elif row[0] == 10:
-            device10 = LightBulb(row[5], row[3], row[4], row[0])
+            device10 = LightBulb(row[5], row[3], row[4], device_id=row[0])
         elif row[0] == 11:
-            device11 = SmartMeter(row[5], row[3], row[4], row[0])
+            device11 = SmartMeter(row[5], row[3], row[4], device_id=row[0])
         elif row[0] == 12:
-            device12 = TemperatureSensor(row[5], row[3], row[4], row[0])
+            device12 = TemperatureSensor(row[5], row[3], row[4], device_id=row[0])
         elif row[0] == 13:
-            device13 = LightBulb(row[5], row[3], row[4], row[0])
+            device13 = LightBulb(row[5], row[3], row[4], device_id=row[0])
         elif row[0] == 14:
-            device14 = SmartMeter(row[5], row[3], row[4], row[0])
+            device14 = SmartMeter(row[5], row[3], row[4], device_id=row[0])
         elif row[0] == 15:
-            device15 = SmartOutlet(row[5], row[3], row[4], row[0])
+            device15 = SmartOutlet(row[5], row[3], row[4], device_id=row[0])
         elif row[0] == 16:
-            device16 = HeatPump(row[5], row[3], row[4], row[0])
+            device16 = HeatPump(row[5], row[3], row[4], device_id=row[0])
         elif row[0] == 17:
-            device17 = AirQualitySensor(row[5], row[3], row[4], row[0])
+            device17 = AirQualitySensor(row[5], row[3], row[4], device_id=row[0])
         elif row[0] == 18:
-            device18 = SmartOutlet(row[5], row[3], row[4], row[0])
+            device18 = SmartOutlet(row[5], row[3], row[4], device_id=row[0])
         elif row[0] == 19:
-            device19 = HeatOven(row[5], row[3], row[4], row[0])
+            device19 = HeatOven(row[5], row[3], row[4], device_id=row[0])
         elif row[0] == 20:
-            device20 = SmartOutlet(row[5], row[3], row[4], row[0])
+            device20 = SmartOutlet(row[5], row[3], row[4], device_id=row[0])
         elif row[0] == 21:
-            device21 = HumiditySensor(row[5], row[3], row[4], row[0])
+            device21 = HumiditySensor(row[5], row[3], row[4], device_id=row[0])
         elif row[0] == 22:
-            device22 = Dehumidifier(row[5], row[3], row[4], row[0])
+            device22 = Dehumidifier(row[5], row[3], row[4], device_id=row[0])
         elif row[0] == 23:
-            device23 = FloorHeatingPanel(row[5], row[3], row[4], row[0])
+            device23 = FloorHeatingPanel(row[5], row[3], row[4], device_id=row[0])
         elif row[0] == 24:
-            device24 = HeatOven(row[5], row[3], row[4], row[0])
+            device24 = HeatOven(row[5], row[3], row[4], device_id=row[0])
         elif row[0] == 25:
-            device25 = LightBulb(row[5], row[3], row[4], row[0])
+            device25 = LightBulb(row[5], row[3], row[4], device_id=row[0])
         elif row[0] == 26:
-            device26 = LightBulb(row[5], row[3], row[4], row[0])
+            device26 = LightBulb(row[5], row[3], row[4], device_id=row[0])
         elif row[0] == 27:
-            device27 = HeatPump(row[5], row[3], row[4], row[0])
+            device27 = HeatPump(row[5], row[3], row[4], device_id=row[0])
         elif row[0] == 28:
-            device28 = TemperatureSensor(row[5], row[3], row[4], row[0])
+            device28 = TemperatureSensor(row[5], row[3], row[4], device_id=row[0])
         elif row[0] == 29:
-            device29 = LightBulb(row[5], row[3], row[4], row[0])
+            device29 = LightBulb(row[5], row[3], row[4], device_id=row[0])
         elif row[0] == 30:
-            device30 = LightBulb(row[5], row[3], row[4], row[0])
+            device30 = LightBulb(row[5], row[3], row[4], device_id=row[0])
         elif row[0] == 31:
-            device31 = HeatOven(row[5], row[3], row[4], row[0])
+            device31 = HeatOven(row[5], row[3], row[4], device_id=row[0])
 
     device3.moisture = 68
     device8.temperature = 1.3
@@ -169,8 +192,11 @@ def load_demo_house(persistence: SmartHousePersistence) -> SmartHouse:
     result.register_device(device29, bed)
     result.register_device(device30, dress)
     result.register_device(device31, guest3)
+    for device in result.get_all_devices():
+        device.db_file = persistence.db_file
 
     # TODO read rooms, devices and their locations from the database
+    result.changes.clear()
     return result
 
 def build_demo_house() -> SmartHouse:
@@ -278,23 +304,27 @@ def build_demo_house() -> SmartHouse:
     house.register_device(device30, dress)
     house.register_device(device31, guest3)
 
+    # rooms and devices get the ids of db.sqlite (rooms in the order above, devices by their row in the CSV file),
+    # so the house is what is stored there and save_topology() only writes what changes afterwards
+    for room_id, room in enumerate(house.iter_rooms(), start=1):
+        room.room_id = room_id
+    device_ids = {serial_no: no for no, (_, _, serial_no) in devices_map.items()}
+    for device in house.iter_devices():
+        device.device_id = device_ids[device.serial_no]
+    house.changes.clear()
     return house
 
 
 def do_device_list(smart_house: SmartHouse):
     print("Listing Devices...")
-    idx = 0
-    for d in smart_house.get_all_devices():
-        print(f"{idx}: {d}")
-        idx += 1
+    for d in smart_house.iter_devices():
+        print(f"{smart_house.device_index.ordinal(d)}: {d}")
 
 
 def do_room_list(smart_house: SmartHouse):
     print("Listing Rooms...")
-    idx = 0
-    for r in smart_house.get_all_rooms():
-        print(f"{idx}: {r}")
-        idx += 1
+    for r in smart_house.iter_rooms():
+        print(f"{smart_house.room_index.ordinal(r)}: {r}")
 
 
 def do_find(smart_house: SmartHouse):
@@ -302,11 +332,9 @@ def do_find(smart_house: SmartHouse):
     serial_no = input()
     device = smart_house.find_device_by_serial_no(serial_no)
     if device:
-        devices = smart_house.get_all_devices()
-        rooms = smart_house.get_all_rooms()
         room = smart_house.get_room_with_device(device)
-        device_idx = devices.index(device)
-        room_idx = rooms.index(room)
+        device_idx = smart_house.device_index.ordinal(device)
+        room_idx = smart_house.room_index.ordinal(room)
         print(f"Device No {device_idx}:")
         print(device)
         print(f"is located in room No {room_idx}:")
@@ -315,30 +343,30 @@ def do_find(smart_house: SmartHouse):
         print(f"Could not locate device with serial no {serial_no}")
 
 
-def do_move(smart_house):
-    devices = smart_house.get_all_devices()
-    rooms = smart_house.get_all_rooms()
+def do_move(smart_house, persistence=None):
     print("Please choose device:")
     device_id = input()
     device = None
     if device_id.isdigit():
-        device = devices[int(device_id)]
+        device = smart_house.device_index.get(int(device_id))
     else:
         device = smart_house.find_device_by_serial_no(device_id)
     if device:
         print("Please choose target room")
         room_id = input()
-        if room_id.isdigit() and rooms[int(room_id)]:
-            to_room = rooms[int(room_id)]
+        if room_id.isdigit() and smart_house.room_index.get(int(room_id)):
+            to_room = smart_house.room_index.get(int(room_id))
             from_room = smart_house.get_room_with_device(device)
             smart_house.move_device(device, from_room, to_room)
+            if persistence is not None:
+                persistence.save_topology(smart_house)
         else:
             print(f"Room with no {room_id} does not exist!")
     else:
         print(f"Device with id '{device_id}' does not exist")
 
 
-def main(smart_house: SmartHouse):
+def main(smart_house: SmartHouse, persistence: SmartHousePersistence = None):
     print("************ Smart House Control *****************")
     print(f"No of Rooms:       {smart_house.get_no_of_rooms()}")
     print(f"Total Area:        {smart_house.get_total_area()}")
@@ -363,7 +391,7 @@ def main(smart_house: SmartHouse):
         elif char == "f":
             do_find(smart_house)
         elif char == "m":
-            do_move(smart_house)
+            do_move(smart_house, persistence)
         elif char == "q":
             break
         else:
@@ -371,5 +399,14 @@ def main(smart_house: SmartHouse):
 
 
 if __name__ == '__main__':
-    house = build_demo_house()
-    main(house)
+    if os.environ.get("SMARTHOUSE_METRICS_PORT"):
+        metrics.REGISTRY.serve(int(os.environ["SMARTHOUSE_METRICS_PORT"]))
+    persistence = SmartHousePersistence(database.DEFAULT_DB_FILE)
+    # starting from a snapshot is opt-in, it adds the versioning triggers to the database
+    snapshot_file = os.environ.get("SMARTHOUSE_SNAPSHOT")
+    house = snapshot.load_snapshot(snapshot_file, persistence.db_file) if snapshot_file else None
+    if house is None:
+        house = load_house(persistence)
+        if snapshot_file:
+            snapshot.save_snapshot(house, snapshot_file, persistence.db_file)
+    main(house, persistence)
@@ -0,0 +1,211 @@
+import functools
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Default upper bounds (in seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5,
+                   float("inf")]
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = [(k, str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")) for k, v in pairs]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[Tuple[Tuple[str, str], ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+
+class _HistogramValues:
+    __slots__ = ['buckets', 'count', 'sum']
+
+    def __init__(self, no_of_buckets: int):
+        self.buckets = [0] * no_of_buckets
+        self.count = 0
+        self.sum = 0.0
+
+
+class Histogram:
+
+    def __init__(self, name: str, documentation: str, buckets: List[float] = None):
+        self.name = name
+        self.documentation = documentation
+        self.bounds = list(buckets or DEFAULT_BUCKETS)
+        if self.bounds[-1] != float("inf"):
+            self.bounds.append(float("inf"))
+        self._values: Dict[Tuple[Tuple[str, str], ...], _HistogramValues] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = _HistogramValues(len(self.bounds))
+            for i, bound in enumerate(self.bounds):
+                if value <= bound:
+                    values.buckets[i] += 1
+                    break
+            values.count += 1
+            values.sum += value
+
+    def count(self, **labels) -> int:
+        values = self._values.get(tuple(sorted(labels.items())))
+        return values.count if values else 0
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        """
+        Estimates the q-quantile (e.g. 0.99) by linear interpolation inside the bucket that contains it,
+        the same way Prometheus' histogram_quantile() does.
+        """
+        values = self._values.get(tuple(sorted(labels.items())))
+        if not values or values.count == 0:
+            return None
+        rank = q * values.count
+        seen = 0
+        for i, n in enumerate(values.buckets):
+            if seen + n >= rank and n > 0:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                upper = self.bounds[i]
+                if upper == float("inf"):
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.bounds[-2]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, values in sorted(self._values.items()):
+                cumulative = 0
+                for bound, n in zip(self.bounds, values.buckets):
+                    cumulative += n
+                    lines.append(f"{self.name}_bucket{_format_labels(key, ('le', _format_value(bound)))} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(values.sum)}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {values.count}")
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        with self._lock:
+            if name not in self.metrics:
+                self.metrics[name] = Counter(name, documentation)
+            return self.metrics[name]
+
+    def histogram(self, name: str, documentation: str, buckets: List[float] = None) -> Histogram:
+        with self._lock:
+            if name not in self.metrics:
+                self.metrics[name] = Histogram(name, documentation, buckets)
+            return self.metrics[name]
+
+    def render(self) -> str:
+        """
+        Returns all metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        for name in sorted(self.metrics):
+            lines.extend(self.metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+    def dump(self, file_path: str):
+        with open(file_path, "w") as f:
+            f.write(self.render())
+
+    def serve(self, port: int = 9464, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """
+        Starts a background HTTP server answering GET /metrics with render().
+        Call shutdown() on the returned server to stop it.
+        """
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+REGISTRY = Registry()
+
+DEVICE_COMMANDS = REGISTRY.histogram("smarthouse_device_command_seconds", "Latency of actuator commands.")
+SENSOR_READS = REGISTRY.histogram("smarthouse_sensor_read_seconds", "Latency of reading the current sensor value.")
+SCENES = REGISTRY.histogram("smarthouse_scene_seconds", "Latency of scenes applied to a room.")
+ANALYTICS_QUERIES = REGISTRY.histogram("smarthouse_analytics_query_seconds", "Latency of analytics queries.")
+RULES_FIRED = REGISTRY.counter("smarthouse_automation_rules_fired_total", "Automation rules whose actions ran.")
+ANOMALIES = REGISTRY.counter("smarthouse_anomalies_total", "Sensor readings flagged as anomalies.")
+ERRORS = REGISTRY.counter("smarthouse_errors_total", "Operations that raised an exception.")
+
+
+def timed(histogram: Histogram, **labels) -> Callable:
+    """
+    Decorator observing the duration of every call in the given histogram (with the given labels)
+    and counting calls that raise in smarthouse_errors_total.
+    """
+    def decorator(fn: Callable) -> Callable:
+        operation = fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                ERRORS.inc(metric=histogram.name, operation=operation)
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started, **labels)
+        return wrapper
+    return decorator
@@ -0,0 +1,62 @@
+import unittest
+import urllib.request
+from metrics import Registry, timed
+
+
+class MetricsTest(unittest.TestCase):
+
+    def test_counter(self):
+        registry = Registry()
+        counter = registry.counter("test_total", "Test counter.")
+        counter.inc(kind="a")
+        counter.inc(2, kind="a")
+        counter.inc(kind="b")
+        self.assertEqual(3, counter.get(kind="a"))
+        self.assertIn('test_total{kind="a"} 3', registry.render())
+
+    def test_histogram_rendering(self):
+        registry = Registry()
+        histogram = registry.histogram("test_seconds", "Test histogram.", [0.1, 1])
+        histogram.observe(0.05, command="turn_on")
+        histogram.observe(0.5, command="turn_on")
+        histogram.observe(5, command="turn_on")
+        lines = registry.render().splitlines()
+        self.assertIn("# TYPE test_seconds histogram", lines)
+        self.assertIn('test_seconds_bucket{command="turn_on",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{command="turn_on",le="1"} 2', lines)
+        self.assertIn('test_seconds_bucket{command="turn_on",le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_count{command="turn_on"} 3', lines)
+
+    def test_quantile(self):
+        histogram = Registry().histogram("test_seconds", "Test histogram.", [0.1, 0.2, 0.4])
+        for _ in range(90):
+            histogram.observe(0.05)
+        for _ in range(10):
+            histogram.observe(0.3)
+        self.assertAlmostEqual(0.1 * 50 / 90, histogram.quantile(0.5), places=6)
+        self.assertAlmostEqual(0.38, histogram.quantile(0.99), places=6)
+        self.assertIsNone(histogram.quantile(0.99, command="unknown"))
+
+    def test_timed(self):
+        histogram = Registry().histogram("test_seconds", "Test histogram.")
+
+        @timed(histogram, command="fail")
+        def fail():
+            raise ValueError()
+
+        self.assertRaises(ValueError, fail)
+        self.assertEqual(1, histogram.count(command="fail"))
+
+    def test_endpoint(self):
+        registry = Registry()
+        registry.counter("test_total", "Test counter.").inc()
+        server = registry.serve(port=0)
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{server.server_port}/metrics") as response:
+                self.assertIn("test_total 1", response.read().decode("utf-8"))
+        finally:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
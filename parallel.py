@@ -0,0 +1,112 @@
+import math
+from concurrent.futures import Executor
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import database
+from archive import MeasurementArchive, to_epoch
+
+
+class Aggregate:
+    """
+    Count, sum, minimum and maximum of a set of readings. Partial aggregates of disjoint parts of the data
+    (other sensors or other time partitions) are merged into the aggregate of the whole.
+    """
+    __slots__ = ['count', 'total', 'min', 'max']
+
+    def __init__(self, count: int = 0, total: float = 0.0, minimum: float = None, maximum: float = None):
+        self.count = count
+        self.total = total
+        self.min = minimum
+        self.max = maximum
+
+    def merge(self, other: "Aggregate"):
+        if not other.count:
+            return
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self.count += other.count
+        self.total += other.total
+
+    def describe(self) -> Optional[Tuple[float, float, float]]:
+        """
+        Returns (minimum, maximum, average), or None if there are no readings.
+        """
+        return (self.min, self.max, self.total / self.count) if self.count else None
+
+
+def time_partitions(from_ts: datetime, to_ts: datetime, n: int) -> List[Tuple[str, str, bool]]:
+    """
+    Splits [from_ts, to_ts] into n consecutive partitions of equal length. Returns (start, end, end included)
+    with the bounds formatted like the time stamps in the measurements table; only the last partition
+    includes its end, so no reading is counted twice.
+    """
+    n = max(1, n)
+    step = (to_ts - from_ts) / n
+    bounds = [from_ts + step * i for i in range(n)] + [to_ts]
+    return [(bounds[i].isoformat(timespec="seconds"), bounds[i + 1].isoformat(timespec="seconds"), i == n - 1)
+            for i in range(n)]
+
+
+def archived_aggregate(archive: MeasurementArchive, serial_no: str, from_ts: datetime, to_ts: datetime,
+                       end_included: bool = True) -> Aggregate:
+    """
+    Aggregate of the readings of the sensor in the archive within the timespan. NULL readings are skipped,
+    like the aggregate functions of SQL do.
+    """
+    timestamps, values = archive.read(serial_no, from_ts, to_ts)
+    end = to_epoch(to_ts)
+    values = [v for ts, v in zip(timestamps, values) if not math.isnan(v) and (end_included or ts < end)]
+    if not values:
+        return Aggregate()
+    return Aggregate(len(values), sum(values), min(values), max(values))
+
+
+def aggregate_partition(db_file: str, serial_nos: Sequence[str], start: str, end: str, end_included: bool,
+                        archive_dir: Optional[str] = None) -> Dict[str, Tuple[int, float, float, float]]:
+    """
+    Worker: (count, sum, min, max) per sensor within one time partition, read on its own read-only connection
+    and from the archive in archive_dir, if any.
+    """
+    connection = database.connect_read_only(db_file)
+    try:
+        placeholders = ", ".join("?" * len(serial_nos))
+        rows = connection.execute(
+            f"SELECT serial_no, COUNT(value), TOTAL(value), MIN(value), MAX(value) FROM measurements "
+            f"WHERE serial_no IN ({placeholders}) AND time_stamp >= ? AND time_stamp {'<=' if end_included else '<'} ? "
+            f"GROUP BY serial_no", (*serial_nos, start, end)).fetchall()
+    finally:
+        connection.close()
+    result = {row[0]: row[1:] for row in rows if row[1]}
+    if archive_dir is not None:
+        archive = MeasurementArchive(archive_dir)
+        for serial_no in serial_nos:
+            aggregate = archived_aggregate(archive, serial_no, datetime.fromisoformat(start),
+                                           datetime.fromisoformat(end), end_included)
+            if aggregate.count:
+                if serial_no in result:
+                    aggregate.merge(Aggregate(*result[serial_no]))
+                result[serial_no] = (aggregate.count, aggregate.total, aggregate.min, aggregate.max)
+    return result
+
+
+def aggregate_in_parallel(executor: Executor, workers: int, db_file: str, serial_nos: Sequence[str],
+                          from_ts: datetime, to_ts: datetime, archive_dir: Optional[str] = None) -> Dict[str, Aggregate]:
+    """
+    Splits the work by sensor (up to one group per worker) and by time (so that there are about two tasks
+    per worker), runs the tasks on the executor and merges their partial aggregates per sensor.
+    Readings moved to the archive in archive_dir are included.
+    """
+    serial_nos = list(serial_nos)
+    result = {serial_no: Aggregate() for serial_no in serial_nos}
+    if not serial_nos:
+        return result
+    no_of_groups = min(len(serial_nos), workers)
+    groups = [serial_nos[i::no_of_groups] for i in range(no_of_groups)]
+    partitions = time_partitions(from_ts, to_ts, max(1, 2 * workers // no_of_groups))
+    futures = [executor.submit(aggregate_partition, db_file, group, *partition, archive_dir)
+               for group in groups for partition in partitions]
+    for future in futures:
+        for serial_no, (count, total, minimum, maximum) in future.result().items():
+            result[serial_no].merge(Aggregate(count, total, minimum, maximum))
+    return result
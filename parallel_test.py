@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+import datagen
+from parallel import Aggregate, time_partitions
+from persistence import SmartHousePersistence, SmartHouseAnalytics
+
+
+class ParallelTest(unittest.TestCase):
+
+    def test_time_partitions(self):
+        partitions = time_partitions(datetime(2023, 1, 1), datetime(2023, 1, 2), 4)
+        self.assertEqual([("2023-01-01T00:00:00", "2023-01-01T06:00:00", False),
+                          ("2023-01-01T06:00:00", "2023-01-01T12:00:00", False),
+                          ("2023-01-01T12:00:00", "2023-01-01T18:00:00", False),
+                          ("2023-01-01T18:00:00", "2023-01-02T00:00:00", True)], partitions)
+
+    def test_merge(self):
+        total = Aggregate()
+        total.merge(Aggregate(2, 3.0, 1.0, 2.0))
+        total.merge(Aggregate())
+        total.merge(Aggregate(1, -4.0, -4.0, -4.0))
+        self.assertEqual((-4.0, 2.0, -1 / 3), total.describe())
+        self.assertIsNone(Aggregate().describe())
+
+    def test_parallel_matches_serial(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_file = os.path.join(tmp, "db.sqlite")
+            house = datagen.generate_database(db_file, 1, 4, 16, 20_000)
+            sensors = [d for d in house.get_all_devices() if d.is_sensor()]
+            p = SmartHousePersistence(db_file)
+            serial = SmartHouseAnalytics(p)
+            parallel = SmartHouseAnalytics(p, processes=3)
+            try:
+                from_ts, to_ts = datetime(2023, 1, 1, 3), datetime(2023, 1, 2, 1, 30)
+                expected = serial.describe_sensors_in_timespan(sensors, from_ts, to_ts)
+                result = parallel.describe_sensors_in_timespan(sensors, from_ts, to_ts)
+                self.assertEqual(expected.keys(), result.keys())
+                for serial_no, stats in expected.items():
+                    self.assertIsNotNone(stats)
+                    self.assertEqual(stats[:2], result[serial_no][:2])
+                    self.assertAlmostEqual(stats[2], result[serial_no][2])
+                self.assertEqual(serial.describe_sensor_in_timespan(sensors[0], from_ts, to_ts)[:2],
+                                 parallel.describe_sensor_in_timespan(sensors[0], from_ts, to_ts)[:2])
+                self.assertIsNone(parallel.describe_sensor_in_timespan(sensors[0], datetime(2030, 1, 1),
+                                                                       datetime(2030, 2, 1)))
+            finally:
+                parallel.close()
+
+            # readings moved to the archive still count, serial and parallel
+            archived = SmartHousePersistence(db_file, os.path.join(tmp, "archive"))
+            self.assertTrue(archived.archive_measurements(datetime(2023, 1, 1, 12)) > 0)
+            serial = SmartHouseAnalytics(archived)
+            parallel = SmartHouseAnalytics(archived, processes=3)
+            try:
+                for analytics in (serial, parallel):
+                    result = analytics.describe_sensors_in_timespan(sensors, from_ts, to_ts)
+                    for serial_no, stats in expected.items():
+                        self.assertEqual(stats[:2], result[serial_no][:2])
+                        self.assertAlmostEqual(stats[2], result[serial_no][2])
+            finally:
+                parallel.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,28 +1,115 @@
-from sqlite3 import Connection
+import bisect
+import contextlib
+import math
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import database
+import energy
+import parallel
+import metrics
+import resample
+from archive import MeasurementArchive, from_epoch, to_epoch
+from frame import Frame
+from timeseries import TimeSeriesStore
+from streamstats import RoomTemperatureStatistics
+import timeseries
 from devices import Device
-from smarthouse import Room
-from typing import Optional, List, Dict, Tuple
-from datetime import date, datetime
+from smarthouse import Room, SmartHouse, TopologyChange
+from typing import Optional, List, Dict, Tuple, Callable, Iterable, Iterator, Sequence
+from datetime import date, datetime, timedelta
 
 
 class SmartHousePersistence:
 
-    def __init__(self, db_file: str):
+    def __init__(self, db_file: str, archive_dir: str = None):
         self.db_file = db_file
-        self.connection = Connection(db_file)
+        self._closed = True  # until the connection is open, __del__ runs even if connecting fails
+        self.connection = database.connect(db_file)
         self.cursor = self.connection.cursor()
+        self._closed = False
+        self.archive = MeasurementArchive(archive_dir) if archive_dir else None
+        # called with (time_stamp, device, value, serial_no) for every reading passed to add_measurements()
+        self.measurement_listeners: List[Callable[[str, int, Optional[float], str], None]] = []
+        # called by save_topology() with (device, room) for every device written, room None if it was removed
+        self.topology_listeners: List[Callable[[Device, Optional[Room]], None]] = []
+        self._transaction_depth = 0  # nesting of transaction() blocks, save() does not commit inside
+        self._saved_topology: List[Tuple[SmartHouse, List[TopologyChange]]] = []  # restored on rollback
+        self._pending_notifications: List[Callable[[], None]] = []  # listener calls held back until the commit
+        self.history_version = 0  # incremented whenever archive_measurements() removes readings from the table
 
     def __del__(self):
+        self.close()
+
+    def close(self):
+        """
+        Rolls back what has not been saved and closes the connection. Does nothing if it is already closed.
+        """
+        if self._closed:
+            return
+        self._closed = True
         self.connection.rollback()
         self.connection.close()
 
     def save(self):
-        self.connection.commit()
+        if not self._transaction_depth:
+            self.connection.commit()
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator["SmartHousePersistence"]:
+        """
+        Groups writes into one transaction that is committed at the end of the block, or rolled back if it raises:
+        device commands of devices stored in this database (they share this connection instead of opening
+        and committing their own), save_topology(), add_measurements() and every other write of this object.
+        Nested blocks join the outermost one. The devices must be commanded from the thread that opened it,
+        and read their state through this connection as well, so they see their own uncommitted writes.
+        The measurement and topology listeners are called after the commit, and not at all on rollback.
+
+        On rollback the topology changes written by save_topology() in the block are put back into house.changes
+        so they can be saved again. The in-memory state of devices (e.g. is_active or temperature of actuators
+        commanded in the block) is not reverted, reload the house if it must match the database again.
+        """
+        if self._transaction_depth:
+            self._transaction_depth += 1
+            try:
+                yield self
+            finally:
+                self._transaction_depth -= 1
+            return
+        self._transaction_depth = 1
+        try:
+            with database.transaction_scope(self.db_file, self.connection):
+                yield self
+        except BaseException:
+            self.connection.rollback()
+            for house, changes in reversed(self._saved_topology):
+                house.changes[:0] = changes
+            raise
+        else:
+            self.connection.commit()
+        finally:
+            self._transaction_depth = 0
+            self._saved_topology.clear()
+            pending, self._pending_notifications = self._pending_notifications, []
+        for notify in pending:
+            notify()
+
+    def _notify(self, listeners: list, rows: list):
+        """
+        Calls every listener with every row, right away or after the commit of the open transaction.
+        """
+        if self._transaction_depth:
+            self._pending_notifications.append(lambda: self._notify(listeners, rows))
+            return
+        for listener in listeners:
+            for row in rows:
+                listener(*row)
 
     def reconnect(self):
         self.connection.close()
-        self.connection = Connection(self.db_file)
+        self.connection = database.connect(self.db_file)
         self.cursor = self.connection.cursor()
+        self._closed = False
 
     def check_tables(self) -> bool:
         self.cursor.execute("SELECT name FROM sqlite_schema WHERE type = 'table';")
@@ -31,12 +118,175 @@ class SmartHousePersistence:
             result.add(row[0])
         return 'rooms' in result and 'devices' in result and 'measurements' in result
 
+    def create_tables(self):
+        self.cursor.executescript("""
+            CREATE TABLE IF NOT EXISTS rooms(
+                id INT NOT NULL,
+                floor INT NOT NULL,
+                area REAL NOT NULL,
+                name TEXT NULL,
+                PRIMARY KEY (id)
+            );
+            CREATE TABLE IF NOT EXISTS devices(
+                id INT NOT NULL,
+                room INT NULL,
+                type TEXT NOT NULL,
+                producer TEXT NULL,
+                product_name TEXT NULL,
+                serial_no TEXT NOT NULL,
+                PRIMARY KEY (id),
+                FOREIGN KEY (room) REFERENCES rooms(id)
+            );
+            CREATE TABLE IF NOT EXISTS measurements(
+                time_stamp TEXT NOT NULL,
+                device INT NOT NULL,
+                value REAL NULL, serial_no,
+                PRIMARY KEY (time_stamp, device),
+                FOREIGN KEY (device) REFERENCES devices(id)
+            );
+            CREATE TABLE IF NOT EXISTS device_state(serial_no TEXT,value);
+        """)
+
+    def add_measurements(self, rows: Iterable[Tuple[str, int, Optional[float], str]]) -> int:
+        """
+        Ingests (time_stamp, device, value, serial_no) readings and notifies the measurement listeners.
+        The newest reading of every sensor becomes its current value in device_state, unless the sensor already
+        has a later reading. Like all other writes, the readings are committed by save(); inside transaction()
+        the listeners are notified after the commit.
+        """
+        rows = list(rows)
+        self.cursor.executemany("INSERT INTO measurements (time_stamp, device, value, serial_no) VALUES (?, ?, ?, ?)", rows)
+        latest: Dict[str, Tuple[str, int, Optional[float], str]] = {}
+        for row in rows:
+            if row[2] is not None and (row[3] not in latest or row[0] >= latest[row[3]][0]):
+                latest[row[3]] = row
+        self.cursor.executemany("UPDATE device_state SET value = ? WHERE serial_no = ? AND NOT EXISTS "
+                                "(SELECT 1 FROM measurements WHERE time_stamp > ? AND serial_no = ?)",
+                                [(r[2], r[3], r[0], r[3]) for r in latest.values()])
+        self._notify(self.measurement_listeners, rows)
+        return len(rows)
+
+    def save_topology(self, house: SmartHouse) -> int:
+        """
+        Writes the pending topology changes of the house (created rooms, registered, unregistered and moved
+        devices) to the rooms and devices tables in a single transaction. Changes are coalesced first, so a
+        device that has been moved many times is updated once. Returns the number of changes written.
+        """
+        if not house.changes:
+            return 0
+        new_rooms = []
+        placement: Dict[int, Tuple[Device, Optional[Room]]] = {}  # final room per device, None if removed
+        for change in house.changes:
+            if change.kind == TopologyChange.CREATE_ROOM:
+                new_rooms.append((change.room, change.floor_no))
+            elif change.kind == TopologyChange.UNREGISTER_DEVICE:
+                placement[id(change.device)] = (change.device, None)
+            else:
+                placement[id(change.device)] = (change.device, change.room)
+
+        next_room_id = (self.cursor.execute("SELECT MAX(id) FROM rooms").fetchone()[0] or 0) + 1
+        next_device_id = (self.cursor.execute("SELECT MAX(id) FROM devices").fetchone()[0] or 0) + 1
+        room_rows = []
+        for room, floor_no in new_rooms:
+            if room.room_id is None:
+                room.room_id = next_room_id
+                next_room_id += 1
+            room_rows.append((room.room_id, floor_no, room.area, room.name))
+        device_rows = []
+        deletes = []
+        for device, room in placement.values():
+            if room is None:
+                if device.device_id is not None:
+                    deletes.append((device.device_id,))
+                continue
+            if device.device_id is None:
+                device.device_id = next_device_id
+                next_device_id += 1
+            device_rows.append((device.device_id, room.room_id, device.get_type_name(), device.producer,
+                                device.product_type, device.serial_no))
+
+        self.cursor.executemany("INSERT OR REPLACE INTO rooms (id, floor, area, name) VALUES (?, ?, ?, ?)", room_rows)
+        # devices that already exist only change their room
+        self.cursor.executemany("INSERT INTO devices VALUES (?, ?, ?, ?, ?, ?) "
+                                "ON CONFLICT (id) DO UPDATE SET room = excluded.room", device_rows)
+        self.cursor.executemany("INSERT INTO device_state (serial_no, value) SELECT ?, 0 WHERE NOT EXISTS "
+                                "(SELECT 1 FROM device_state WHERE serial_no = ?)", [(r[5], r[5]) for r in device_rows])
+        self.cursor.executemany("DELETE FROM devices WHERE id = ?", deletes)
+        self.save()
+        self._notify(self.topology_listeners, list(placement.values()))
+        count = len(house.changes)
+        if self._transaction_depth:
+            self._saved_topology.append((house, list(house.changes)))
+        house.changes.clear()
+        return count
+
+    def archive_measurements(self, before: datetime, chunk_rows: int = 100_000) -> int:
+        """
+        Moves all measurements older than the given point in time from the measurements table into the
+        cold archive, one chunk of at most chunk_rows rows per sensor and transaction.
+        Returns the number of moved rows. Not possible inside transaction(): the chunk files could not be
+        rolled back with the rows.
+        """
+        if self.archive is None:
+            raise RuntimeError("No archive directory configured!")
+        if self._transaction_depth:
+            raise RuntimeError("Measurements cannot be archived inside a transaction!")
+        cutoff = before.isoformat()
+        self.save()
+        serial_nos = [row[0] for row in self.cursor.execute(
+            "SELECT DISTINCT serial_no FROM measurements WHERE time_stamp < ?", (cutoff,)).fetchall()]
+        moved = 0
+        for serial_no in serial_nos:
+            while True:
+                rows = self.cursor.execute(
+                    "SELECT time_stamp, value FROM measurements WHERE serial_no = ? AND time_stamp < ? "
+                    "ORDER BY time_stamp LIMIT ?", (serial_no, cutoff, chunk_rows)).fetchall()
+                if not rows:
+                    break
+                # the chunk file is written before the rows are deleted, a crash in between only duplicates
+                self.archive.write(serial_no, rows)
+                self.cursor.execute("DELETE FROM measurements WHERE serial_no = ? AND time_stamp <= ?",
+                                    (serial_no, rows[-1][0]))
+                self.save()
+                moved += len(rows)
+                if len(rows) < chunk_rows:
+                    break
+        if moved:
+            self.history_version += 1
+        return moved
+
 
 class SmartHouseAnalytics:
 
-    def __init__(self, persistence: SmartHousePersistence):
-        self.persistence = persistence
+    energy_cache_windows = 16  # timespans whose hourly consumption is kept per meter, least recently used go first
 
+    def __init__(self, persistence: SmartHousePersistence, store: TimeSeriesStore = None, processes: int = 1):
+        self.persistence = persistence
+        self.store = store  # optional memory-mapped copy of the sensor history, see TimeSeriesStore.build()
+        self.room_temperatures: Optional[RoomTemperatureStatistics] = None
+        self._room_temperatures_version = None  # database version the statistics were loaded at
+        self.processes = processes  # > 1 splits timespan aggregates across a pool of worker processes
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # hourly consumption per meter serial no and (from_ts, to_ts), dropped when the meter gets new readings
+        self._energy_cache: Optional[Dict[str, OrderedDict[Tuple[datetime, datetime], array]]] = None
+
+    def close(self):
+        """
+        Shuts down the worker processes of the parallel mode.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _aggregate_in_parallel(self, serial_nos: List[str], from_ts: datetime, to_ts: datetime) -> Dict[str, parallel.Aggregate]:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.processes)
+        # workers read on their own connections and only see committed readings
+        archive = self.persistence.archive
+        return parallel.aggregate_in_parallel(self._executor, self.processes, self.persistence.db_file,
+                                              serial_nos, from_ts, to_ts, archive.directory if archive else None)
+
+    @metrics.timed(metrics.ANALYTICS_QUERIES, query="get_most_recent_sensor_reading")
     def get_most_recent_sensor_reading(self, sensor: Device) -> Optional[float]:
         """
         Retrieves the most recent (i.e. current) value reading for the given
@@ -44,7 +294,7 @@ class SmartHouseAnalytics:
         Function may return None if the given device is an actuator or
         if there are no sensor values for the given device recorded in the database.
         """
-        conn = Connection('db.sqlite')
+        conn = database.connect(self.persistence.db_file)
         cursor = conn.cursor()
 
         cursor.execute(f"SELECT * FROM measurements WHERE serial_no = '{sensor.serial_no}' ORDER BY time_stamp DESC LIMIT 1 ")
@@ -54,11 +304,12 @@ class SmartHouseAnalytics:
         return measurement[0][2]
 
 
+    @metrics.timed(metrics.ANALYTICS_QUERIES, query="get_coldest_room")
     def get_coldest_room(self) -> Room:
         """
         Finds the room, which has the lowest temperature on average.
         """
-        conn = Connection('db.sqlite')
+        conn = database.connect(self.persistence.db_file)
         cursor = conn.cursor()
 
         cursor.execute(f"SELECT r.name FROM rooms r inner join devices d  ON r.id = d.room  Inner JOIN measurements m ON d.serial_no = m.serial_no GROUP by r.name order by avg(m.value)")
@@ -68,22 +319,30 @@ class SmartHouseAnalytics:
 
         return measurement[0][0]
 
+    @metrics.timed(metrics.ANALYTICS_QUERIES, query="get_sensor_readings_in_timespan")
     def get_sensor_readings_in_timespan(self, sensor: Device, from_ts: datetime, to_ts: datetime) -> List[float]:
         """
         Returns a list of sensor measurements (float values) for the given device in the given timespan.
+        Readings that have been moved to the archive are included, ahead of the ones still in the database.
         """
-        conn = Connection('db.sqlite')
+        archived = []
+        if self.persistence.archive is not None:
+            _, values = self.persistence.archive.read(sensor.serial_no, from_ts, to_ts)
+            archived = [None if math.isnan(v) else v for v in values]
+
+        conn = database.connect(self.persistence.db_file)
         cursor = conn.cursor()
 
         cursor.execute(f"SELECT m.value FROM measurements m WHERE REPLACE(m.time_stamp, 'T', ' ') BETWEEN ? AND ? AND m.serial_no = ?", (from_ts, to_ts, sensor.serial_no))
         measurement = cursor.fetchall()
 
-        svar = [x[0] for x in measurement]
+        svar = archived + [x[0] for x in measurement]
 
         conn.close()
 
         return svar
 
+    @metrics.timed(metrics.ANALYTICS_QUERIES, query="describe_temperature_in_rooms")
     def describe_temperature_in_rooms(self) -> Dict[str, Tuple[float, float, float]]:
         """
         Returns a dictionary where the key are room names and the values are triples
@@ -92,31 +351,75 @@ class SmartHouseAnalytics:
         - The second component [index=1] being the _maximum_ temperature of the room.
         - The third component [index=2] being the _average_ temperature of the room.
 
+        Every room with readings in the measurements table is included. The statistics are computed from that
+        table once and then kept up to date from the readings passed to add_measurements() and the sensors moved
+        with save_topology() of this persistence, so later calls do not scan the measurements. They are computed
+        again when another connection has committed to the database since, or readings have been moved to the
+        archive with archive_measurements(). Readings rolled up by a Compactor working on the connection of this
+        persistence are only dropped with the next such reload.
+
         This function can be seen as a simplified version of the DataFrame.describe()
         function that exists in Pandas:
         https://pandas.pydata.org/docs/reference/api/pandas.DataFrame.describe.html?highlight=describe
         """
-        conn = Connection('db.sqlite')
-        cursor = conn.cursor()
+        if self.room_temperatures is None:
+            self.room_temperatures = RoomTemperatureStatistics()
+            self.persistence.measurement_listeners.append(self.room_temperatures.on_measurement)
+            self.persistence.topology_listeners.append(self._on_device_placed)
+        # data_version changes with every commit of another connection, history_version when this one archives
+        version = (self.persistence.connection.execute("PRAGMA data_version").fetchall()[0][0],
+                   self.persistence.history_version)
+        if version != self._room_temperatures_version:
+            self.room_temperatures.load(self.persistence.connection)
+            self._room_temperatures_version = version
+        return self.room_temperatures.describe()
+
+    def _on_device_placed(self, device: Device, room: Optional[Room]):
+        if device.get_type_name() == RoomTemperatureStatistics.SENSOR_TYPE and device.device_id is not None:
+            self.room_temperatures.move_device(device.device_id, room.name if room is not None else None)
+
+    @metrics.timed(metrics.ANALYTICS_QUERIES, query="describe_sensor_in_timespan")
+    def describe_sensor_in_timespan(self, sensor: Device, from_ts: datetime, to_ts: datetime) -> Optional[Tuple[float, float, float]]:
+        """
+        Returns the minimum, maximum and average reading of the given sensor in the given timespan,
+        or None if there are no readings. Uses the memory-mapped store when the analytics have one.
+        Readings that have been moved to the archive are included.
+        """
+        if self.store is not None:
+            series = self.store.open(sensor.serial_no)
+            if series is None:
+                return None
+            return timeseries.describe(series.range(from_ts, to_ts)[1])
 
-        cursor.execute("SELECT r.name, CAST(MIN(m.value) as float), CAST(MAX(m.value) as float), CAST(AVG(m.value) as float) as Verdier FROM rooms r Inner JOIN measurements m ON d.serial_no = m.serial_no inner join devices d  ON r.id = d.room GROUP by r.name")
-        measurement = cursor.fetchall()
+        if self.processes > 1:
+            return self._aggregate_in_parallel([sensor.serial_no], from_ts, to_ts)[sensor.serial_no].describe()
 
-        navn = [x[0] for x in measurement]
-        minverdi = [x[1] for x in measurement]
-        maxverdi = [x[2] for x in measurement]
-        gjennomsnitt = [x[3] for x in measurement]
+        conn = database.connect(self.persistence.db_file)
+        cursor = conn.cursor()
 
-        svar = {
-            navn[3]: (minverdi[3], maxverdi[3], gjennomsnitt[3]),
-            navn[2]: (minverdi[2], maxverdi[2], gjennomsnitt[2]),
-            navn[4]: (minverdi[4], maxverdi[4], gjennomsnitt[4])
-        }
+        cursor.execute("SELECT MIN(value), MAX(value), AVG(value), COUNT(value), TOTAL(value) FROM measurements WHERE serial_no = ? AND REPLACE(time_stamp, 'T', ' ') BETWEEN ? AND ?", (sensor.serial_no, from_ts, to_ts))
+        measurement = cursor.fetchone()
 
         conn.close()
 
-        return svar
+        if self.persistence.archive is not None:
+            aggregate = parallel.archived_aggregate(self.persistence.archive, sensor.serial_no, from_ts, to_ts)
+            aggregate.merge(parallel.Aggregate(measurement[3], measurement[4], measurement[0], measurement[1]))
+            return aggregate.describe()
+        return None if measurement[0] is None else measurement[:3]
 
+    @metrics.timed(metrics.ANALYTICS_QUERIES, query="describe_sensors_in_timespan")
+    def describe_sensors_in_timespan(self, sensors: List[Device], from_ts: datetime, to_ts: datetime) -> Dict[str, Optional[Tuple[float, float, float]]]:
+        """
+        describe_sensor_in_timespan() for many sensors at once, keyed by serial number. In parallel mode the
+        sensors and the timespan are split across the worker processes.
+        """
+        if self.store is not None or self.processes <= 1:
+            return {s.serial_no: self.describe_sensor_in_timespan(s, from_ts, to_ts) for s in sensors}
+        aggregates = self._aggregate_in_parallel([s.serial_no for s in sensors], from_ts, to_ts)
+        return {serial_no: aggregate.describe() for serial_no, aggregate in aggregates.items()}
+
+    @metrics.timed(metrics.ANALYTICS_QUERIES, query="get_hours_when_humidity_above_average")
     def get_hours_when_humidity_above_average(self, room: Room, day: date) -> List[int]:
         """
         This function determines during which hours of the given day
@@ -124,5 +427,241 @@ class SmartHouseAnalytics:
         the average recorded humidity in that room at that particular time.
         The result is a (possibly empty) list of number respresenting hours [0-23].
         """
+        room_name = room.name if isinstance(room, Room) else room
+        serial_nos = [row[0] for row in self.persistence.cursor.execute(
+            "SELECT d.serial_no FROM devices d INNER JOIN rooms r ON r.id = d.room WHERE r.name = ? AND d.type = 'Fuktighetssensor'",
+            (room_name,)).fetchall()]
+
+        if self.store is not None:
+            series = [self.store.open(serial_no) for serial_no in serial_nos]
+            return timeseries.hours_above_average([s for s in series if s is not None], day)
 
-        NotImplemented
\ No newline at end of file
+        conn = database.connect(self.persistence.db_file)
+        cursor = conn.cursor()
+
+        placeholders = ", ".join("?" * len(serial_nos))
+        cursor.execute(f"SELECT CAST(SUBSTR(m.time_stamp, 12, 2) AS INT), m.value > (SELECT AVG(value) FROM measurements WHERE serial_no IN ({placeholders}) AND SUBSTR(time_stamp, 1, 10) = ?) FROM measurements m WHERE m.serial_no IN ({placeholders}) AND SUBSTR(m.time_stamp, 1, 10) = ?",
+                       (*serial_nos, day.isoformat(), *serial_nos, day.isoformat()))
+        counts = [0] * 24
+        for hour, above in cursor.fetchall():
+            if above:
+                counts[hour] += 1
+
+        conn.close()
+
+        return [hour for hour in range(24) if counts[hour] > 3]
+
+    def _on_meter_reading(self, time_stamp: str, device: int, value: Optional[float], serial_no: str):
+        self._energy_cache.pop(serial_no, None)
+
+    def _meter_counters_from_db(self, serial_no: str, start: datetime, hours: int) -> Tuple[float, array]:
+        end = start + energy.HOUR * hours
+        first_hour, end_hour = start.strftime("%Y-%m-%dT%H"), end.strftime("%Y-%m-%dT%H")
+        queries = [("SELECT SUBSTR(time_stamp, 1, 13), MAX(value) FROM measurements "
+                    "WHERE serial_no = ? AND time_stamp >= ? AND time_stamp < ? GROUP BY SUBSTR(time_stamp, 1, 13)",
+                    "SELECT MAX(value) FROM measurements WHERE serial_no = ? AND time_stamp < ?")]
+        tables = {row[0] for row in self.persistence.cursor.execute(
+            "SELECT name FROM sqlite_schema WHERE type = 'table' AND name LIKE 'measurements_%'").fetchall()}
+        if "measurements_hourly" in tables:
+            queries.append(("SELECT period, max FROM measurements_hourly WHERE serial_no = ? AND period >= ? AND period < ?",
+                            "SELECT MAX(max) FROM measurements_hourly WHERE serial_no = ? AND period < ?"))
+        maxima: Dict[str, float] = {}
+        baseline = math.nan
+        for hourly_query, baseline_query in queries:
+            for hour, maximum in self.persistence.cursor.execute(hourly_query, (serial_no, first_hour, end_hour)).fetchall():
+                if maximum is not None and not maxima.get(hour, -math.inf) >= maximum:
+                    maxima[hour] = maximum
+            before = self.persistence.cursor.execute(baseline_query, (serial_no, first_hour)).fetchall()[0][0]
+            if before is not None and not baseline >= before:
+                baseline = before
+        if "measurements_daily" in tables:
+            before = self.persistence.cursor.execute(
+                "SELECT MAX(max) FROM measurements_daily WHERE serial_no = ? AND period < ?",
+                (serial_no, start.date().isoformat())).fetchall()[0][0]
+            if before is not None and not baseline >= before:
+                baseline = before
+        archive = self.persistence.archive
+        if archive is not None:
+            end_epoch = to_epoch(end)
+            timestamps, values = archive.read(serial_no, start, end)
+            for ts, value in zip(timestamps, values):
+                hour = from_epoch(ts).strftime("%Y-%m-%dT%H")
+                if ts < end_epoch and not math.isnan(value) and not maxima.get(hour, -math.inf) >= value:
+                    maxima[hour] = value
+            # the counter only goes up, so its last archived reading before the start is the largest
+            before = archive.last_before(serial_no, start)
+            if before is not None and not math.isnan(before[1]) and not baseline >= before[1]:
+                baseline = before[1]
+        return baseline, energy.counters_from_hourly_maxima(maxima, start, hours)
+
+    def _hourly_energy(self, serial_no: str, from_ts: datetime, to_ts: datetime) -> Tuple[datetime, array]:
+        """
+        Consumption of a meter in every hour touching [from_ts, to_ts], and the start of the first hour.
+        """
+        if self._energy_cache is None:
+            self._energy_cache = {}
+            self.persistence.measurement_listeners.append(self._on_meter_reading)
+        start, hours = energy.hour_grid(from_ts, to_ts)
+        windows = self._energy_cache.setdefault(serial_no, OrderedDict())
+        hourly = windows.get((from_ts, to_ts))
+        if hourly is not None:
+            windows.move_to_end((from_ts, to_ts))
+        else:
+            series = self.store.open(serial_no) if self.store is not None else None
+            if series is not None:
+                baseline, counters = energy.counters_from_series(series.timestamps, series.values, start, hours)
+            else:
+                baseline, counters = self._meter_counters_from_db(serial_no, start, hours)
+            hourly = windows[(from_ts, to_ts)] = energy.consumption_from_counters(baseline, counters)
+            if len(windows) > self.energy_cache_windows:
+                windows.popitem(last=False)
+        return start, hourly
+
+    def _meters(self) -> List[Tuple[str, Optional[str]]]:
+        return self.persistence.cursor.execute(
+            "SELECT d.serial_no, r.name FROM devices d LEFT JOIN rooms r ON r.id = d.room WHERE d.type = 'Strømmåler' "
+            "ORDER BY d.id").fetchall()
+
+    @metrics.timed(metrics.ANALYTICS_QUERIES, query="get_energy_consumption")
+    def get_energy_consumption(self, meter: Device, from_ts: datetime, to_ts: datetime) -> float:
+        """
+        Returns the kWh consumed according to the given smart meter in the given timespan (in whole hours).
+        """
+        return sum(self._hourly_energy(meter.serial_no, from_ts, to_ts)[1])
+
+    @metrics.timed(metrics.ANALYTICS_QUERIES, query="get_hourly_energy_consumption")
+    def get_hourly_energy_consumption(self, meter: Device, from_ts: datetime, to_ts: datetime) -> List[Tuple[datetime, float]]:
+        """
+        Returns (start of the hour, kWh) for every hour of the given timespan.
+        """
+        start, hourly = self._hourly_energy(meter.serial_no, from_ts, to_ts)
+        return [(start + energy.HOUR * h, value) for h, value in enumerate(hourly)]
+
+    @metrics.timed(metrics.ANALYTICS_QUERIES, query="get_energy_consumption_per_device")
+    def get_energy_consumption_per_device(self, from_ts: datetime, to_ts: datetime) -> Dict[str, float]:
+        """
+        Returns the kWh consumed in the given timespan per smart meter serial no.
+        """
+        return {serial_no: sum(self._hourly_energy(serial_no, from_ts, to_ts)[1]) for serial_no, _ in self._meters()}
+
+    @metrics.timed(metrics.ANALYTICS_QUERIES, query="get_energy_consumption_per_room")
+    def get_energy_consumption_per_room(self, from_ts: datetime, to_ts: datetime) -> Dict[str, float]:
+        """
+        Returns the kWh consumed in the given timespan per room that has smart meters.
+        """
+        result: Dict[str, float] = {}
+        for serial_no, room_name in self._meters():
+            if room_name is not None:
+                result[room_name] = result.get(room_name, 0.0) + sum(self._hourly_energy(serial_no, from_ts, to_ts)[1])
+        return result
+
+    def _total_hourly_energy(self, from_ts: datetime, to_ts: datetime, room: Optional[Room]) -> Tuple[datetime, array]:
+        room_name = room.name if isinstance(room, Room) else room
+        start, hours = energy.hour_grid(from_ts, to_ts)
+        total = array("d", bytes(8 * hours))
+        for serial_no, meter_room in self._meters():
+            if room_name is None or meter_room == room_name:
+                energy.add_into(total, self._hourly_energy(serial_no, from_ts, to_ts)[1])
+        return start, total
+
+    @metrics.timed(metrics.ANALYTICS_QUERIES, query="get_energy_peak_hours")
+    def get_energy_peak_hours(self, from_ts: datetime, to_ts: datetime, top: int = 3, room: Room = None) -> List[Tuple[int, float]]:
+        """
+        Returns the `top` hours of the day [0-23] with the highest consumption summed over the timespan,
+        as (hour, kWh) with the highest first, for the whole house or a single room.
+        """
+        start, total = self._total_hourly_energy(from_ts, to_ts, room)
+        return energy.peak_hours(total, start, top)
+
+    @metrics.timed(metrics.ANALYTICS_QUERIES, query="get_daily_energy_consumption")
+    def get_daily_energy_consumption(self, from_ts: datetime, to_ts: datetime, room: Room = None) -> List[Tuple[date, float, Optional[float]]]:
+        """
+        Returns (day, kWh, change from the previous day) for every day of the timespan, for the whole house
+        or a single room.
+        """
+        start, total = self._total_hourly_energy(from_ts, to_ts, room)
+        return energy.daily_totals(total, start)
+
+    def _readings(self, serial_no: str, from_ts: datetime, to_ts: datetime) -> Tuple[Sequence[int], Sequence[float]]:
+        """
+        Epoch timestamps and values of the sensor within [from_ts, to_ts] in time order, plus the last reading
+        before and the first reading after the timespan so the ends can be filled.
+        """
+        series = self.store.open(serial_no) if self.store is not None else None
+        if series is not None:
+            lo = max(0, bisect.bisect_left(series.timestamps, to_epoch(from_ts)) - 1)
+            hi = bisect.bisect_right(series.timestamps, to_epoch(to_ts)) + 1
+            return series.timestamps[lo:hi], series.values[lo:hi]
+        # the archive holds the readings older than the ones in the database, so the reading before the timespan
+        # is taken from the archive when the database has none and the one after from the database when the
+        # archive has none
+        archive = self.persistence.archive
+        timestamps, values = array("q"), array("d")
+        start, end = from_ts.isoformat(), to_ts.isoformat()
+        cursor = self.persistence.cursor
+        before = cursor.execute("SELECT time_stamp, value FROM measurements WHERE serial_no = ? AND time_stamp < ? "
+                                "ORDER BY time_stamp DESC LIMIT 1", (serial_no, start)).fetchall()
+        if archive is not None:
+            if not before:
+                reading = archive.last_before(serial_no, from_ts)
+                if reading is not None:
+                    timestamps.append(reading[0])
+                    values.append(reading[1])
+            archived_ts, archived_values = archive.read(serial_no, from_ts, to_ts)
+            timestamps.extend(archived_ts)
+            values.extend(archived_values)
+        rows = before + cursor.execute("SELECT time_stamp, value FROM measurements WHERE serial_no = ? AND time_stamp >= ? "
+                                       "AND time_stamp <= ? ORDER BY time_stamp", (serial_no, start, end)).fetchall()
+        after = archive.first_after(serial_no, to_ts) if archive is not None else None
+        if after is None:
+            rows += cursor.execute("SELECT time_stamp, value FROM measurements WHERE serial_no = ? AND time_stamp > ? "
+                                   "ORDER BY time_stamp LIMIT 1", (serial_no, end)).fetchall()
+        timestamps.extend(to_epoch(r[0]) for r in rows)
+        values.extend(math.nan if r[1] is None else r[1] for r in rows)
+        if after is not None:
+            timestamps.append(after[0])
+            values.append(after[1])
+        return timestamps, values
+
+    @metrics.timed(metrics.ANALYTICS_QUERIES, query="resample_sensor")
+    def resample_sensor(self, sensor: Device, from_ts: datetime, to_ts: datetime, step: timedelta = timedelta(minutes=1),
+                        method: str = resample.FORWARD_FILL) -> Tuple[array, array]:
+        """
+        Returns the readings of the sensor as a fixed-interval series: the epoch timestamps from_ts, from_ts + step,
+        ... up to to_ts and one value for each, NaN where there is nothing to fill from. The method is
+        resample.FORWARD_FILL (last reading at or before the point), resample.LINEAR (interpolated between the
+        readings around the point) or resample.MEAN (average of the readings in [point, point + step), also for
+        the last point, so its bucket reaches past to_ts).
+        """
+        if method not in resample.METHODS:
+            raise ValueError(f"Unknown resampling method {method}!")
+        start, seconds, n = resample.grid(from_ts, to_ts, step)
+        if method == resample.MEAN and n:
+            to_ts = max(to_ts, from_epoch(start + seconds * n - 1))
+        timestamps, values = self._readings(sensor.serial_no, from_ts, to_ts)
+        return resample.points(start, seconds, n), resample.resample(timestamps, values, start, seconds, n, method)
+
+    @metrics.timed(metrics.ANALYTICS_QUERIES, query="get_room_frame")
+    def get_room_frame(self, room: Room, from_ts: datetime, to_ts: datetime, sensor_types: List[str] = None,
+                       tolerance: timedelta = None) -> Frame:
+        """
+        Returns the readings of the sensors in the room within [from_ts, to_ts] aligned by time: one column per
+        sensor holding its last reading at or before every time any of them reported (as-of join), NaN before
+        its first reading or when that reading is older than the tolerance. Only devices of the given types
+        are included if sensor_types is given, devices without readings are left out.
+        """
+        room_name = room.name if isinstance(room, Room) else room
+        devices = self.persistence.cursor.execute(
+            "SELECT d.serial_no, d.type FROM devices d INNER JOIN rooms r ON r.id = d.room WHERE r.name = ? ORDER BY d.id",
+            (room_name,)).fetchall()
+        series = {}
+        types = {}
+        for serial_no, type_name in devices:
+            if sensor_types is not None and type_name not in sensor_types:
+                continue
+            timestamps, values = self._readings(serial_no, from_ts, to_ts)
+            if len(timestamps):
+                series[serial_no] = (timestamps, values)
+                types[serial_no] = type_name
+        return Frame.join(series, to_epoch(from_ts), to_epoch(to_ts),
+                          None if tolerance is None else int(tolerance.total_seconds()), types)
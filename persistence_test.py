@@ -1,11 +1,14 @@
 import unittest
+from unittest import mock
 from pathlib import Path
+from devices import LightBulb
 from persistence import SmartHousePersistence, SmartHouseAnalytics
-from main import load_demo_house
+from main import build_demo_house, do_move, load_demo_house, load_house
 from datetime import datetime, date
+from testcase import DemoDatabaseTestCase
 
 
-class PersistenceTest(unittest.TestCase):
+class PersistenceTest(DemoDatabaseTestCase):
     file_path = str(Path(__file__).parent.absolute()) + "/db.sqlite"
     p = SmartHousePersistence(file_path)
     house = load_demo_house(p)
@@ -30,6 +33,113 @@ class PersistenceTest(unittest.TestCase):
         devices = PersistenceTest.house.get_all_devices_in_room(kitchen)
         self.assertEqual(8, len(devices))
 
+    def test_loading_house(self):
+        house = load_house(PersistenceTest.p)
+        self.assertEqual(12, house.get_no_of_rooms())
+        self.assertEqual(31, house.get_no_of_devices())
+        self.assertEqual(8, house.get_no_of_sensors())
+        self.assertEqual(156.55, house.get_total_area())
+        dev15 = house.find_device_by_serial_no("c28b6e75-d565-4678")
+        self.assertEqual(8, len(house.get_room_with_device(dev15)))
+
+    def test_saving_demo_house_moves(self):
+        p = SmartHousePersistence(self.db_file)
+        house = build_demo_house()
+        # the demo house is what is stored, saving it does not insert it again
+        self.assertEqual(0, p.save_topology(house))
+        bulb = house.find_device_by_serial_no("6a36c71d-4f48-4eb4")
+        with mock.patch("builtins.input", side_effect=[bulb.serial_no, "5"]):
+            do_move(house, p)
+        loaded = load_house(SmartHousePersistence(self.db_file))
+        self.assertEqual((12, 31), (loaded.get_no_of_rooms(), loaded.get_no_of_devices()))
+        self.assertEqual(house.room_index.get(5).name,
+                         loaded.get_room_with_device(loaded.find_device_by_serial_no(bulb.serial_no)).name)
+
+    def test_saving_topology(self):
+        p = SmartHousePersistence(self.db_file)
+        house = load_house(p)
+        self.assertEqual(0, len(house.changes))
+        dev4 = house.find_device_by_serial_no("6a36c71d-4f48-4eb4")
+        rooms = house.get_all_rooms()
+        for i in range(300):
+            house.move_device(dev4, house.get_room_with_device(dev4), rooms[i % len(rooms)])
+        attic = house.create_room(2, 12.5, "Attic")
+        house.register_device(LightBulb("00000000-0000-0001", "Fritsch Group", "Alphazap 3"), attic)
+        house.move_device(dev4, house.get_room_with_device(dev4), attic)
+        self.assertEqual(303, p.save_topology(house))
+        self.assertEqual(0, len(house.changes))
+
+        loaded = load_house(SmartHousePersistence(self.db_file))
+        self.assertEqual(13, loaded.get_no_of_rooms())
+        self.assertEqual(32, loaded.get_no_of_devices())
+        room = loaded.get_room_with_device(loaded.find_device_by_serial_no("6a36c71d-4f48-4eb4"))
+        self.assertEqual("Attic", room.name)
+        self.assertEqual(13, room.room_id)
+        self.assertEqual(2, len(room))
+
+    def test_transaction(self):
+        p = SmartHousePersistence(self.db_file)
+        house = load_house(p)
+        light = house.find_device_by_serial_no("627ff5f3-f4f5-47bd")
+        heat_pump = house.find_device_by_serial_no("eed2cba8-eb13-4023")
+        other = SmartHousePersistence(self.db_file)
+
+        def state(serial_no):
+            return other.cursor.execute("SELECT value FROM device_state WHERE serial_no = ?",
+                                        (serial_no,)).fetchall()[0][0]
+
+        with p.transaction():
+            light.turn_on()
+            # reads inside the block see its uncommitted writes
+            self.assertEqual("ON", light.get_status_message())
+            with p.transaction():
+                heat_pump.set_temperature(24.5)
+                p.add_measurements([("2023-02-16T08:00:00", 8, 21.0, "e237beec-2675-4cb0")])
+            house.move_device(light, house.get_room_with_device(light), house.get_all_rooms()[0])
+            p.save_topology(house)
+            # nothing is visible to other connections before the end of the outermost block
+            self.assertEqual(0, state("627ff5f3-f4f5-47bd"))
+        self.assertEqual(1, state("627ff5f3-f4f5-47bd"))
+        self.assertEqual(24.5, state("eed2cba8-eb13-4023"))
+        self.assertEqual(1, other.cursor.execute("SELECT COUNT(*) FROM measurements WHERE time_stamp = "
+                                                 "'2023-02-16T08:00:00'").fetchall()[0][0])
+        self.assertEqual(house.get_all_rooms()[0].room_id, other.cursor.execute(
+            "SELECT room FROM devices WHERE serial_no = '627ff5f3-f4f5-47bd'").fetchall()[0][0])
+
+        first_room, last_room = house.get_all_rooms()[0], house.get_all_rooms()[-1]
+        analytics = SmartHouseAnalytics(p)
+        temperatures = analytics.describe_temperature_in_rooms()
+        received = []
+        p.measurement_listeners.append(lambda *row: received.append(row))
+        with self.assertRaises(RuntimeError):
+            with p.transaction():
+                p.add_measurements([("2023-02-16T09:00:00", 8, -100.0, "e237beec-2675-4cb0")])
+                light.turn_off()
+                heat_pump.set_temperature(18.0)
+                house.move_device(light, first_room, last_room)
+                self.assertEqual(1, p.save_topology(house))
+                raise RuntimeError()
+        self.assertEqual(1, state("627ff5f3-f4f5-47bd"))
+        self.assertEqual(24.5, state("eed2cba8-eb13-4023"))
+        # listeners never see rolled back readings
+        self.assertEqual([], received)
+        self.assertEqual(temperatures, analytics.describe_temperature_in_rooms())
+        with p.transaction():
+            p.add_measurements([("2023-02-16T09:00:00", 8, 30.0, "e237beec-2675-4cb0")])
+            self.assertEqual([], received)
+        self.assertEqual([("2023-02-16T09:00:00", 8, 30.0, "e237beec-2675-4cb0")], received)
+        self.assertEqual(30.0, analytics.describe_temperature_in_rooms()["Entrance"][1])
+        # the rolled back move is pending again and can be saved later
+        self.assertEqual(1, len(house.changes))
+        self.assertEqual(first_room.room_id, other.cursor.execute(
+            "SELECT room FROM devices WHERE serial_no = '627ff5f3-f4f5-47bd'").fetchall()[0][0])
+        self.assertEqual(1, p.save_topology(house))
+        self.assertEqual(last_room.room_id, other.cursor.execute(
+            "SELECT room FROM devices WHERE serial_no = '627ff5f3-f4f5-47bd'").fetchall()[0][0])
+        # outside a block every command commits on its own again
+        light.turn_off()
+        self.assertEqual(0, state("627ff5f3-f4f5-47bd"))
+
     def test_updating_sensor_state(self):
         bedroom = PersistenceTest.house.get_room_with_device(
             PersistenceTest.house.find_device_by_serial_no("627ff5f3-f4f5-47bd"))
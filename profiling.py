@@ -0,0 +1,270 @@
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import database
+
+# Upper bounds (in milliseconds) of the latency histogram buckets
+BUCKETS = [0.01, 0.05, 0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, float("inf")]
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r"\s+")
+_IGNORED_FILES = {os.path.abspath(__file__), os.path.abspath(database.__file__)}
+
+
+def normalize(sql: str) -> str:
+    """
+    Replaces string and number literals with '?' so that statements built with f-strings
+    (e.g. one per serial number) are counted as the same statement.
+    """
+    return _WHITESPACE.sub(" ", _LITERALS.sub("?", sql)).strip()
+
+
+def _call_site(depth: int) -> str:
+    """
+    Describes the innermost `depth` application frames that led to the statement, innermost first,
+    e.g. "devices.py:286 (get_status_message) < devices.py:81 (__repr__) < main.py:324 (do_device_list)".
+    """
+    frames = []
+    frame = sys._getframe(1)
+    while frame is not None and len(frames) < depth:
+        filename = frame.f_code.co_filename
+        if os.path.abspath(filename) not in _IGNORED_FILES:
+            frames.append(f"{os.path.basename(filename)}:{frame.f_lineno} ({frame.f_code.co_name})")
+        frame = frame.f_back
+    return " < ".join(frames) if frames else "<unknown>"
+
+
+class QueryRecord:
+    __slots__ = ['sql', 'call_site', 'elapsed', 'rows']
+
+    def __init__(self, sql: str, call_site: str, elapsed: float, rows: int):
+        self.sql = sql
+        self.call_site = call_site
+        self.elapsed = elapsed  # seconds, including fetching the result rows
+        self.rows = rows
+
+
+class StatementStats:
+
+    def __init__(self, statement: str):
+        self.statement = statement
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.histogram = [0] * len(BUCKETS)
+        self.call_sites: Dict[str, int] = {}
+
+    def add(self, record: QueryRecord):
+        self.count += 1
+        self.total += record.elapsed
+        self.max = max(self.max, record.elapsed)
+        self.rows += record.rows
+        millis = record.elapsed * 1000
+        for i, bound in enumerate(BUCKETS):
+            if millis <= bound:
+                self.histogram[i] += 1
+                break
+        self.call_sites[record.call_site] = self.call_sites.get(record.call_site, 0) + 1
+
+    def to_dict(self) -> dict:
+        return {
+            "statement": self.statement,
+            "count": self.count,
+            "total_ms": self.total * 1000,
+            "mean_ms": self.total * 1000 / self.count,
+            "max_ms": self.max * 1000,
+            "rows": self.rows,
+            "histogram_ms": {str(b): n for b, n in zip(BUCKETS, self.histogram)},
+            "call_sites": self.call_sites
+        }
+
+
+class ProfilingCursor(sqlite3.Cursor):
+
+    def _start(self, sql: str):
+        profiler = self.connection.profiler
+        self._record = QueryRecord(sql, _call_site(profiler.stack_depth), 0.0, 0)
+        profiler.records.append(self._record)
+        return time.perf_counter()
+
+    def _fetched(self, started: float, rows: int):
+        record = getattr(self, "_record", None)
+        if record is not None:
+            record.elapsed += time.perf_counter() - started
+            record.rows += rows
+
+    def execute(self, sql, parameters=()):
+        started = self._start(sql)
+        super().execute(sql, parameters)
+        self._record.elapsed = time.perf_counter() - started
+        if self.rowcount > 0:
+            self._record.rows = self.rowcount
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        started = self._start(sql)
+        super().executemany(sql, seq_of_parameters)
+        self._record.elapsed = time.perf_counter() - started
+        self._record.rows = max(self.rowcount, 0)
+        return self
+
+    def executescript(self, sql_script):
+        started = self._start(sql_script)
+        super().executescript(sql_script)
+        self._record.elapsed = time.perf_counter() - started
+        return self
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows))
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        row = super().__next__()
+        self._fetched(started, 1)
+        return row
+
+
+class ProfilingConnection(sqlite3.Connection):
+
+    def __init__(self, *args, profiler: "QueryProfiler" = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.profiler = profiler
+
+    def cursor(self, factory=ProfilingCursor):
+        return super().cursor(factory)
+
+    # the shortcuts of sqlite3.Connection create their cursors internally, bypassing cursor()
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+class QueryProfiler:
+    """
+    Opt-in recorder for all SQL statements issued through database.connect().
+    Connections opened while the profiler is installed record every statement together with
+    its duration, number of rows and the call site (the innermost `stack_depth` frames outside
+    the database layer) that issued it:
+
+        with QueryProfiler() as profiler:
+            do_device_list(house)
+        print(profiler.summary())
+    """
+
+    def __init__(self, stack_depth: int = 3):
+        self.stack_depth = stack_depth
+        self.records: List[QueryRecord] = []
+        self._previous_factory = None
+
+    def _connect(self, db_file: str, **kwargs) -> ProfilingConnection:
+        return ProfilingConnection(db_file, profiler=self, **kwargs)
+
+    def install(self):
+        self._previous_factory = database.connection_factory
+        database.connection_factory = self._connect
+
+    def uninstall(self):
+        database.connection_factory = self._previous_factory
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.uninstall()
+
+    def reset(self):
+        self.records.clear()
+
+    def statistics(self) -> List[StatementStats]:
+        """
+        Returns per-statement aggregates, the statements with the highest total time first.
+        """
+        stats: Dict[str, StatementStats] = {}
+        for record in self.records:
+            statement = normalize(record.sql)
+            if statement not in stats:
+                stats[statement] = StatementStats(statement)
+            stats[statement].add(record)
+        return sorted(stats.values(), key=lambda s: s.total, reverse=True)
+
+    def n_plus_one(self, threshold: int = 10) -> List[Tuple[str, str, int]]:
+        """
+        Finds statements that are issued repeatedly from the same call site with different literals or
+        parameters, which usually means a query per item inside a loop (N+1 queries).
+        Returns (call site, statement, number of executions) with the most frequent first.
+        """
+        counts: Dict[Tuple[str, str], int] = {}
+        variants: Dict[Tuple[str, str], set] = {}
+        for record in self.records:
+            key = (record.call_site, normalize(record.sql))
+            counts[key] = counts.get(key, 0) + 1
+            variants.setdefault(key, set()).add(record.sql)
+        result = [(site, statement, n) for (site, statement), n in counts.items()
+                  if n >= threshold and (len(variants[(site, statement)]) > 1 or "?" in statement)]
+        return sorted(result, key=lambda r: r[2], reverse=True)
+
+    def export(self, threshold: int = 10) -> dict:
+        return {
+            "statements": [s.to_dict() for s in self.statistics()],
+            "n_plus_one": [{"call_site": site, "statement": statement, "count": n}
+                           for site, statement, n in self.n_plus_one(threshold)]
+        }
+
+    def export_json(self, file_path: str, threshold: int = 10):
+        with open(file_path, "w") as f:
+            json.dump(self.export(threshold), f, indent=2)
+
+    def summary(self, limit: Optional[int] = 10) -> str:
+        lines = [f"{'count':>7} {'total ms':>10} {'mean ms':>9} {'rows':>8}  statement"]
+        for s in self.statistics()[:limit]:
+            lines.append(f"{s.count:>7} {s.total * 1000:>10.2f} {s.total * 1000 / s.count:>9.3f} {s.rows:>8}  "
+                         f"{s.statement[:80]}")
+        suspects = self.n_plus_one()
+        if suspects:
+            lines.append("")
+            lines.append("Possible N+1 query patterns:")
+            for site, statement, n in suspects:
+                lines.append(f"{n:>7}x {site}: {statement[:80]}")
+        return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    import contextlib
+    import io
+    import main
+    from persistence import SmartHousePersistence
+
+    with QueryProfiler() as profiler:
+        house = main.load_house(SmartHousePersistence(database.DEFAULT_DB_FILE))
+        with contextlib.redirect_stdout(io.StringIO()):
+            main.do_device_list(house)
+    print(profiler.summary())
+    if len(sys.argv) > 1:
+        profiler.export_json(sys.argv[1])
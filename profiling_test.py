@@ -0,0 +1,56 @@
+import unittest
+from pathlib import Path
+import database
+from persistence import SmartHousePersistence
+from profiling import QueryProfiler, normalize
+from main import load_house
+from testcase import DemoDatabaseTestCase
+
+
+class ProfilingTest(DemoDatabaseTestCase):
+    file_path = str(Path(__file__).parent.absolute()) + "/db.sqlite"
+
+    def test_normalize(self):
+        self.assertEqual("SELECT value FROM device_state WHERE serial_no = ? AND value > ?",
+                         normalize("SELECT value FROM device_state\n WHERE serial_no = 'f11b''b4' AND value > 1.5"))
+
+    def test_install_and_uninstall(self):
+        factory = database.connection_factory
+        with QueryProfiler():
+            self.assertNotEqual(factory, database.connection_factory)
+        self.assertEqual(factory, database.connection_factory)
+
+    def test_recording_statements(self):
+        with QueryProfiler() as profiler:
+            house = load_house(SmartHousePersistence(ProfilingTest.file_path))
+            for device in house.get_all_devices():
+                device.__repr__()
+        stats = {s.statement: s for s in profiler.statistics()}
+        rooms = stats["SELECT id, floor, area, name FROM rooms ORDER BY id"]
+        self.assertEqual(1, rooms.count)
+        self.assertEqual(12, rooms.rows)
+        self.assertTrue(all("test_recording_statements" in site for site in rooms.call_sites))
+        suspects = profiler.n_plus_one(threshold=10)
+        self.assertEqual(1, len(suspects))
+        self.assertEqual("SELECT value FROM device_state WHERE serial_no=?", suspects[0][1])
+        self.assertIn("get_status_message", suspects[0][0])
+
+
+    def test_recording_connection_shortcuts(self):
+        house = load_house(SmartHousePersistence(self.db_file))
+        light = house.find_device_by_serial_no("627ff5f3-f4f5-47bd")
+        with QueryProfiler() as profiler:
+            light.turn_on()
+            connection = database.connect(self.db_file)
+            self.assertEqual([(1,)], connection.execute("SELECT 1").fetchall())
+            connection.close()
+        stats = {s.statement: s for s in profiler.statistics()}
+        update = stats["UPDATE device_state SET value = ? WHERE serial_no = ?"]
+        self.assertEqual(1, update.count)
+        self.assertEqual(1, update.rows)
+        self.assertTrue(all("turn_on" in site for site in update.call_sites))
+        self.assertEqual(1, stats["SELECT ?"].rows)
+
+
+if __name__ == '__main__':
+    unittest.main()
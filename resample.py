@@ -0,0 +1,108 @@
+import bisect
+import math
+from array import array
+from datetime import datetime, timedelta
+from typing import Sequence, Tuple
+
+from archive import to_epoch
+
+# Turns the irregular readings of a sensor (sorted epoch timestamps and values, NaN for NULL) into a series
+# with one value per `step` seconds starting at `start`. Every method walks the readings and the grid
+# together once, so resampling costs O(readings + points) whatever the step.
+
+FORWARD_FILL = "ffill"  # the last reading at or before each point
+LINEAR = "linear"  # interpolated between the readings around each point
+MEAN = "mean"  # the average of the readings within [point, point + step)
+METHODS = (FORWARD_FILL, LINEAR, MEAN)
+
+
+def grid(from_ts: datetime, to_ts: datetime, step: timedelta) -> Tuple[int, int, int]:
+    """
+    Returns (first point, step, number of points) in epoch seconds for the points from_ts, from_ts + step, ...
+    up to and including to_ts.
+    """
+    seconds = int(step.total_seconds())
+    if seconds <= 0:
+        raise ValueError("The step must be at least one second!")
+    start = to_epoch(from_ts)
+    return start, seconds, max(0, (to_epoch(to_ts) - start) // seconds + 1)
+
+
+def points(start: int, step: int, n: int) -> array:
+    return array("q", range(start, start + step * n, step))
+
+
+def _without_missing(timestamps: Sequence[int], values: Sequence[float]) -> Tuple[Sequence[int], Sequence[float]]:
+    if all(v == v for v in values):
+        return timestamps, values
+    kept = [i for i, v in enumerate(values) if v == v]
+    return array("q", (timestamps[i] for i in kept)), array("d", (values[i] for i in kept))
+
+
+def forward_fill(timestamps: Sequence[int], values: Sequence[float], start: int, step: int, n: int) -> array:
+    timestamps, values = _without_missing(timestamps, values)
+    result = array("d", [math.nan]) * n
+    i = bisect.bisect_right(timestamps, start) - 1  # last reading at or before the first point
+    count = len(timestamps)
+    t = start
+    for p in range(n):
+        while i + 1 < count and timestamps[i + 1] <= t:
+            i += 1
+        if i >= 0:
+            result[p] = values[i]
+        t += step
+    return result
+
+
+def interpolate(timestamps: Sequence[int], values: Sequence[float], start: int, step: int, n: int) -> array:
+    """
+    Linear interpolation, NaN for points before the first or after the last reading.
+    """
+    timestamps, values = _without_missing(timestamps, values)
+    result = array("d", [math.nan]) * n
+    i = bisect.bisect_right(timestamps, start) - 1
+    count = len(timestamps)
+    t = start
+    for p in range(n):
+        while i + 1 < count and timestamps[i + 1] <= t:
+            i += 1
+        if i >= 0:
+            if timestamps[i] == t:
+                result[p] = values[i]
+            elif i + 1 < count:
+                t0, t1 = timestamps[i], timestamps[i + 1]
+                result[p] = values[i] + (values[i + 1] - values[i]) * (t - t0) / (t1 - t0)
+        t += step
+    return result
+
+
+def bucket_means(timestamps: Sequence[int], values: Sequence[float], start: int, step: int, n: int) -> array:
+    """
+    Average of the readings per bucket [point, point + step), NaN for buckets without readings.
+    """
+    timestamps, values = _without_missing(timestamps, values)
+    result = array("d", [math.nan]) * n
+    i = bisect.bisect_left(timestamps, start)
+    count = len(timestamps)
+    end = start + step
+    for p in range(n):
+        total = 0.0
+        readings = 0
+        while i < count and timestamps[i] < end:
+            total += values[i]
+            readings += 1
+            i += 1
+        if readings:
+            result[p] = total / readings
+        end += step
+    return result
+
+
+RESAMPLERS = {FORWARD_FILL: forward_fill, LINEAR: interpolate, MEAN: bucket_means}
+
+
+def resample(timestamps: Sequence[int], values: Sequence[float], start: int, step: int, n: int,
+             method: str = FORWARD_FILL) -> array:
+    if method not in RESAMPLERS:
+        raise ValueError(f"Unknown resampling method {method}!")
+    return RESAMPLERS[method](timestamps, values, start, step, n)
@@ -0,0 +1,85 @@
+import math
+import os
+import tempfile
+import unittest
+from array import array
+from datetime import datetime, timedelta
+from pathlib import Path
+import resample
+from archive import to_epoch
+from devices import TemperatureSensor
+from persistence import SmartHousePersistence, SmartHouseAnalytics
+from timeseries import TimeSeriesStore
+
+
+class ResampleTest(unittest.TestCase):
+    file_path = str(Path(__file__).parent.absolute()) + "/db.sqlite"
+
+    def test_methods(self):
+        # readings at 61, 121, 130 (missing) and 300 seconds
+        timestamps = array("q", [61, 121, 130, 300])
+        values = array("d", [1.0, 3.0, math.nan, 5.0])
+        start, step, n = 0, 60, 7  # points 0, 60, ..., 360
+
+        def same(expected, actual):
+            self.assertEqual(len(expected), len(actual))
+            for e, a in zip(expected, actual):
+                if math.isnan(e):
+                    self.assertTrue(math.isnan(a))
+                else:
+                    self.assertAlmostEqual(e, a)
+
+        nan = math.nan
+        same([nan, nan, 1.0, 3.0, 3.0, 5.0, 5.0], resample.forward_fill(timestamps, values, start, step, n))
+        same([nan, nan, 1 + 2 * 59 / 60, 3 + 2 * 59 / 179, 3 + 2 * 119 / 179, 5.0, nan],
+             resample.interpolate(timestamps, values, start, step, n))
+        same([nan, 1.0, 3.0, nan, nan, 5.0, nan], resample.bucket_means(timestamps, values, start, step, n))
+        self.assertEqual((120, 60, 3), resample.grid(datetime(1970, 1, 1, 0, 2), datetime(1970, 1, 1, 0, 4, 59),
+                                                      timedelta(minutes=1)))
+        self.assertRaises(ValueError, resample.resample, timestamps, values, start, step, n, "nearest")
+
+    def test_resample_sensor(self):
+        p = SmartHousePersistence(ResampleTest.file_path)
+        analytics = SmartHouseAnalytics(p)
+        sensor = TemperatureSensor("e237beec-2675-4cb0", "", "", "", device_id=8)
+        from_ts, to_ts = datetime(2023, 2, 14, 5, 30), datetime(2023, 2, 14, 18)
+        step = timedelta(minutes=15)
+        points, filled = analytics.resample_sensor(sensor, from_ts, to_ts, step)
+        self.assertEqual(51, len(points))
+        self.assertEqual(to_epoch(from_ts), points[0])
+        self.assertEqual(to_epoch(to_ts), points[-1])
+        # spot check against one query per point
+        for i in (0, 17, 50):
+            ts = (from_ts + step * i).isoformat()
+            expected = p.cursor.execute("SELECT value FROM measurements WHERE serial_no = ? AND time_stamp <= ? "
+                                        "ORDER BY time_stamp DESC LIMIT 1", (sensor.serial_no, ts)).fetchall()
+            self.assertEqual(expected[0][0], filled[i])
+
+        means = analytics.resample_sensor(sensor, from_ts, to_ts, step, resample.MEAN)[1]
+        first = p.cursor.execute("SELECT AVG(value) FROM measurements WHERE serial_no = ? AND time_stamp >= ? "
+                                 "AND time_stamp < ?", (sensor.serial_no, from_ts.isoformat(),
+                                                        (from_ts + step).isoformat())).fetchall()[0][0]
+        if first is None:
+            self.assertTrue(math.isnan(means[0]))
+        else:
+            self.assertAlmostEqual(first, means[0])
+        # the bucket of the last point is complete although it ends after to_ts
+        last = p.cursor.execute("SELECT AVG(value) FROM measurements WHERE serial_no = ? AND time_stamp >= ? "
+                                "AND time_stamp < ?", (sensor.serial_no, to_ts.isoformat(),
+                                                       (to_ts + step).isoformat())).fetchall()[0][0]
+        self.assertAlmostEqual(last, means[-1])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            store = TimeSeriesStore(tmp)
+            store.build(p)
+            stored = SmartHouseAnalytics(p, store)
+            for method in resample.METHODS:
+                expected = analytics.resample_sensor(sensor, from_ts, to_ts, step, method)[1]
+                actual = stored.resample_sensor(sensor, from_ts, to_ts, step, method)[1]
+                self.assertEqual([None if math.isnan(v) else v for v in expected],
+                                 [None if math.isnan(v) else v for v in actual])
+            store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+import threading
+from datetime import datetime, timedelta
+from sqlite3 import Connection
+from typing import Dict, Optional
+
+import database
+
+ROLLUP_TABLES = """
+    CREATE TABLE IF NOT EXISTS measurements_hourly(
+        serial_no TEXT NOT NULL,
+        device INT NOT NULL,
+        period TEXT NOT NULL,
+        min REAL, max REAL, sum REAL, count INT NOT NULL,
+        PRIMARY KEY (serial_no, period)
+    );
+    CREATE TABLE IF NOT EXISTS measurements_daily(
+        serial_no TEXT NOT NULL,
+        device INT NOT NULL,
+        period TEXT NOT NULL,
+        min REAL, max REAL, sum REAL, count INT NOT NULL,
+        PRIMARY KEY (serial_no, period)
+    );
+"""
+
+# Rollups store sum and count instead of the average, so partial aggregates of the same period can be merged.
+# min and max are NULL for periods with NULL readings only, and the scalar MIN()/MAX() return NULL if either is.
+_MERGE = """
+    ON CONFLICT (serial_no, period) DO UPDATE SET
+        min = COALESCE(MIN(min, excluded.min), min, excluded.min),
+        max = COALESCE(MAX(max, excluded.max), max, excluded.max),
+        sum = sum + excluded.sum,
+        count = count + excluded.count
+"""
+
+
+class RetentionPolicy:
+    """
+    How long the readings of a device type are kept at each resolution. None means forever.
+    """
+
+    def __init__(self, raw: Optional[timedelta] = timedelta(days=30),
+                 hourly: Optional[timedelta] = timedelta(days=365),
+                 daily: Optional[timedelta] = None):
+        self.raw = raw
+        self.hourly = hourly
+        self.daily = daily
+
+
+DEFAULT_POLICY = RetentionPolicy()
+
+
+def create_rollup_tables(connection: Connection):
+    connection.executescript(ROLLUP_TABLES)
+
+
+class Compactor:
+    """
+    Enforces retention policies (keyed by the device type names stored in the devices table) on a database:
+    raw readings older than the raw retention are rolled up into hourly aggregates, hourly aggregates older
+    than the hourly retention into daily ones, and daily aggregates older than the daily retention are deleted.
+    Every step works on at most batch_size rows per transaction so writers are never blocked for long.
+    Readings of devices that are not (or no longer) in the devices table fall under the default policy.
+    """
+
+    def __init__(self, connection: Connection, policies: Dict[str, RetentionPolicy],
+                 default: Optional[RetentionPolicy] = DEFAULT_POLICY, batch_size: int = 10_000):
+        self.connection = connection
+        self.policies = policies
+        self.default = default
+        self.batch_size = batch_size
+        create_rollup_tables(connection)
+
+    def _policies_by_type(self) -> Dict[Optional[str], RetentionPolicy]:
+        """
+        The policy per device type, None standing for the readings of unknown devices.
+        """
+        result = {}
+        for (device_type,) in self.connection.execute("SELECT DISTINCT type FROM devices").fetchall():
+            policy = self.policies.get(device_type, self.default)
+            if policy is not None:
+                result[device_type] = policy
+        if self.default is not None:
+            result[None] = self.default
+        return result
+
+    def _raw_batch(self, device_type: Optional[str], cutoff: str) -> int:
+        # LEFT JOIN and IS, so that device type None selects the readings of unknown devices (as in all batches)
+        batch = ("SELECT m.rowid FROM measurements m LEFT JOIN devices d ON d.id = m.device "
+                 "WHERE d.type IS ? AND m.time_stamp < ? ORDER BY m.rowid LIMIT ?")
+        parameters = (device_type, cutoff, self.batch_size)
+        with self.connection:
+            self.connection.execute(
+                f"INSERT INTO measurements_hourly (serial_no, device, period, min, max, sum, count) "
+                f"SELECT serial_no, device, SUBSTR(time_stamp, 1, 13), MIN(value), MAX(value), TOTAL(value), COUNT(value) "
+                f"FROM measurements WHERE rowid IN ({batch}) GROUP BY serial_no, SUBSTR(time_stamp, 1, 13) {_MERGE}",
+                parameters)
+            return self.connection.execute(f"DELETE FROM measurements WHERE rowid IN ({batch})", parameters).rowcount
+
+    def _hourly_batch(self, device_type: Optional[str], cutoff: str) -> int:
+        batch = ("SELECT h.rowid FROM measurements_hourly h LEFT JOIN devices d ON d.id = h.device "
+                 "WHERE d.type IS ? AND h.period < ? ORDER BY h.rowid LIMIT ?")
+        parameters = (device_type, cutoff, self.batch_size)
+        with self.connection:
+            self.connection.execute(
+                f"INSERT INTO measurements_daily (serial_no, device, period, min, max, sum, count) "
+                f"SELECT serial_no, device, SUBSTR(period, 1, 10), MIN(min), MAX(max), TOTAL(sum), SUM(count) "
+                f"FROM measurements_hourly WHERE rowid IN ({batch}) GROUP BY serial_no, SUBSTR(period, 1, 10) {_MERGE}",
+                parameters)
+            return self.connection.execute(f"DELETE FROM measurements_hourly WHERE rowid IN ({batch})",
+                                           parameters).rowcount
+
+    def _daily_batch(self, device_type: Optional[str], cutoff: str) -> int:
+        with self.connection:
+            return self.connection.execute(
+                "DELETE FROM measurements_daily WHERE rowid IN (SELECT dd.rowid FROM measurements_daily dd "
+                "LEFT JOIN devices d ON d.id = dd.device WHERE d.type IS ? AND dd.period < ? LIMIT ?)",
+                (device_type, cutoff, self.batch_size)).rowcount
+
+    def steps(self, now: datetime = None):
+        """
+        Yields the number of rows handled by each batch until all policies are satisfied.
+        """
+        now = now or datetime.now()
+        for device_type, policy in self._policies_by_type().items():
+            # cutoffs are aligned to whole hours/days so that no period is split between two resolutions
+            if policy.raw is not None:
+                cutoff = (now - policy.raw).strftime("%Y-%m-%dT%H")
+                while n := self._raw_batch(device_type, cutoff):
+                    yield n
+            if policy.hourly is not None:
+                cutoff = (now - policy.hourly).strftime("%Y-%m-%d")
+                while n := self._hourly_batch(device_type, cutoff):
+                    yield n
+            if policy.daily is not None:
+                cutoff = (now - policy.daily).strftime("%Y-%m-%d")
+                while n := self._daily_batch(device_type, cutoff):
+                    yield n
+
+    def compact(self, now: datetime = None) -> int:
+        """
+        Runs all batches at once and returns the number of rows handled.
+        """
+        return sum(self.steps(now))
+
+
+class CompactionJob(threading.Thread):
+    """
+    Background thread that runs a Compactor on its own connection every `interval` seconds,
+    pausing `pause` seconds between two batches to let other writers in.
+    """
+
+    def __init__(self, db_file: str, policies: Dict[str, RetentionPolicy],
+                 default: Optional[RetentionPolicy] = DEFAULT_POLICY, batch_size: int = 10_000,
+                 interval: float = 3600, pause: float = 0.05):
+        super().__init__(daemon=True, name="measurement-compaction")
+        self.db_file = db_file
+        self.policies = policies
+        self.default = default
+        self.batch_size = batch_size
+        self.interval = interval
+        self.pause = pause
+        self._stopped = threading.Event()
+
+    def run(self):
+        connection = database.connect(self.db_file)
+        try:
+            compactor = Compactor(connection, self.policies, self.default, self.batch_size)
+            while not self._stopped.is_set():
+                for _ in compactor.steps():
+                    if self._stopped.wait(self.pause):
+                        return
+                self._stopped.wait(self.interval)
+        finally:
+            connection.close()
+
+    def stop(self):
+        self._stopped.set()
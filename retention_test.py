@@ -0,0 +1,68 @@
+import unittest
+from datetime import datetime, timedelta
+import database
+from retention import Compactor, RetentionPolicy
+from testcase import DemoDatabaseTestCase
+
+
+class RetentionTest(DemoDatabaseTestCase):
+    query = "SELECT COUNT(*), TOTAL(m.value) FROM measurements m INNER JOIN devices d ON d.id = m.device WHERE d.type = ?"
+
+    def test_compaction(self):
+        conn = database.connect(self.db_file)
+        count, total = conn.execute(RetentionTest.query, ("Temperatursensor",)).fetchone()
+        humidity = conn.execute(RetentionTest.query, ("Fuktighetssensor",)).fetchone()
+
+        policies = {"Temperatursensor": RetentionPolicy(raw=timedelta(days=1), hourly=timedelta(days=1, hours=12))}
+        compactor = Compactor(conn, policies, default=None, batch_size=500)
+        self.assertTrue(compactor.compact(datetime(2023, 2, 15, 12, 30)) > 0)
+
+        # other device types are untouched
+        self.assertEqual(humidity, conn.execute(RetentionTest.query, ("Fuktighetssensor",)).fetchone())
+        self.assertEqual(0, conn.execute(
+            "SELECT COUNT(*) FROM measurements m INNER JOIN devices d ON d.id = m.device "
+            "WHERE d.type = 'Temperatursensor' AND m.time_stamp < '2023-02-14T12'").fetchone()[0])
+        self.assertEqual(0, conn.execute(
+            "SELECT COUNT(*) FROM measurements_hourly WHERE period < '2023-02-14'").fetchone()[0])
+
+        # nothing is lost, only aggregated
+        raw_count, raw_total = conn.execute(RetentionTest.query, ("Temperatursensor",)).fetchone()
+        hourly_count, hourly_total = conn.execute("SELECT SUM(count), TOTAL(sum) FROM measurements_hourly").fetchone()
+        daily_count, daily_total = conn.execute("SELECT SUM(count), TOTAL(sum) FROM measurements_daily").fetchone()
+        self.assertTrue(daily_count > 0)
+        self.assertEqual(count, raw_count + hourly_count + daily_count)
+        self.assertAlmostEqual(total, raw_total + hourly_total + daily_total, places=3)
+
+        # running again is a no-op
+        self.assertEqual(0, compactor.compact(datetime(2023, 2, 15, 12, 30)))
+        conn.close()
+
+    def test_unknown_devices_and_null_readings(self):
+        conn = database.connect(self.db_file)
+        conn.executemany("INSERT INTO measurements (time_stamp, device, value, serial_no) VALUES (?, ?, ?, ?)",
+                         [("2023-02-01T10:05:00", 999, 1.5, "removed"), ("2023-02-01T10:10:00", 999, 2.5, "removed"),
+                          ("2023-02-01T11:00:00", 999, None, "removed")])
+        conn.commit()
+        # only the unknown device gets the default policy
+        keep = {device_type: None for (device_type,) in conn.execute("SELECT DISTINCT type FROM devices").fetchall()}
+        compactor = Compactor(conn, keep, default=RetentionPolicy(raw=timedelta(days=1), hourly=None), batch_size=1)
+        compactor.compact(datetime(2023, 2, 15))
+        # one reading per batch
+        self.assertEqual(0, conn.execute("SELECT COUNT(*) FROM measurements WHERE serial_no = 'removed'").fetchone()[0])
+        self.assertEqual([("2023-02-01T10", 1.5, 2.5, 4.0, 2), ("2023-02-01T11", None, None, 0.0, 0)], conn.execute(
+            "SELECT period, min, max, sum, count FROM measurements_hourly WHERE serial_no = 'removed' "
+            "ORDER BY period").fetchall())
+
+        # a NULL period merged into one with readings keeps their minimum and maximum
+        conn.execute("INSERT INTO measurements (time_stamp, device, value, serial_no) VALUES (?, ?, ?, ?)",
+                     ("2023-02-01T11:30:00", 999, 7.0, "removed"))
+        conn.commit()
+        compactor.compact(datetime(2023, 2, 15))
+        self.assertEqual([(7.0, 7.0, 7.0, 1)], conn.execute(
+            "SELECT min, max, sum, count FROM measurements_hourly WHERE serial_no = 'removed' "
+            "AND period = '2023-02-01T11'").fetchall())
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import heapq
+import itertools
+import threading
+from datetime import datetime, time, timedelta
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from devices import DeviceVisitor
+from smarthouse import Room, SmartHouse
+
+EVERY_DAY = frozenset(range(7))
+WEEKDAYS = frozenset(range(5))  # Monday to Friday, as in datetime.weekday()
+WEEKEND = frozenset({5, 6})
+
+
+class Schedule:
+    """
+    A scene that runs at a fixed time of day on the given weekdays, e.g.
+    Schedule("night", time(23), SetTemperatureVisitor(18.0), house, days=WEEKDAYS).
+    The visitor is applied to all devices of the given rooms, or of the whole house if rooms is None.
+    """
+
+    def __init__(self, name: str, at: time, visitor: DeviceVisitor, house: SmartHouse,
+                 rooms: Optional[List[Room]] = None, days: FrozenSet[int] = EVERY_DAY):
+        if not days:
+            raise ValueError("A schedule needs at least one day!")
+        self.name = name
+        self.at = at
+        self.visitor = visitor
+        self.house = house
+        self.rooms = rooms
+        self.days = frozenset(days)
+        self.cancelled = False
+
+    def next_run(self, after: datetime) -> datetime:
+        """
+        Returns the first point in time after the given one at which the schedule is due.
+        """
+        candidate = datetime.combine(after.date(), self.at)
+        if candidate <= after:
+            candidate += timedelta(days=1)
+        while candidate.weekday() not in self.days:
+            candidate += timedelta(days=1)
+        return candidate
+
+    def __repr__(self):
+        return f"Schedule({self.name} at {self.at} on {sorted(self.days)})"
+
+
+class Scheduler:
+    """
+    Keeps schedules in a heap ordered by their next run, so finding the next due schedule costs O(1) and
+    (re)scheduling O(log n). Nothing runs between two due times, whatever the number of schedules.
+    Schedules that are due at the same time and share house and visitor are dispatched as one
+    SmartHouse.apply_visitor() call over the union of their rooms.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[datetime, int, Schedule]] = []
+        self._counter = itertools.count()  # tie breaker, schedules themselves are not comparable
+        self._live = 0
+        self.changed = threading.Condition()
+
+    def __len__(self):
+        return self._live
+
+    def add(self, schedule: Schedule, now: datetime = None) -> Schedule:
+        with self.changed:
+            heapq.heappush(self._heap, (schedule.next_run(now or datetime.now()), next(self._counter), schedule))
+            self._live += 1
+            self.changed.notify_all()
+        return schedule
+
+    def cancel(self, schedule: Schedule):
+        """
+        Cancelled schedules stay in the heap until they come up, where they are dropped.
+        """
+        with self.changed:
+            if not schedule.cancelled:
+                schedule.cancelled = True
+                self._live -= 1
+                self.changed.notify_all()
+
+    def next_due(self) -> Optional[datetime]:
+        with self.changed:
+            while self._heap and self._heap[0][2].cancelled:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def _pop_due(self, now: datetime) -> List[Schedule]:
+        due = []
+        with self.changed:
+            while self._heap and self._heap[0][0] <= now:
+                _, _, schedule = heapq.heappop(self._heap)
+                if schedule.cancelled:
+                    continue
+                due.append(schedule)
+                heapq.heappush(self._heap, (schedule.next_run(now), next(self._counter), schedule))
+        return due
+
+    def run_pending(self, now: datetime = None) -> int:
+        """
+        Runs all schedules that are due at the given time (default now) and returns the number of devices visited.
+        """
+        batches: Dict[Tuple[int, int], Tuple[SmartHouse, DeviceVisitor, Optional[List[Room]]]] = {}
+        for schedule in self._pop_due(now or datetime.now()):
+            key = (id(schedule.house), id(schedule.visitor))
+            batch = batches.get(key)
+            if batch is None:
+                batches[key] = (schedule.house, schedule.visitor,
+                                None if schedule.rooms is None else list(schedule.rooms))
+            elif batch[2] is not None:
+                if schedule.rooms is None:
+                    batches[key] = (batch[0], batch[1], None)
+                else:
+                    batch[2].extend(r for r in schedule.rooms if r not in batch[2])
+        return sum(house.apply_visitor(visitor, rooms) for house, visitor, rooms in batches.values())
+
+
+class SchedulerThread(threading.Thread):
+    """
+    Background thread that sleeps until the next schedule is due, or until schedules are added or cancelled.
+    """
+
+    def __init__(self, scheduler: Scheduler):
+        super().__init__(daemon=True, name="scene-scheduler")
+        self.scheduler = scheduler
+        self._stopped = False
+
+    def run(self):
+        while True:
+            with self.scheduler.changed:
+                if self._stopped:
+                    return
+                due = self.scheduler.next_due()
+                timeout = None if due is None else (due - datetime.now()).total_seconds()
+                if timeout is None or timeout > 0:
+                    self.scheduler.changed.wait(timeout)
+                    continue
+            self.scheduler.run_pending()
+
+    def stop(self):
+        with self.scheduler.changed:
+            self._stopped = True
+            self.scheduler.changed.notify_all()
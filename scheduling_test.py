@@ -0,0 +1,61 @@
+import unittest
+from datetime import datetime, time, timedelta
+from devices import HeatControlActuator, LightBulb
+from scheduling import Schedule, Scheduler, SchedulerThread, WEEKDAYS
+from smarthouse import SetTemperatureVisitor, TurnOffLightsVisitor
+from testcase import DemoDatabaseTestCase
+
+
+class SchedulingTest(DemoDatabaseTestCase):
+    friday = datetime(2030, 1, 4, 12, 0)
+
+    def test_next_run(self):
+        house = self.build_demo_house()
+        schedule = Schedule("night", time(23), SetTemperatureVisitor(18.0), house, days=WEEKDAYS)
+        self.assertEqual(datetime(2030, 1, 4, 23, 0), schedule.next_run(SchedulingTest.friday))
+        # after Friday 23:00 the next weekday is Monday
+        self.assertEqual(datetime(2030, 1, 7, 23, 0), schedule.next_run(datetime(2030, 1, 4, 23, 0)))
+
+    def test_run_pending(self):
+        house = self.build_demo_house()
+        temperatures = []
+        house.subscribe(temperatures.append, device_type=HeatControlActuator)
+        heaters = [d for d in house.get_all_devices() if isinstance(d, HeatControlActuator)]
+        night = SetTemperatureVisitor(18.0)
+        scheduler = Scheduler()
+        rooms = house.get_all_rooms()
+        scheduler.add(Schedule("night 1", time(23), night, house, rooms[:6], WEEKDAYS), SchedulingTest.friday)
+        scheduler.add(Schedule("night 2", time(23), night, house, rooms[4:], WEEKDAYS), SchedulingTest.friday)
+        cancelled = scheduler.add(Schedule("lights", time(22), TurnOffLightsVisitor(), house), SchedulingTest.friday)
+        scheduler.cancel(cancelled)
+        self.assertEqual(2, len(scheduler))
+        self.assertEqual(datetime(2030, 1, 4, 23, 0), scheduler.next_due())
+
+        self.assertEqual(0, scheduler.run_pending(datetime(2030, 1, 4, 22, 59)))
+        # both schedules are merged into one pass over all rooms, so every heater is set once
+        self.assertEqual(house.get_no_of_devices(), scheduler.run_pending(datetime(2030, 1, 4, 23, 0)))
+        self.assertEqual(len(heaters), len(temperatures))
+        self.assertEqual(datetime(2030, 1, 7, 23, 0), scheduler.next_due())
+        self.assertEqual(0, scheduler.run_pending(datetime(2030, 1, 5, 23, 0)))
+
+    def test_thread(self):
+        house = self.build_demo_house()
+        ran = []
+        house.subscribe(ran.append)
+        scheduler = Scheduler()
+        thread = SchedulerThread(scheduler)
+        thread.start()
+        at = (datetime.now() + timedelta(milliseconds=200)).time()
+        bulb = next(d for d in house.get_all_devices() if isinstance(d, LightBulb))
+        scheduler.add(Schedule("soon", at, TurnOffLightsVisitor(), house, [house.get_room_with_device(bulb)]))
+        deadline = datetime.now() + timedelta(seconds=5)
+        while not ran and datetime.now() < deadline:
+            thread.join(0.05)
+        thread.stop()
+        thread.join(1)
+        self.assertTrue(ran)
+        self.assertFalse(thread.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
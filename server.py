@@ -0,0 +1,403 @@
+import argparse
+import asyncio
+import json
+import logging
+import re
+import time
+from datetime import date, datetime
+from http import HTTPStatus
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import metrics
+from devices import Device, HeatControlActuator, SimpleOnOffActuator
+from persistence import SmartHouseAnalytics, SmartHousePersistence
+from smarthouse import Room, SmartHouse
+
+logger = logging.getLogger(__name__)
+
+HTTP_REQUESTS = metrics.REGISTRY.histogram("smarthouse_http_request_seconds", "Latency of HTTP API requests.")
+
+MAX_HEADER_LINES = 100
+MAX_BODY = 1 << 20
+DEFAULT_PAGE_SIZE = 100
+
+
+class HttpError(Exception):
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class BadRequest(HttpError):
+    """
+    The request cannot be parsed or its parameters are invalid. Raised by the request parsing only,
+    so that other errors of the handlers are answered as internal server errors.
+    """
+
+    def __init__(self, message: str):
+        super().__init__(HTTPStatus.BAD_REQUEST, message)
+
+
+class Request:
+    __slots__ = ['method', 'path', 'query', 'headers', 'body', 'params', 'route']
+
+    def __init__(self, method: str, path: str, query: Dict[str, List[str]], headers: Dict[str, str], body: bytes):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+        self.params: Dict[str, str] = {}
+        self.route: Optional[Route] = None  # set when the request is dispatched
+
+    def arg(self, name: str, default: str = None) -> Optional[str]:
+        values = self.query.get(name)
+        return values[0] if values else default
+
+    def json(self) -> dict:
+        if not self.body:
+            return {}
+        try:
+            result = json.loads(self.body)
+        except ValueError:
+            raise BadRequest("Body is not valid JSON")
+        if not isinstance(result, dict):
+            raise BadRequest("Body must be a JSON object")
+        return result
+
+
+class Route:
+
+    def __init__(self, method: str, pattern: str, handler: Callable[[Request], object], cacheable: bool,
+                 blocking: bool = False):
+        self.method = method
+        self.pattern = pattern
+        self.regex = re.compile("^" + re.sub(r"<(\w+)>", r"(?P<\1>[^/]+)", pattern) + "$")
+        self.handler = handler
+        self.cacheable = cacheable
+        self.blocking = blocking  # runs in the default executor of the event loop
+
+
+class SmartHouseServer:
+    """
+    HTTP/1.1 JSON API for one house on asyncio. Connections are kept alive between requests and
+    served concurrently. Handlers run on the event loop thread, which also owns the SQLite connection of
+    the persistence. The handlers that open their own connection (device status and commands, coldest room,
+    recent reading, readings and description of a sensor) run in the default executor of the loop instead,
+    so a slow query does not hold up the other clients; moves, the room temperatures and humidity hours use
+    the connection of the persistence and stay on the loop. Responses of the read endpoints are cached for
+    `cache_ttl` seconds; the cache is dropped on every state change published by the house and before and
+    after every write request, and a response computed before such a drop is not cached.
+    Moved devices are saved through `persistence`, by default the one of the analytics.
+    """
+
+    def __init__(self, house: SmartHouse, analytics: SmartHouseAnalytics = None, cache_ttl: float = 5.0,
+                 idle_timeout: float = 30.0, persistence: SmartHousePersistence = None):
+        self.house = house
+        self.analytics = analytics
+        self.persistence = persistence if persistence is not None or analytics is None else analytics.persistence
+        self.cache_ttl = cache_ttl
+        self.idle_timeout = idle_timeout
+        self.cache: Dict[str, Tuple[float, bytes]] = {}
+        self._generation = 0  # incremented whenever the cache is dropped
+        self.routes: List[Route] = []
+        self.house.subscribe(lambda event: self.invalidate())
+
+        self.route("GET", "/rooms", self.get_rooms)
+        self.route("GET", "/devices", self.get_devices)
+        self.route("GET", "/devices/<serial_no>", self.get_device, blocking=True)
+        self.route("POST", "/devices/<serial_no>/move", self.post_move)
+        self.route("POST", "/devices/<serial_no>/on", self.post_turn_on, blocking=True)
+        self.route("POST", "/devices/<serial_no>/off", self.post_turn_off, blocking=True)
+        self.route("POST", "/devices/<serial_no>/temperature", self.post_temperature, blocking=True)
+        self.route("GET", "/analytics/coldest-room", self.get_coldest_room, blocking=True)
+        self.route("GET", "/analytics/temperatures", self.get_temperatures)
+        self.route("GET", "/analytics/sensors/<serial_no>/recent", self.get_recent_reading, blocking=True)
+        self.route("GET", "/analytics/sensors/<serial_no>/readings", self.get_readings, blocking=True)
+        self.route("GET", "/analytics/sensors/<serial_no>/describe", self.get_description, blocking=True)
+        self.route("GET", "/analytics/rooms/<room>/humidity-hours", self.get_humidity_hours)
+
+    def route(self, method: str, pattern: str, handler: Callable[[Request], object], cacheable: bool = None,
+              blocking: bool = False):
+        self.routes.append(Route(method, pattern, handler, method == "GET" if cacheable is None else cacheable,
+                                 blocking))
+
+    def invalidate(self):
+        """
+        Drops the cached responses. May be called from any thread.
+        """
+        self._generation += 1
+        self.cache.clear()
+
+    # Serialization
+
+    def _room_json(self, index: int, room: Room) -> dict:
+        return {"index": index, "id": room.room_id, "name": room.name, "area": room.area, "devices": len(room)}
+
+    def _device_json(self, device: Device, status: bool = False) -> dict:
+        room = self.house.get_room_with_device(device)
+        result = {"index": self.house.device_index.ordinal(device), "serial_no": device.serial_no, "type": device.get_type_name(), "category": device.get_category(),
+                  "producer": device.producer, "product_type": device.product_type, "nickname": device.nickname,
+                  "room": room.name if room else None}
+        if status:
+            result["status"] = device.get_status_message()
+        return result
+
+    def _device(self, serial_no: str) -> Device:
+        device = self.house.find_device_by_serial_no(serial_no)
+        if device is None:
+            raise HttpError(HTTPStatus.NOT_FOUND, f"Device {serial_no} does not exist")
+        return device
+
+    def _room(self, key) -> Room:
+        if isinstance(key, int) or (isinstance(key, str) and key.isdigit()):
+            room = self.house.room_index.get(int(key))
+            if room is not None:
+                return room
+        else:
+            for room in self.house.iter_rooms():
+                if room.name == key:
+                    return room
+        raise HttpError(HTTPStatus.NOT_FOUND, f"Room {key} does not exist")
+
+    def _analytics(self) -> SmartHouseAnalytics:
+        if self.analytics is None:
+            raise HttpError(HTTPStatus.NOT_FOUND, "Analytics are not available")
+        return self.analytics
+
+    def _timespan(self, request: Request) -> Tuple[datetime, datetime]:
+        try:
+            return datetime.fromisoformat(request.arg("from")), datetime.fromisoformat(request.arg("to"))
+        except (TypeError, ValueError):
+            raise BadRequest("Parameters 'from' and 'to' must be ISO 8601 timestamps")
+
+    # Handlers
+
+    def _int_arg(self, request: Request, name: str, default: int = None, minimum: int = 0) -> Optional[int]:
+        value = request.arg(name)
+        if value is None:
+            return default
+        if not value.isdigit() or int(value) < minimum:
+            raise BadRequest(f"Parameter '{name}' must be an integer of at least {minimum}")
+        return int(value)
+
+    def get_rooms(self, request: Request):
+        rooms, cursor = self.house.page_rooms(self._int_arg(request, "limit", DEFAULT_PAGE_SIZE, minimum=1),
+                                              self._int_arg(request, "cursor"), self._int_arg(request, "floor"))
+        return {"items": [self._room_json(self.house.room_index.ordinal(r), r) for r in rooms], "next_cursor": cursor}
+
+    def get_devices(self, request: Request):
+        devices, cursor = self.house.page_devices(self._int_arg(request, "limit", DEFAULT_PAGE_SIZE, minimum=1),
+                                                  self._int_arg(request, "cursor"),
+                                                  floor=self._int_arg(request, "floor"), room=request.arg("room"),
+                                                  device_type=request.arg("type"), category=request.arg("category"))
+        return {"items": [self._device_json(d) for d in devices], "next_cursor": cursor}
+
+    def get_device(self, request: Request):
+        return self._device_json(self._device(request.params["serial_no"]), status=True)
+
+    def post_move(self, request: Request):
+        device = self._device(request.params["serial_no"])
+        to_room = self._room(request.json().get("room"))
+        self.house.move_device(device, self.house.get_room_with_device(device), to_room)
+        if self.persistence is not None:
+            self.persistence.save_topology(self.house)
+        return self._device_json(device)
+
+    def post_turn_on(self, request: Request):
+        device = self._device(request.params["serial_no"])
+        if not isinstance(device, SimpleOnOffActuator):
+            raise BadRequest(f"Device {device.serial_no} cannot be turned on")
+        device.turn_on()
+        return self._device_json(device, status=True)
+
+    def post_turn_off(self, request: Request):
+        device = self._device(request.params["serial_no"])
+        if not isinstance(device, (SimpleOnOffActuator, HeatControlActuator)):
+            raise BadRequest(f"Device {device.serial_no} cannot be turned off")
+        device.turn_off()
+        return self._device_json(device, status=True)
+
+    def post_temperature(self, request: Request):
+        device = self._device(request.params["serial_no"])
+        if not isinstance(device, HeatControlActuator):
+            raise BadRequest(f"Device {device.serial_no} has no temperature")
+        temperature = request.json().get("temperature")
+        if not isinstance(temperature, (int, float)):
+            raise BadRequest("Field 'temperature' must be a number")
+        device.set_temperature(float(temperature))
+        return self._device_json(device, status=True)
+
+    def get_coldest_room(self, request: Request):
+        return {"room": self._analytics().get_coldest_room()}
+
+    def get_temperatures(self, request: Request):
+        return {name: {"min": s[0], "max": s[1], "average": s[2]}
+                for name, s in self._analytics().describe_temperature_in_rooms().items()}
+
+    def get_recent_reading(self, request: Request):
+        return {"value": self._analytics().get_most_recent_sensor_reading(self._device(request.params["serial_no"]))}
+
+    def get_readings(self, request: Request):
+        sensor = self._device(request.params["serial_no"])
+        return self._analytics().get_sensor_readings_in_timespan(sensor, *self._timespan(request))
+
+    def get_description(self, request: Request):
+        sensor = self._device(request.params["serial_no"])
+        result = self._analytics().describe_sensor_in_timespan(sensor, *self._timespan(request))
+        return None if result is None else {"min": result[0], "max": result[1], "average": result[2]}
+
+    def get_humidity_hours(self, request: Request):
+        room = self._room(request.params["room"])
+        try:
+            day = date.fromisoformat(request.arg("day"))
+        except (TypeError, ValueError):
+            raise BadRequest("Parameter 'day' must be an ISO 8601 date")
+        return self._analytics().get_hours_when_humidity_above_average(room, day)
+
+    # HTTP
+
+    async def handle(self, request: Request) -> Tuple[Route, bytes, bool]:
+        """
+        Dispatches a request and returns (matched route, JSON body, served from cache).
+        """
+        path_matches = False
+        for route in self.routes:
+            match = route.regex.match(request.path)
+            if match is None:
+                continue
+            path_matches = True
+            if route.method != request.method:
+                continue
+            request.route = route
+            key = None
+            if route.cacheable:
+                key = request.path + "?" + "&".join(f"{k}={v}" for k, vs in sorted(request.query.items()) for v in vs)
+                cached = self.cache.get(key)
+                if cached is not None and cached[0] > time.monotonic():
+                    return route, cached[1], True
+            else:
+                self.invalidate()
+            generation = self._generation
+            request.params = {k: unquote(v) for k, v in match.groupdict().items()}
+            try:
+                if route.blocking:
+                    result = await asyncio.get_running_loop().run_in_executor(None, route.handler, request)
+                else:
+                    result = route.handler(request)
+            finally:
+                if not route.cacheable:
+                    self.invalidate()
+            body = json.dumps(result).encode("utf-8")
+            # a write that happened while the response was computed may have made it stale
+            if key is not None and generation == self._generation:
+                self.cache[key] = (time.monotonic() + self.cache_ttl, body)
+            return route, body, False
+        if path_matches:
+            raise HttpError(HTTPStatus.METHOD_NOT_ALLOWED, f"{request.method} is not allowed on {request.path}")
+        raise HttpError(HTTPStatus.NOT_FOUND, f"{request.path} does not exist")
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Request]:
+        line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+        if not line:
+            return None
+        try:
+            method, target, version = line.decode("latin-1").split()
+        except ValueError:
+            raise BadRequest("Malformed request line")
+        headers = {"_version": version}
+        for _ in range(MAX_HEADER_LINES):
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        else:
+            raise HttpError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Too many headers")
+        length = headers.get("content-length", "0") or "0"
+        if not length.isdigit():
+            raise BadRequest("Malformed Content-Length")
+        length = int(length)
+        if length > MAX_BODY:
+            raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Body too large")
+        body = await reader.readexactly(length) if length else b""
+        url = urlsplit(target)
+        return Request(method.upper(), url.path.rstrip("/") or "/", parse_qs(url.query), headers, body)
+
+    @staticmethod
+    def _keep_alive(request: Request) -> bool:
+        connection = request.headers.get("connection", "").lower()
+        if request.headers["_version"] == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = None
+                started = None
+                try:
+                    request = await self._read_request(reader)
+                    if request is None:
+                        break
+                    started = time.perf_counter()
+                    route, body, cached = await self.handle(request)
+                    status = HTTPStatus.OK
+                    keep_alive = self._keep_alive(request)
+                    extra = [f"X-Cache: {'HIT' if cached else 'MISS'}"]
+                except HttpError as e:
+                    status, body, extra = e.status, json.dumps({"error": e.message}).encode("utf-8"), []
+                    keep_alive = request is not None and self._keep_alive(request)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    raise
+                except Exception:
+                    logger.exception("Request %s %s failed", request.method if request else "-",
+                                     request.path if request else "-")
+                    status, extra = HTTPStatus.INTERNAL_SERVER_ERROR, []
+                    body = json.dumps({"error": "Internal server error"}).encode("utf-8")
+                    keep_alive = request is not None and self._keep_alive(request)
+                status = HTTPStatus(status)
+                if started is not None:
+                    # every answered request is timed, errors included
+                    elapsed = time.perf_counter() - started
+                    HTTP_REQUESTS.observe(elapsed, method=request.method,
+                                          route=request.route.pattern if request.route else "", status=str(status.value))
+                    extra.insert(0, f"Server-Timing: app;dur={elapsed * 1000:.3f}")
+                headers = [f"HTTP/1.1 {status.value} {status.phrase}", "Content-Type: application/json",
+                           f"Content-Length: {len(body)}", f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+                writer.write(("\r\n".join(headers + extra) + "\r\n\r\n").encode("latin-1") + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+
+async def serve(server: SmartHouseServer, host: str, port: int):
+    s = await server.start(host, port)
+    async with s:
+        await s.serve_forever()
+
+
+if __name__ == '__main__':
+    from pathlib import Path
+    import database
+    from main import load_house
+
+    parser = argparse.ArgumentParser(description="Serves the smart house as HTTP/JSON API")
+    parser.add_argument("--db", default=database.DEFAULT_DB_FILE)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+    persistence = SmartHousePersistence(str(Path(args.db).absolute()))
+    house = load_house(persistence)
+    house.attach(persistence)
+    asyncio.run(serve(SmartHouseServer(house, SmartHouseAnalytics(persistence)), args.host, args.port))
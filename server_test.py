@@ -0,0 +1,164 @@
+import asyncio
+import json
+import threading
+import unittest
+from main import load_house
+from persistence import SmartHousePersistence, SmartHouseAnalytics
+from server import HTTP_REQUESTS, SmartHouseServer
+from testcase import DemoDatabaseTestCase
+
+
+async def request(reader, writer, method: str, path: str, body: dict = None, close: bool = False):
+    data = json.dumps(body).encode("utf-8") if body is not None else b""
+    headers = [f"{method} {path} HTTP/1.1", "Host: localhost", f"Content-Length: {len(data)}"]
+    if close:
+        headers.append("Connection: close")
+    writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + data)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    response_headers = {}
+    while (line := await reader.readline()) != b"\r\n":
+        name, _, value = line.decode("latin-1").partition(":")
+        response_headers[name.strip().lower()] = value.strip()
+    payload = json.loads(await reader.readexactly(int(response_headers["content-length"])))
+    return status, response_headers, payload
+
+
+class ServerTest(DemoDatabaseTestCase):
+    def test_api(self):
+        p = SmartHousePersistence(self.db_file)
+        house = load_house(p)
+        server = SmartHouseServer(house, SmartHouseAnalytics(p))
+        server.route("GET", "/broken", lambda request: 1 / 0)
+        server.route("GET", "/lookup", lambda request: {}["missing"])
+        missing_before = HTTP_REQUESTS.count(method="GET", route="/devices/<serial_no>", status="404")
+
+        async def scenario():
+            s = await server.start("127.0.0.1", 0)
+            port = s.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            results = {}
+            # several requests on one kept-alive connection
+            results["rooms"] = await request(reader, writer, "GET", "/rooms")
+            results["devices"] = await request(reader, writer, "GET", "/devices")
+            results["page"] = await request(reader, writer, "GET", "/devices?category=Sensor&limit=5")
+            results["next"] = await request(reader, writer, "GET", "/devices?category=Sensor&limit=5&cursor=%s"
+                                            % results["page"][2]["next_cursor"])
+            results["empty page"] = await request(reader, writer, "GET", "/devices?limit=0")
+            results["device"] = await request(reader, writer, "GET", "/devices/f11bb4fc-ba74-49cd")
+            results["cached"] = await request(reader, writer, "GET", "/devices/f11bb4fc-ba74-49cd")
+            results["on"] = await request(reader, writer, "POST", "/devices/f11bb4fc-ba74-49cd/on")
+            results["after"] = await request(reader, writer, "GET", "/devices/f11bb4fc-ba74-49cd")
+            results["off"] = await request(reader, writer, "POST", "/devices/f11bb4fc-ba74-49cd/off")
+            results["move"] = await request(reader, writer, "POST", "/devices/f11bb4fc-ba74-49cd/move",
+                                            {"room": "Office"})
+            results["missing"] = await request(reader, writer, "GET", "/devices/nope")
+            results["array"] = await request(reader, writer, "POST", "/devices/f11bb4fc-ba74-49cd/move", ["Office"])
+            results["broken"] = await request(reader, writer, "GET", "/broken")
+            results["lookup"] = await request(reader, writer, "GET", "/lookup")
+            results["method"] = await request(reader, writer, "DELETE", "/rooms")
+            # a second client is served while the first connection stays open
+            other_reader, other_writer = await asyncio.open_connection("127.0.0.1", port)
+            results["coldest"] = await request(other_reader, other_writer, "GET", "/analytics/coldest-room",
+                                               close=True)
+            results["closed"] = await other_reader.read()
+            results["describe"] = await request(
+                reader, writer, "GET",
+                "/analytics/sensors/e237beec-2675-4cb0/describe?from=2023-02-13T00:00:00&to=2023-02-16T00:00:00",
+                close=True)
+            writer.close()
+            other_writer.close()
+            s.close()
+            await s.wait_closed()
+            return results
+
+        results = asyncio.run(scenario())
+        status, _, rooms = results["rooms"]
+        self.assertEqual(200, status)
+        self.assertEqual(12, len(rooms["items"]))
+        self.assertIsNone(rooms["next_cursor"])
+        self.assertEqual(31, len(results["devices"][2]["items"]))
+        page, next_page = results["page"][2], results["next"][2]
+        self.assertEqual(5, len(page["items"]))
+        self.assertEqual(page["items"][-1]["index"], page["next_cursor"])
+        self.assertEqual(3, len(next_page["items"]))
+        self.assertIsNone(next_page["next_cursor"])
+        self.assertTrue(all(d["category"] == "Sensor" for d in page["items"] + next_page["items"]))
+        self.assertEqual(400, results["empty page"][0])
+        status, headers, device = results["device"]
+        self.assertEqual("Smart Lys", device["type"])
+        self.assertEqual("MISS", headers["x-cache"])
+        self.assertIn("server-timing", headers)
+        self.assertEqual("HIT", results["cached"][1]["x-cache"])
+        self.assertEqual("ON", results["on"][2]["status"])
+        # the actuator command invalidated the cached device
+        self.assertEqual("MISS", results["after"][1]["x-cache"])
+        self.assertEqual("ON", results["after"][2]["status"])
+        self.assertEqual("OFF", results["off"][2]["status"])
+        self.assertEqual("Office", results["move"][2]["room"])
+        # the move is saved
+        self.assertEqual([("Office",)], p.cursor.execute(
+            "SELECT r.name FROM rooms r INNER JOIN devices d ON r.id = d.room WHERE d.serial_no = ?",
+            ("f11bb4fc-ba74-49cd",)).fetchall())
+        self.assertEqual([], house.changes)
+        self.assertEqual(404, results["missing"][0])
+        # failed requests are timed as well
+        self.assertIn("server-timing", results["missing"][1])
+        self.assertEqual(missing_before + 1,
+                         HTTP_REQUESTS.count(method="GET", route="/devices/<serial_no>", status="404"))
+        self.assertEqual(400, results["array"][0])
+        # an unexpected error is answered and the connection stays usable
+        self.assertEqual((500, {"error": "Internal server error"}), (results["broken"][0], results["broken"][2]))
+        # only invalid requests are answered with 400, a failed lookup in a handler is a bug
+        self.assertEqual(500, results["lookup"][0])
+        self.assertEqual(405, results["method"][0])
+        self.assertEqual(p.cursor.execute(
+            "SELECT r.name FROM rooms r INNER JOIN devices d ON r.id = d.room INNER JOIN measurements m "
+            "ON d.serial_no = m.serial_no GROUP BY r.name ORDER BY AVG(m.value)").fetchall()[0][0],
+            results["coldest"][2]["room"])
+        self.assertEqual(b"", results["closed"])
+        status, headers, description = results["describe"]
+        self.assertEqual(200, status)
+        self.assertEqual("close", headers["connection"])
+        self.assertEqual({"min", "max", "average"}, set(description))
+
+    def test_stale_responses_are_not_cached(self):
+        p = SmartHousePersistence(self.db_file)
+        server = SmartHouseServer(load_house(p), SmartHouseAnalytics(p))
+        state = {"value": 1}
+        started, release = threading.Event(), threading.Event()
+
+        def slow(request):
+            value = state["value"]
+            started.set()
+            release.wait(5)
+            return {"value": value}
+
+        server.route("GET", "/slow", slow, blocking=True)
+
+        async def scenario():
+            s = await server.start("127.0.0.1", 0)
+            port = s.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            other_reader, other_writer = await asyncio.open_connection("127.0.0.1", port)
+            pending = asyncio.create_task(request(other_reader, other_writer, "GET", "/slow"))
+            await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+            # a write request while the read is computed
+            state["value"] = 2
+            await request(reader, writer, "POST", "/devices/f11bb4fc-ba74-49cd/on")
+            release.set()
+            results = [await pending, await request(reader, writer, "GET", "/slow")]
+            writer.close()
+            other_writer.close()
+            s.close()
+            await s.wait_closed()
+            return results
+
+        stale, fresh = asyncio.run(scenario())
+        self.assertEqual({"value": 1}, stale[2])
+        self.assertEqual("MISS", fresh[1]["x-cache"])
+        self.assertEqual({"value": 2}, fresh[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
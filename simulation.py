@@ -0,0 +1,154 @@
+import math
+import random
+from array import array
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from devices import HeatControlActuator, TemperatureSensor
+from events import StateChangeEvent
+from smarthouse import Room, SmartHouse
+
+# Lumped thermal model: every room is a single heat capacity proportional to its area that loses heat to the
+# outside through the envelope and gains it from its heaters. A heater delivers its full power when the room
+# is PROPORTIONAL_BAND or more below its setpoint, less the closer the room gets, and nothing at or above it.
+HEAT_CAPACITY = 60_000.0  # J/K per m² (air, walls and furniture)
+HEAT_LOSS = 3.0  # W/K per m²
+PROPORTIONAL_BAND = 1.0  # K
+MAX_POWER = {"Paneloven": 1000.0, "Varmepumpe": 3000.0}  # W per heater
+FLOOR_HEATING_POWER = 60.0  # W per m² of the room for "Gulvvarmepanel"
+
+
+class ThermalSimulation:
+    """
+    Simulates the temperature of every room of a house from the setpoints of its heat control actuators
+    (HeatOven, HeatPump, FloorHeatingPanel) and writes the readings of the temperature sensors through
+    SmartHousePersistence.add_measurements(), so the measurement listeners (automation rules, anomaly
+    detection, statistics) see them as if they came from the house.
+
+    Room temperatures, heater setpoints and sensor positions are kept in flat arrays and all rooms are
+    advanced together each tick. Setpoints follow the actuator commands published by the house, the
+    topology is taken when the simulation is created.
+    """
+
+    def __init__(self, house: SmartHouse, persistence, start: datetime, step: timedelta = timedelta(minutes=1),
+                 outdoor: Union[float, Callable[[datetime], float]] = 5.0, initial: float = 20.0,
+                 noise: float = 0.1, seed: int = 0):
+        self.house = house
+        self.persistence = persistence
+        self.now = start
+        self.step = step
+        self.outdoor = outdoor  # °C, constant or a function of the time
+        self.noise = noise  # standard deviation of the sensor readings in K
+        self.rng = random.Random(seed)
+        self.rooms: List[Room] = list(house.iter_rooms())
+        room_positions = {room: i for i, room in enumerate(self.rooms)}
+        self.area = array("d", (room.area or 1.0 for room in self.rooms))
+        self.temperature = array("d", [initial]) * len(self.rooms)
+        self.heat = array("d", bytes(8 * len(self.rooms)))  # heating power per room in the last tick, W
+
+        state = dict(persistence.cursor.execute("SELECT serial_no, value FROM device_state").fetchall())
+        self.heater_positions: Dict[str, int] = {}
+        self.heater_rooms = array("q")
+        self.setpoints = array("d")
+        self.max_power = array("d")
+        self.sensors: List[TemperatureSensor] = []
+        self.sensor_rooms = array("q")
+        readings: Dict[int, List[float]] = {}
+        for device in house.iter_devices():
+            room = house.get_room_with_device(device)
+            if room not in room_positions:
+                continue
+            position = room_positions[room]
+            if isinstance(device, HeatControlActuator):
+                self.heater_positions[device.serial_no] = len(self.setpoints)
+                self.heater_rooms.append(position)
+                self.setpoints.append(_setpoint(state.get(device.serial_no)))
+                self.max_power.append(MAX_POWER.get(device.get_type_name(), FLOOR_HEATING_POWER * self.area[position]))
+            elif isinstance(device, TemperatureSensor):
+                self.sensors.append(device)
+                self.sensor_rooms.append(position)
+                value = state.get(device.serial_no)
+                if isinstance(value, (int, float)):
+                    readings.setdefault(position, []).append(value)
+        # rooms with a sensor start from its last known value
+        for position, values in readings.items():
+            self.temperature[position] = sum(values) / len(values)
+        # An explicit Euler step overshoots the equilibrium of a room (and becomes unstable at twice that) when
+        # step * rate > 1, the rate being how fast the room approaches it with all its heaters inside their
+        # proportional band. Steps of the fastest room longer than 1 / rate are split into substeps.
+        gain = array("d", (HEAT_LOSS * a for a in self.area))
+        for h, position in enumerate(self.heater_rooms):
+            gain[position] += self.max_power[h] / PROPORTIONAL_BAND
+        rate = max((g / (HEAT_CAPACITY * a) for g, a in zip(gain, self.area)), default=0.0)
+        self.substeps = max(1, math.ceil(step.total_seconds() * rate))
+        self._subscription = house.subscribe(self._on_command, device_type=HeatControlActuator)
+
+    def close(self):
+        if self._subscription is not None:
+            self.house.unsubscribe(self._subscription)
+            self._subscription = None
+
+    def _on_command(self, event: StateChangeEvent):
+        position = self.heater_positions.get(event.serial_no)
+        if position is not None and event.source == StateChangeEvent.ACTUATOR:
+            self.setpoints[position] = _setpoint(event.value)
+
+    def get_temperature(self, room: Room) -> float:
+        return self.temperature[self.rooms.index(room)]
+
+    def _outdoor_temperature(self) -> float:
+        return self.outdoor(self.now) if callable(self.outdoor) else self.outdoor
+
+    def advance(self):
+        """
+        Advances all rooms by one step (explicit Euler, in `substeps` equal substeps).
+        """
+        seconds = self.step.total_seconds() / self.substeps
+        temperature, heat, area = self.temperature, self.heat, self.area
+        outside = self._outdoor_temperature()
+        for _ in range(self.substeps):
+            for i in range(len(heat)):
+                heat[i] = 0.0
+            for h, room in enumerate(self.heater_rooms):
+                demand = (self.setpoints[h] - temperature[room]) / PROPORTIONAL_BAND
+                if demand > 0:
+                    heat[room] += self.max_power[h] * min(1.0, demand)
+            for i in range(len(temperature)):
+                temperature[i] += seconds * (heat[i] - HEAT_LOSS * area[i] * (temperature[i] - outside)) \
+                    / (HEAT_CAPACITY * area[i])
+        self.now += self.step
+
+    def readings(self) -> List[Tuple[str, int, float, str]]:
+        """
+        The current (time_stamp, device, value, serial_no) reading of every temperature sensor.
+        """
+        time_stamp = self.now.isoformat(timespec="seconds")
+        return [(time_stamp, sensor.device_id,
+                 round(self.temperature[self.sensor_rooms[i]] + self.rng.gauss(0, self.noise), 2), sensor.serial_no)
+                for i, sensor in enumerate(self.sensors)]
+
+    def run(self, ticks: int = None, until: datetime = None) -> int:
+        """
+        Advances the simulation by the given number of ticks or until the given time and ingests the sensor
+        readings after every tick, so control rules react within the same run. The readings of every tick are
+        committed together, the measurement listeners (e.g. automation rules) see them after the commit and their
+        commands apply from the next tick on. Returns the number of readings written.
+        """
+        if ticks is None:
+            if until is None:
+                raise ValueError("Either ticks or until must be given!")
+            ticks = max(0, int((until - self.now) / self.step))
+        count = 0
+        for _ in range(ticks):
+            self.advance()
+            if self.sensors:
+                with self.persistence.transaction():
+                    count += self.persistence.add_measurements(self.readings())
+        return count
+
+
+def _setpoint(value: Optional[float]) -> float:
+    """
+    Heaters store their setpoint as device state, 0 (or nothing) means off.
+    """
+    return float(value) if isinstance(value, (int, float)) else 0.0
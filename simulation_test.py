@@ -0,0 +1,89 @@
+import unittest
+from datetime import datetime, timedelta
+from automation import AutomationEngine, Rule
+from devices import HeatControlActuator
+from main import load_house
+from persistence import SmartHousePersistence
+from simulation import ThermalSimulation
+from smarthouse import SetTemperatureVisitor
+from testcase import DemoDatabaseTestCase
+
+
+class SimulationTest(DemoDatabaseTestCase):
+    def test_heating(self):
+        p = SmartHousePersistence(self.db_file)
+        house = load_house(p)
+        rooms = {room.name: room for room in house.get_all_rooms()}
+        living_room, bedroom = rooms["Living Room / Kitchen"], rooms["Master Bedroom"]
+        for device in house.get_all_devices():
+            if isinstance(device, HeatControlActuator):
+                device.turn_off()
+        simulation = ThermalSimulation(house, p, datetime(2023, 3, 1), timedelta(minutes=5), outdoor=2.0)
+        # the setpoint follows the actuator command
+        heat_pump = next(d for d in bedroom if isinstance(d, HeatControlActuator))
+        heat_pump.set_temperature(22.0)
+        ticks = 2 * 288
+        written = simulation.run(ticks)
+        self.assertEqual(ticks * len(simulation.sensors), written)
+        self.assertEqual(datetime(2023, 3, 3), simulation.now)
+        self.assertAlmostEqual(22.0, simulation.get_temperature(bedroom), delta=0.5)
+        self.assertLess(simulation.get_temperature(bedroom), 22.0)
+        self.assertAlmostEqual(2.0, simulation.get_temperature(living_room), delta=0.5)
+        sensor = next(d for d in bedroom if d.get_type_name() == "Temperatursensor")
+        last = p.cursor.execute("SELECT time_stamp, value FROM measurements WHERE serial_no = ? "
+                                "ORDER BY time_stamp DESC LIMIT 1", (sensor.serial_no,)).fetchall()[0]
+        self.assertEqual("2023-03-03T00:00:00", last[0])
+        self.assertAlmostEqual(22.0, last[1], delta=1)
+
+        # commands between runs change the setpoints of the next run
+        for device in living_room:
+            if isinstance(device, HeatControlActuator):
+                device.set_temperature(21.0)
+        simulation.run(until=datetime(2023, 3, 4))
+        self.assertAlmostEqual(21.0, simulation.get_temperature(living_room), delta=1.0)
+
+        # a thermostat rule on the simulated readings commands the heat pump within the run
+        for device in living_room:
+            if isinstance(device, HeatControlActuator):
+                device.turn_off()
+        sensor = next(d for d in living_room if d.get_type_name() == "Temperatursensor")
+        engine = AutomationEngine(house)
+        engine.add_rule(Rule("thermostat", sensor.serial_no, "<", 15.0, SetTemperatureVisitor(23.0),
+                             [d for d in living_room if isinstance(d, HeatControlActuator)]))
+        house.attach(p)
+        engine.start()
+        simulation.run(until=datetime(2023, 3, 5))
+        engine.stop()
+        self.assertGreater(simulation.get_temperature(living_room), 21.0)
+        self.assertEqual([(23.0,)], p.cursor.execute(
+            "SELECT s.value FROM device_state s INNER JOIN devices d ON d.serial_no = s.serial_no "
+            "WHERE d.type = 'Varmepumpe' AND d.room = ?", (living_room.room_id,)).fetchall())
+        simulation.close()
+        heat_pump.set_temperature(25.0)
+        self.assertEqual(22.0, simulation.setpoints[simulation.heater_positions[heat_pump.serial_no]])
+
+    def test_small_room_does_not_overshoot(self):
+        p = SmartHousePersistence(self.db_file)
+        house = load_house(p)
+        heat_pump = next(d for d in house.get_all_devices() if d.get_type_name() == "Varmepumpe")
+        room = house.get_room_with_device(heat_pump)
+        room.area = 2.0  # a 3 kW heat pump in 2 m² is ahead of a 1 minute step
+        for device in room:
+            if isinstance(device, HeatControlActuator) and device is not heat_pump:
+                device.turn_off()
+        heat_pump.set_temperature(22.0)
+        simulation = ThermalSimulation(house, p, datetime(2023, 3, 1), timedelta(minutes=1), outdoor=2.0,
+                                       initial=15.0)
+        self.assertGreater(simulation.substeps, 1)
+        temperatures = []
+        for _ in range(120):
+            simulation.advance()
+            temperatures.append(simulation.get_temperature(room))
+        self.assertEqual(sorted(temperatures), temperatures)
+        self.assertLess(temperatures[-1], 22.0)
+        self.assertAlmostEqual(22.0, temperatures[-1], delta=0.1)
+        simulation.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,19 @@
 from devices import Device, LightBulb, TemperatureSensor, HeatOven, Sensor, Actuator, HeatPump, DeviceVisitor
-from typing import List, Optional
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import bisect
+import itertools
+import statistics
+import database
+import metrics
+from events import EventBus, StateChangeEvent, Subscription
 
 
 class Room:
 
-    def __init__(self, area: float, name: str = None):
+    def __init__(self, area: float, name: str = None, room_id: int = None):
         self.area = area
         self.name = name
+        self.room_id = room_id  # id in the rooms table, None until the room has been saved
         self.devices = []
 
     def find_device(self, serial_no: str) -> Optional[Device]:
@@ -86,16 +93,66 @@ class TurnOffLightsVisitor(DeviceVisitor):
         actuator.turn_off()
 
 
-class GetTemperatureVisitor(DeviceVisitor):
+class TurnOnVisitor(DeviceVisitor):
+
+    def handle_light_bulp(self, actuator):
+        actuator.turn_on()
+
+    def handle_outlet(self, actuator):
+        actuator.turn_on()
+
+    def handle_car_charger(self, actuator):
+        actuator.turn_on()
+
+    def handle_dehumidifier(self, actuator):
+        actuator.turn_on()
+
+
+class TurnOffVisitor(DeviceVisitor):
+
+    def handle_light_bulp(self, actuator):
+        actuator.turn_off()
+
+    def handle_outlet(self, actuator):
+        actuator.turn_off()
+
+    def handle_car_charger(self, actuator):
+        actuator.turn_off()
+
+    def handle_dehumidifier(self, actuator):
+        actuator.turn_off()
 
-    def __init__(self):
-        self.temperature = None
+
+# How the readings of several temperature sensors in a room are combined into the room temperature
+TEMPERATURE_FUSIONS: Dict[str, Callable[[List[float]], float]] = {
+    "mean": statistics.fmean,
+    "median": statistics.median,
+}
+
+
+class GetTemperatureVisitor(DeviceVisitor):
+    """
+    Combines the current values of all temperature sensors visited into one temperature (mean or median).
+    If `state` (serial no -> current value) is given, sensors found there are not queried one by one.
+    """
+
+    def __init__(self, fusion: str = "mean", state: Dict[str, Optional[float]] = None):
+        if fusion not in TEMPERATURE_FUSIONS:
+            raise ValueError(f"Unknown temperature fusion {fusion}!")
+        self.fusion = fusion
+        self.state = state
+        self.temperatures: List[float] = []
 
     def handle_temperature_sensor(self, sensor):
-        self.temperature = sensor.get_current_value()
+        if self.state is not None and sensor.serial_no in self.state:
+            value = self.state[sensor.serial_no]
+        else:
+            value = sensor.get_current_value()
+        if value is not None:
+            self.temperatures.append(value)
 
     def get_result(self) -> Optional[float]:
-        return self.temperature
+        return TEMPERATURE_FUSIONS[self.fusion](self.temperatures) if self.temperatures else None
 
 
 class SetTemperatureVisitor(DeviceVisitor):
@@ -113,11 +170,87 @@ class SetTemperatureVisitor(DeviceVisitor):
         actuator.set_temperature(self.temperature)
 
 
+class TopologyChange:
+    """
+    Records a change of the house layout that has not been saved yet, see SmartHousePersistence.save_topology().
+    """
+    CREATE_ROOM = "create_room"
+    REGISTER_DEVICE = "register_device"
+    UNREGISTER_DEVICE = "unregister_device"
+    MOVE_DEVICE = "move_device"
+
+    __slots__ = ['kind', 'room', 'device', 'floor_no']
+
+    def __init__(self, kind: str, room: Room, device: Device = None, floor_no: int = None):
+        self.kind = kind
+        self.room = room  # the created room, or the room the device was registered in, removed from or moved to
+        self.device = device
+        self.floor_no = floor_no
+
+    def __repr__(self):
+        return f"{self.kind}({self.device.serial_no if self.device else ''} {self.room})"
+
+
+class OrdinalIndex:
+    """
+    Numbers items in the order they are added. An item keeps its ordinal until it is removed and ordinals
+    are never reused, so they can be shown to users and used as pagination cursors.
+    """
+
+    def __init__(self):
+        self._ordinals = {}
+        self._items = {}
+        self._sorted: List[int] = []
+        self._next = 0
+
+    def __len__(self):
+        return len(self._sorted)
+
+    def add(self, item) -> int:
+        ordinal = self._ordinals.get(item)
+        if ordinal is None:
+            ordinal = self._ordinals[item] = self._next
+            self._items[ordinal] = item
+            self._sorted.append(ordinal)
+            self._next += 1
+        return ordinal
+
+    def remove(self, item):
+        ordinal = self._ordinals.pop(item, None)
+        if ordinal is not None:
+            del self._items[ordinal]
+            del self._sorted[bisect.bisect_left(self._sorted, ordinal)]
+
+    def ordinal(self, item) -> Optional[int]:
+        return self._ordinals.get(item)
+
+    def get(self, ordinal: int):
+        return self._items.get(ordinal)
+
+    def after(self, cursor: Optional[int] = None) -> Iterator:
+        """
+        Yields the items with an ordinal greater than the cursor (all items if None) in ordinal order.
+        """
+        start = 0 if cursor is None else bisect.bisect_right(self._sorted, cursor)
+        for i in range(start, len(self._sorted)):
+            yield self._items[self._sorted[i]]
+
+
 # Composite Pattern: A house consists of floors which consists of rooms which consists of devices
 class SmartHouse:
 
     def __init__(self):
         self.floors = []
+        self.changes: List[TopologyChange] = []
+        self.events = EventBus()
+        self._device_rooms: Dict[Device, Room] = {}  # rooms of the registered devices, used to route events
+        self._devices_by_serial_no: Dict[str, Device] = {}
+        self.device_index = OrdinalIndex()
+        self.room_index = OrdinalIndex()
+        self._room_floors: Dict[Room, int] = {}
+        self._temperature_state: Optional[Dict[str, Optional[float]]] = None  # current value per temperature sensor
+        self._room_temperatures: Dict[Room, Dict[str, Optional[float]]] = {}  # room -> fusion -> temperature
+        self._temperature_times: Dict[str, str] = {}  # time stamp of the reading each cached value came from
 
     def create_floor(self) -> Floor:
         f = Floor(len(self.floors) + 1)
@@ -130,6 +263,9 @@ class SmartHouse:
         f = self.floors[floor_no - 1]
         r = Room(area, name)
         f.rooms.append(r)
+        self.changes.append(TopologyChange(TopologyChange.CREATE_ROOM, r, floor_no=floor_no))
+        self.room_index.add(r)
+        self._room_floors[r] = floor_no
         return r
 
     def get_no_of_rooms(self) -> int:
@@ -151,6 +287,64 @@ class SmartHouse:
             result.extend(floor.rooms)
         return result
 
+    def iter_devices(self, floor: int = None, room=None, device_type=None, category: str = None,
+                     after: int = None) -> Iterator[Device]:
+        """
+        Yields the devices in ordinal order without building a list, optionally only those on a floor (number),
+        in a room (Room or name), of a type (type name or class) or of a category ("Sensor" or "Aktuator"),
+        and only those after the given ordinal.
+        """
+        if isinstance(room, Room):
+            ordinal = self.device_index.ordinal
+            candidates = (d for d in sorted(room.devices, key=lambda d: ordinal(d) or 0)
+                          if after is None or (ordinal(d) or 0) > after)
+        else:
+            candidates = self.device_index.after(after)
+        for device in candidates:
+            if device_type is not None:
+                if isinstance(device_type, type):
+                    if not isinstance(device, device_type):
+                        continue
+                elif device.get_type_name() != device_type:
+                    continue
+            if category is not None and device.get_category() != category:
+                continue
+            if room is not None or floor is not None:
+                device_room = self._device_rooms.get(device)
+                if isinstance(room, str) and (device_room is None or device_room.name != room):
+                    continue
+                if floor is not None and self._room_floors.get(device_room) != floor:
+                    continue
+            yield device
+
+    def page_devices(self, limit: int = 50, cursor: int = None, **filters) -> Tuple[List[Device], Optional[int]]:
+        """
+        Returns up to `limit` devices after the cursor, filtered like iter_devices(), and the cursor
+        of the next page (None on the last page). Raises ValueError if `limit` is less than 1.
+        """
+        if limit < 1:
+            raise ValueError(f"Page size must be at least 1, got {limit}!")
+        page = list(itertools.islice(self.iter_devices(after=cursor, **filters), limit + 1))
+        if len(page) > limit:
+            return page[:limit], self.device_index.ordinal(page[limit - 1])
+        return page, None
+
+    def get_floor_no(self, room: Room) -> Optional[int]:
+        return self._room_floors.get(room)
+
+    def iter_rooms(self, floor: int = None, after: int = None) -> Iterator[Room]:
+        for room in self.room_index.after(after):
+            if floor is None or self._room_floors.get(room) == floor:
+                yield room
+
+    def page_rooms(self, limit: int = 50, cursor: int = None, floor: int = None) -> Tuple[List[Room], Optional[int]]:
+        if limit < 1:
+            raise ValueError(f"Page size must be at least 1, got {limit}!")
+        page = list(itertools.islice(self.iter_rooms(floor, cursor), limit + 1))
+        if len(page) > limit:
+            return page[:limit], self.room_index.ordinal(page[limit - 1])
+        return page, None
+
     def get_total_area(self) -> float:
         result = 0.0
         for floor in self.floors:
@@ -159,6 +353,24 @@ class SmartHouse:
 
     def register_device(self, device: Device, room: Room):
         room.register_device(device)
+        self.changes.append(TopologyChange(TopologyChange.REGISTER_DEVICE, room, device))
+        if device not in self._device_rooms:
+            device.subscribe(self._dispatch)
+        self._device_rooms[device] = room
+        self._devices_by_serial_no[device.serial_no] = device
+        self.device_index.add(device)
+        if isinstance(device, TemperatureSensor):
+            self.invalidate_temperatures()
+
+    def unregister_device(self, device: Device, room: Room):
+        room.unregister_device(device)
+        self.changes.append(TopologyChange(TopologyChange.UNREGISTER_DEVICE, room, device))
+        device.unsubscribe(self._dispatch)
+        self._device_rooms.pop(device, None)
+        self._devices_by_serial_no.pop(device.serial_no, None)
+        self.device_index.remove(device)
+        if isinstance(device, TemperatureSensor):
+            self.invalidate_temperatures()
 
     def get_no_of_devices(self):
         counter = 0
@@ -184,15 +396,65 @@ class SmartHouse:
     def move_device(self, device: Device, from_room: Room, to_room: Room):
         from_room.unregister_device(device)
         to_room.register_device(device)
+        self.changes.append(TopologyChange(TopologyChange.MOVE_DEVICE, to_room, device))
+        self._device_rooms[device] = to_room
+        if isinstance(device, TemperatureSensor):
+            self.invalidate_temperatures()
+
+    def subscribe(self, callback: Callable[[StateChangeEvent], None], room=None, device_type=None,
+                  serial_no: str = None) -> Subscription:
+        """
+        Calls back on state changes of the devices in the house, optionally only for a room (Room or name),
+        a device type (type name or class) or a single serial number.
+        """
+        return self.events.subscribe(callback, room, device_type, serial_no)
+
+    def subscribe_queue(self, queue, loop=None, room=None, device_type=None, serial_no: str = None) -> Subscription:
+        return self.events.subscribe_queue(queue, loop, room, device_type, serial_no)
+
+    def unsubscribe(self, subscription: Subscription):
+        self.events.unsubscribe(subscription)
+
+    def _dispatch(self, event: StateChangeEvent):
+        event.room = self._device_rooms.get(event.device)
+        if self._temperature_state is not None and event.source == StateChangeEvent.MEASUREMENT \
+                and event.serial_no in self._temperature_state \
+                and (event.time_stamp or "") >= self._temperature_times.get(event.serial_no, ""):
+            self._temperature_state[event.serial_no] = event.value
+            if event.time_stamp:
+                self._temperature_times[event.serial_no] = event.time_stamp
+            self._room_temperatures.pop(event.room, None)
+        self.events.publish(event)
+
+    def on_measurement(self, time_stamp: str, device: int, value: Optional[float], serial_no: str):
+        """
+        Measurement listener for SmartHousePersistence: turns ingested readings into state change events.
+        """
+        sensor = self._devices_by_serial_no.get(serial_no)
+        if sensor is not None:
+            sensor.notify(value, StateChangeEvent.MEASUREMENT, time_stamp)
+
+    def attach(self, persistence):
+        """
+        Publishes the readings ingested through the given SmartHousePersistence as events of this house.
+        """
+        if self.on_measurement not in persistence.measurement_listeners:
+            persistence.measurement_listeners.append(self.on_measurement)
 
     def find_device_by_serial_no(self, serial_no: str) -> Optional[Device]:
-        for floor in self.floors:
+        device = self._devices_by_serial_no.get(serial_no)
+        if device is not None:
+            return device
+        for floor in self.floors:  # devices registered with a room directly
             device = floor.find_device(serial_no)
             if device:
                 return device
         return None
 
     def get_room_with_device(self, device: Device):
+        room = self._device_rooms.get(device)
+        if room is not None and device in room:
+            return room
         for floor in self.floors:
             for room in floor:
                 if device in room:
@@ -202,22 +464,81 @@ class SmartHouse:
     def get_all_devices_in_room(self, room: Room) -> List[Device]:
         return room.get_devices()
 
+    @metrics.timed(metrics.SCENES, scene="apply_visitor")
+    def apply_visitor(self, visitor: DeviceVisitor, rooms: Optional[List[Room]] = None) -> int:
+        """
+        Lets the visitor visit every device in the given rooms (all rooms by default) in one pass.
+        Returns the number of devices visited.
+        """
+        if rooms is None:
+            rooms = self.get_all_rooms()
+        count = 0
+        for room in rooms:
+            for device in room:
+                device.accept(visitor)
+                count += 1
+        return count
+
+    @metrics.timed(metrics.SCENES, scene="turn_on_lights")
     def turn_on_lights_in_room(self, room: Room):
         v = TurnOnLightsVisitor()
         for device in [d for d in room if isinstance(d, LightBulb)]:
             device.accept(v)
 
+    @metrics.timed(metrics.SCENES, scene="turn_off_lights")
     def turn_off_lights_in_room(self, room: Room):
         v = TurnOffLightsVisitor()
         for device in [d for d in room if isinstance(d, LightBulb)]:
             device.accept(v)
 
-    def get_temperature_in_room(self, room: Room) -> float:
-        v = GetTemperatureVisitor()
+    def invalidate_temperatures(self):
+        """
+        Drops the cached sensor values and room temperatures, e.g. after device_state has been written
+        by someone else. Readings published through attach() update the cache by themselves, and
+        SmartHousePersistence.add_measurements() stores them in device_state, so they survive a reload.
+        """
+        self._temperature_state = None
+        self._room_temperatures.clear()
+        self._temperature_times.clear()
+
+    def _load_temperature_state(self) -> Dict[str, Optional[float]]:
+        # one query per database for all temperature sensors instead of one per sensor
+        state: Dict[str, Optional[float]] = {}
+        by_db_file: Dict[Optional[str], List[str]] = {}
+        for device in self._devices_by_serial_no.values():
+            if isinstance(device, TemperatureSensor):
+                state[device.serial_no] = None
+                by_db_file.setdefault(device.db_file, []).append(device.serial_no)
+        for db_file, serial_nos in by_db_file.items():
+            with database.session(db_file) as conn:
+                for serial_no, value in conn.execute(
+                        f"SELECT serial_no, value FROM device_state WHERE serial_no IN ({', '.join('?' * len(serial_nos))})",
+                        serial_nos).fetchall():
+                    state[serial_no] = value if isinstance(value, (int, float)) else None
+        return state
+
+    @metrics.timed(metrics.SCENES, scene="get_temperature")
+    def get_temperature_in_room(self, room: Room, fusion: str = "mean") -> Optional[float]:
+        """
+        Returns the temperature of the room, the mean (or median) of the current values of its temperature sensors,
+        None if it has none. The values of all sensors are read at once and cached together with the result
+        until the room's sensors report new readings or the topology changes.
+        """
+        temperatures = self._room_temperatures.setdefault(room, {})
+        if fusion in temperatures:
+            return temperatures[fusion]
+        if self._temperature_state is None:
+            self._temperature_state = self._load_temperature_state()
+        v = GetTemperatureVisitor(fusion, self._temperature_state)
         for device in self.get_all_devices_in_room(room):
             device.accept(v)
-        return v.get_result()
+        temperatures[fusion] = v.get_result()
+        return temperatures[fusion]
+
+    def get_temperature_in_rooms(self, fusion: str = "mean") -> Dict[Room, Optional[float]]:
+        return {room: self.get_temperature_in_room(room, fusion) for room in self.iter_rooms()}
 
+    @metrics.timed(metrics.SCENES, scene="set_temperature")
     def set_temperature_in_room(self, room: Room, temperature: float):
         v = SetTemperatureVisitor(temperature)
         for device in self.get_all_devices_in_room(room):
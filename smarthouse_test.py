@@ -1,8 +1,11 @@
 import unittest
 import main
+from devices import LightBulb, TemperatureSensor
+from persistence import SmartHousePersistence
+from testcase import DemoDatabaseTestCase
 
 
-class SmartHouseTest(unittest.TestCase):
+class SmartHouseTest(DemoDatabaseTestCase):
     house = main.build_demo_house()
 
     def test_no_of_rooms(self):
@@ -62,6 +65,86 @@ class SmartHouseTest(unittest.TestCase):
         SmartHouseTest.house.turn_off_lights_in_room(master_bedroom)
         self.assertEqual("Aktuator(627ff5f3-f4f5-47bd) TYPE: Smart Lys STATUS: OFF PRODUCT DETAILS: Fritsch Group Alphazap 2", dev25.__repr__())
 
+    def test_paging(self):
+        house = main.build_demo_house()
+        devices = list(house.iter_devices())
+        self.assertCountEqual(house.get_all_devices(), devices)
+        self.assertEqual(list(range(31)), [house.device_index.ordinal(d) for d in devices])
+        pages = []
+        cursor = None
+        while True:
+            page, cursor = house.page_devices(limit=7, cursor=cursor)
+            pages.append(page)
+            if cursor is None:
+                break
+        self.assertEqual([7, 7, 7, 7, 3], [len(p) for p in pages])
+        self.assertEqual(devices, [d for p in pages for d in p])
+        sensors = list(house.iter_devices(category="Sensor"))
+        self.assertEqual(8, len(sensors))
+        self.assertEqual(7, len(list(house.iter_devices(device_type="Smart Lys", floor=1))))
+        self.assertEqual(11, len(list(house.iter_devices(device_type=LightBulb))))
+        self.assertEqual(4, len(list(house.iter_devices(device_type="Paneloven"))))
+        bedroom = house.get_room_with_device(house.find_device_by_serial_no("627ff5f3-f4f5-47bd"))
+        self.assertEqual(bedroom.devices, list(house.iter_devices(room=bedroom)))
+        self.assertEqual(bedroom.devices, list(house.iter_devices(room=bedroom.name)))
+        rooms, cursor = house.page_rooms(limit=10)
+        self.assertEqual(10, len(rooms))
+        self.assertEqual(house.get_all_rooms()[10:], house.page_rooms(limit=10, cursor=cursor)[0])
+        self.assertRaises(ValueError, house.page_devices, limit=0)
+        self.assertRaises(ValueError, house.page_rooms, limit=0)
+        self.assertEqual(len(house.floors[1].rooms), len(list(house.iter_rooms(floor=2))))
+        # ordinals stay stable when devices move or are removed
+        device = devices[3]
+        house.move_device(device, house.get_room_with_device(device), bedroom)
+        self.assertIs(device, house.device_index.get(3))
+        house.unregister_device(device, bedroom)
+        self.assertIsNone(house.device_index.ordinal(device))
+        self.assertIs(devices[4], house.device_index.get(4))
+        self.assertEqual(30, len(list(house.iter_devices())))
+
+
+    def test_temperature_fusion(self):
+        p = SmartHousePersistence(self.db_file)
+        house = main.load_house(p)
+        bedroom = house.get_room_with_device(house.find_device_by_serial_no("627ff5f3-f4f5-47bd"))
+        for serial_no, value in (("fusion-1", 17.0), ("fusion-2", 21.3)):
+            sensor = TemperatureSensor(serial_no, "", "", "", device_id=100 + len(bedroom))
+            sensor.db_file = self.db_file
+            house.register_device(sensor, bedroom)
+            p.cursor.execute("INSERT INTO device_state VALUES (?, ?)", (serial_no, value))
+        p.save()
+        self.assertAlmostEqual((16.1 + 17.0 + 21.3) / 3, house.get_temperature_in_room(bedroom))
+        self.assertEqual(17.0, house.get_temperature_in_room(bedroom, "median"))
+        self.assertRaises(ValueError, house.get_temperature_in_room, bedroom, "max")
+        temperatures = house.get_temperature_in_rooms()
+        self.assertEqual(12, len(temperatures))
+        self.assertIsNone(temperatures[house.get_room_with_device(house.find_device_by_serial_no("6a36c71d-4f48-4eb4"))])
+
+        # served from the cache until the sensors report, or the cache is dropped
+        p.cursor.execute("UPDATE device_state SET value = 30 WHERE serial_no = 'fusion-2'")
+        p.save()
+        self.assertEqual(17.0, house.get_temperature_in_room(bedroom, "median"))
+        house.attach(p)
+        p.add_measurements([("2023-02-16T08:00:00", 100, 15.0, "fusion-1")])
+        p.save()
+        self.assertEqual(16.1, house.get_temperature_in_room(bedroom, "median"))
+        # the newest reading is the stored current value, so it survives dropping the cache
+        house.invalidate_temperatures()
+        self.assertEqual(16.1, house.get_temperature_in_room(bedroom, "median"))
+        self.assertAlmostEqual((16.1 + 15.0 + 30) / 3, house.get_temperature_in_room(bedroom))
+        # older readings do not replace the current value
+        p.add_measurements([("2023-02-16T09:00:00", 100, 14.0, "fusion-1")])
+        p.add_measurements([("2023-02-15T08:00:00", 100, 40.0, "fusion-1")])
+        p.save()
+        self.assertAlmostEqual((16.1 + 14.0 + 30) / 3, house.get_temperature_in_room(bedroom))
+        house.invalidate_temperatures()
+        self.assertAlmostEqual((16.1 + 14.0 + 30) / 3, house.get_temperature_in_room(bedroom))
+        # inside a transaction the sensor values are read through its connection
+        with p.transaction():
+            p.cursor.execute("UPDATE device_state SET value = 20 WHERE serial_no = 'fusion-2'")
+            house.invalidate_temperatures()
+            self.assertAlmostEqual((16.1 + 14.0 + 20) / 3, house.get_temperature_in_room(bedroom))
+
 
 if __name__ == '__main__':
     unittest.main()
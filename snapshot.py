@@ -0,0 +1,106 @@
+import marshal
+import os
+from typing import Optional
+
+import database
+from devices import DEVICE_TYPES
+from smarthouse import SmartHouse
+
+# Snapshot file layout: MAGIC followed by a marshalled tuple
+# (format, database file, database version, no of floors, rooms, devices), where rooms are
+# (floor no, room id, area, name) in room ordinal order and devices are
+# (room position, device id, type name, serial no, producer, product type, nickname) in device ordinal order.
+# The device state is not part of the snapshot, devices read it from the database as usual.
+MAGIC = b"SHSNAP"
+FORMAT = 2
+
+# Every write to the topology increments house_version.version, whoever does it
+VERSIONING = "".join(
+    f"CREATE TRIGGER IF NOT EXISTS {table}_{action.lower()}_version AFTER {action} ON {table} "
+    f"BEGIN UPDATE house_version SET version = version + 1; END;\n"
+    for table in ("rooms", "devices") for action in ("INSERT", "UPDATE", "DELETE"))
+
+
+def enable_versioning(connection):
+    """
+    Adds the house_version table and its triggers to the database. Only done when a snapshot is saved,
+    i.e. for databases the user starts from snapshots.
+    """
+    connection.executescript(
+        "CREATE TABLE IF NOT EXISTS house_version(version INTEGER NOT NULL);\n"
+        "INSERT INTO house_version (version) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM house_version);\n"
+        + VERSIONING)
+
+
+def database_version(connection) -> Optional[int]:
+    """
+    Returns the change version of the database, or None if versioning has not been enabled.
+    """
+    if not connection.execute("SELECT 1 FROM sqlite_schema WHERE type = 'table' AND name = 'house_version'").fetchall():
+        return None
+    return connection.execute("SELECT version FROM house_version").fetchall()[0][0]
+
+
+def save_snapshot(house: SmartHouse, file_path: str, db_file: str = None) -> int:
+    """
+    Writes the topology of the house, which should be the one stored in the database, into a snapshot file.
+    Returns the database version the snapshot belongs to.
+    """
+    db_file = os.path.abspath(db_file or database.DEFAULT_DB_FILE)
+    connection = database.connect(db_file)
+    try:
+        enable_versioning(connection)
+        connection.commit()
+        version = database_version(connection)
+    finally:
+        connection.close()
+    rooms = list(house.iter_rooms())
+    room_positions = {room: i for i, room in enumerate(rooms)}
+    data = (FORMAT, db_file, version, len(house.floors),
+            [(house.get_floor_no(r), r.room_id, r.area, r.name) for r in rooms],
+            [(room_positions[house.get_room_with_device(d)], d.device_id, d.get_type_name(), d.serial_no, d.producer,
+              d.product_type, d.nickname) for d in house.iter_devices()])
+    with open(file_path + ".tmp", "wb") as f:
+        f.write(MAGIC)
+        f.write(marshal.dumps(data))
+    os.replace(file_path + ".tmp", file_path)
+    return version
+
+
+def load_snapshot(file_path: str, db_file: str = None) -> Optional[SmartHouse]:
+    """
+    Restores a house from a snapshot file. Returns None if there is no usable snapshot, i.e. if the file
+    is missing or damaged, was taken of another database or the database has changed since.
+    """
+    db_file = os.path.abspath(db_file or database.DEFAULT_DB_FILE)
+    try:
+        with open(file_path, "rb") as f:
+            content = f.read()
+        if not content.startswith(MAGIC):
+            return None
+        data_format, snapshot_db_file, version, no_of_floors, rooms, devices = marshal.loads(content[len(MAGIC):])
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if data_format != FORMAT or snapshot_db_file != db_file:
+        return None
+    connection = database.connect(db_file)
+    try:
+        if database_version(connection) != version:
+            return None
+    finally:
+        connection.close()
+
+    house = SmartHouse()
+    for _ in range(no_of_floors):
+        house.create_floor()
+    created = []
+    for floor_no, room_id, area, name in rooms:
+        room = house.create_room(floor_no, area, name)
+        room.room_id = room_id
+        created.append(room)
+    for room_position, device_id, type_name, serial_no, producer, product_type, nickname in devices:
+        device = DEVICE_TYPES[type_name](serial_no, producer, product_type, nickname, device_id=device_id)
+        device.db_file = db_file
+        house.register_device(device, created[room_position])
+    house.changes.clear()
+    return house
@@ -0,0 +1,60 @@
+import os
+import unittest
+from pathlib import Path
+import database
+from devices import LightBulb
+from main import load_house
+from persistence import SmartHousePersistence
+from snapshot import database_version, load_snapshot, save_snapshot
+from testcase import DemoDatabaseTestCase
+
+
+class SnapshotTest(DemoDatabaseTestCase):
+    file_path = str(Path(__file__).parent.absolute()) + "/db.sqlite"
+
+    def test_snapshot(self):
+        snapshot_file = os.path.join(self.tmp_dir, "house.snapshot")
+        self.assertIsNone(load_snapshot(snapshot_file, self.db_file))
+        p = SmartHousePersistence(self.db_file)
+        house = load_house(p)
+        # only saving a snapshot adds the versioning to the database
+        self.assertIsNone(database_version(p.connection))
+        save_snapshot(house, snapshot_file, self.db_file)
+        self.assertIsNotNone(database_version(p.connection))
+
+        restored = load_snapshot(snapshot_file, self.db_file)
+        self.assertEqual(house.get_no_of_rooms(), restored.get_no_of_rooms())
+        self.assertEqual(house.get_total_area(), restored.get_total_area())
+        self.assertEqual([(d.serial_no, d.get_type_name(), d.device_id) for d in house.iter_devices()],
+                         [(d.serial_no, d.get_type_name(), d.device_id) for d in restored.iter_devices()])
+        self.assertEqual([house.get_room_with_device(d).room_id for d in house.iter_devices()],
+                         [restored.get_room_with_device(d).room_id for d in restored.iter_devices()])
+        self.assertEqual([], restored.changes)
+
+        # device commands keep the snapshot, the restored devices read their state from the database
+        bulb = next(d for d in restored.iter_devices() if isinstance(d, LightBulb))
+        bulb.turn_on()
+        restored = load_snapshot(snapshot_file, self.db_file)
+        bulb = restored.find_device_by_serial_no(bulb.serial_no)
+        self.assertEqual("ON", bulb.get_status_message())
+
+        # another database, or any write to the topology, invalidates the snapshot
+        self.assertIsNone(load_snapshot(snapshot_file, SnapshotTest.file_path))
+        rooms = restored.get_all_rooms()
+        restored.move_device(bulb, restored.get_room_with_device(bulb), rooms[-1])
+        p.save_topology(restored)
+        self.assertIsNone(load_snapshot(snapshot_file, self.db_file))
+        save_snapshot(restored, snapshot_file, self.db_file)
+        moved = load_snapshot(snapshot_file, self.db_file)
+        self.assertEqual(rooms[-1].room_id, moved.get_room_with_device(moved.find_device_by_serial_no(bulb.serial_no)).room_id)
+
+        with open(snapshot_file, "r+b") as f:
+            f.truncate(50)
+        self.assertIsNone(load_snapshot(snapshot_file, self.db_file))
+
+    def test_demo_database_is_not_versioned(self):
+        self.assertIsNone(database_version(database.connect(SnapshotTest.file_path)))
+
+
+if __name__ == '__main__':
+    unittest.main()
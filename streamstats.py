@@ -0,0 +1,90 @@
+import math
+from sqlite3 import Connection
+from typing import Dict, Optional, Tuple
+
+
+class RunningStats:
+    """
+    Minimum, maximum, count, mean and variance of a stream of values, updated in O(1) per value
+    (Welford's algorithm).
+    """
+    __slots__ = ['count', 'mean', 'm2', 'min', 'max']
+
+    def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0, minimum: float = math.inf,
+                 maximum: float = -math.inf):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2  # sum of squared differences from the mean
+        self.min = minimum
+        self.max = maximum
+
+    def add(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def variance(self) -> Optional[float]:
+        """
+        Population variance of the values seen so far.
+        """
+        return self.m2 / self.count if self.count else None
+
+    def describe(self) -> Optional[Tuple[float, float, float]]:
+        """
+        Returns (minimum, maximum, average), or None if no values have been added.
+        """
+        return (self.min, self.max, self.mean) if self.count else None
+
+
+class RoomTemperatureStatistics:
+    """
+    Running temperature statistics per room. load() computes the starting point from the whole history
+    with a single query, afterwards every ingested reading updates its room in O(1).
+    Register on_measurement as measurement listener of SmartHousePersistence to keep it up to date.
+    """
+
+    SENSOR_TYPE = "Temperatursensor"
+
+    def __init__(self):
+        self.rooms: Dict[str, RunningStats] = {}
+        self.device_rooms: Dict[int, str] = {}  # temperature sensor device id -> room name
+
+    def load(self, connection: Connection):
+        self.rooms.clear()
+        self.device_rooms.clear()
+        rows = connection.execute(
+            "SELECT d.id, r.name FROM devices d INNER JOIN rooms r ON r.id = d.room WHERE d.type = ?",
+            (self.SENSOR_TYPE,)).fetchall()
+        self.device_rooms.update(rows)
+        for name, count, average, minimum, maximum, squares in connection.execute(
+                "SELECT r.name, COUNT(m.value), AVG(m.value), MIN(m.value), MAX(m.value), TOTAL(m.value * m.value) "
+                "FROM measurements m INNER JOIN devices d ON d.serial_no = m.serial_no INNER JOIN rooms r ON r.id = d.room "
+                "WHERE d.type = ? AND m.value IS NOT NULL GROUP BY r.name", (self.SENSOR_TYPE,)).fetchall():
+            m2 = max(0.0, squares - count * average * average)
+            self.rooms[name] = RunningStats(count, average, m2, minimum, maximum)
+
+    def on_measurement(self, time_stamp: str, device: int, value: Optional[float], serial_no: str):
+        room = self.device_rooms.get(device)
+        if room is None or value is None:
+            return
+        stats = self.rooms.get(room)
+        if stats is None:
+            stats = self.rooms[room] = RunningStats()
+        stats.add(value)
+
+    def move_device(self, device: int, room: Optional[str]):
+        """
+        Attributes future readings of the sensor to another room, earlier readings stay where they were.
+        """
+        if room is None:
+            self.device_rooms.pop(device, None)
+        else:
+            self.device_rooms[device] = room
+
+    def describe(self) -> Dict[str, Tuple[float, float, float]]:
+        return {name: stats.describe() for name, stats in self.rooms.items() if stats.count}
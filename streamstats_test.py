@@ -0,0 +1,69 @@
+import os
+import statistics
+import unittest
+from datetime import datetime
+from archive import MeasurementArchive
+from main import load_house
+from persistence import SmartHousePersistence, SmartHouseAnalytics
+from streamstats import RunningStats, RoomTemperatureStatistics
+from testcase import DemoDatabaseTestCase
+
+
+class StreamStatsTest(DemoDatabaseTestCase):
+    def test_running_stats(self):
+        values = [3.5, -1.25, 7.0, 2.0, 2.0, 10.5]
+        stats = RunningStats()
+        self.assertIsNone(stats.describe())
+        for v in values:
+            stats.add(v)
+        self.assertEqual(len(values), stats.count)
+        self.assertEqual(-1.25, stats.min)
+        self.assertEqual(10.5, stats.max)
+        self.assertAlmostEqual(statistics.mean(values), stats.mean)
+        self.assertAlmostEqual(statistics.pvariance(values), stats.variance())
+
+    def test_incremental_room_statistics(self):
+        p = SmartHousePersistence(self.db_file)
+        analytics = SmartHouseAnalytics(p)
+        before = analytics.describe_temperature_in_rooms()
+        self.assertEqual({"Living Room / Kitchen", "Entrance", "Master Bedroom"}, set(before))
+
+        # device 8 is the temperature sensor in the entrance
+        p.add_measurements([("2023-02-16T08:00:00", 8, -5.5, "e237beec-2675-4cb0"),
+                            ("2023-02-16T08:01:00", 8, 30.0, "e237beec-2675-4cb0")])
+        after = analytics.describe_temperature_in_rooms()
+        self.assertEqual((-5.5, 30.0), after["Entrance"][:2])
+        self.assertEqual(before["Master Bedroom"], after["Master Bedroom"])
+
+        reloaded = RoomTemperatureStatistics()
+        reloaded.load(p.connection)
+        for room, expected in reloaded.describe().items():
+            for a, b in zip(expected, after[room]):
+                self.assertAlmostEqual(a, b)
+            self.assertAlmostEqual(reloaded.rooms[room].variance(), analytics.room_temperatures.rooms[room].variance())
+
+        # readings of a sensor moved to another room count for the new room
+        house = load_house(p)
+        sensor = house.find_device_by_serial_no("e237beec-2675-4cb0")
+        office = next(r for r in house.get_all_rooms() if r.name == "Office")
+        house.move_device(sensor, house.get_room_with_device(sensor), office)
+        p.save_topology(house)
+        p.add_measurements([("2023-02-16T08:02:00", 8, 40.0, "e237beec-2675-4cb0")])
+        moved = analytics.describe_temperature_in_rooms()
+        self.assertEqual(after["Entrance"], moved["Entrance"])
+        self.assertEqual((40.0, 40.0, 40.0), moved["Office"])
+
+        # readings committed by other connections and archived readings cause a reload
+        p.save()
+        other = SmartHousePersistence(self.db_file)
+        other.add_measurements([("2023-02-16T08:03:00", 8, -20.0, "e237beec-2675-4cb0")])
+        other.save()
+        self.assertEqual(-20.0, analytics.describe_temperature_in_rooms()["Office"][0])
+        p.archive = MeasurementArchive(os.path.join(self.tmp_dir, "archive"))
+        p.archive_measurements(datetime(2023, 2, 16, 8, 3))
+        self.assertEqual((-20.0, -20.0, -20.0), analytics.describe_temperature_in_rooms()["Office"])
+        self.assertNotIn("Entrance", analytics.describe_temperature_in_rooms())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import database
+from smarthouse import SmartHouse
+
+
+class DemoDatabaseTestCase(unittest.TestCase):
+    """
+    Base class of the tests that write to the demo database (device commands, ingested readings, moves):
+    every test gets its own copy of db.sqlite as `db_file` in the temporary directory `tmp_dir`.
+    """
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp_dir = tmp.name
+        self.db_file = os.path.join(self.tmp_dir, "db.sqlite")
+        shutil.copyfile(database.DEFAULT_DB_FILE, self.db_file)
+
+    def build_demo_house(self) -> SmartHouse:
+        """
+        main.build_demo_house() with all devices keeping their state in the copy.
+        """
+        from main import build_demo_house
+        house = build_demo_house()
+        for device in house.get_all_devices():
+            device.db_file = self.db_file
+        return house
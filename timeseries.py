@@ -0,0 +1,201 @@
+import bisect
+import math
+import mmap
+import os
+from array import array
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from archive import to_epoch, file_name, EPOCH
+
+TIMESTAMPS_SUFFIX = ".ts"  # int64 seconds since the epoch, native byte order
+VALUES_SUFFIX = ".val"  # float64, NaN for NULL, native byte order
+
+
+class SensorSeries:
+    """
+    Read-only view of the history of one sensor. Both columns are memory-mapped and exposed as
+    memoryviews, so range queries return slices of the mapped file without copying.
+    """
+
+    def __init__(self, timestamps_path: str, values_path: str):
+        self._maps = []
+        self.timestamps = self._map(timestamps_path, "q")
+        self.values = self._map(values_path, "d")
+        if len(self.timestamps) != len(self.values):
+            raise ValueError(f"Columns of {timestamps_path} have different lengths!")
+
+    def _map(self, file_path: str, typecode: str) -> memoryview:
+        if os.path.getsize(file_path) == 0:
+            return memoryview(array(typecode))
+        with open(file_path, "rb") as f:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(m)
+        return memoryview(m).cast(typecode)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def range(self, from_ts: datetime, to_ts: datetime) -> Tuple[memoryview, memoryview]:
+        """
+        Returns zero-copy (timestamps, values) slices of the readings within [from_ts, to_ts].
+        """
+        lo = bisect.bisect_left(self.timestamps, to_epoch(from_ts))
+        hi = bisect.bisect_right(self.timestamps, to_epoch(to_ts))
+        return self.timestamps[lo:hi], self.values[lo:hi]
+
+    def close(self):
+        """
+        Unmaps the files. Slices returned by range() must have been released before.
+        """
+        self.timestamps.release()
+        self.values.release()
+        for m in self._maps:
+            m.close()
+        self._maps.clear()
+
+
+class TimeSeriesStore:
+    """
+    Directory with two flat binary files per sensor (<serial>.ts and <serial>.val), sorted by time.
+    Built from the measurements table (and the archive) with build() and read through memory maps.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._open: Dict[str, SensorSeries] = {}
+
+    def _path(self, serial_no: str, suffix: str) -> str:
+        return os.path.join(self.directory, file_name(serial_no) + suffix)
+
+    def open(self, serial_no: str) -> Optional[SensorSeries]:
+        series = self._open.get(serial_no)
+        if series is None:
+            if not os.path.exists(self._path(serial_no, TIMESTAMPS_SUFFIX)):
+                return None
+            series = SensorSeries(self._path(serial_no, TIMESTAMPS_SUFFIX), self._path(serial_no, VALUES_SUFFIX))
+            self._open[serial_no] = series
+        return series
+
+    def close(self):
+        for series in self._open.values():
+            series.close()
+        self._open.clear()
+
+    def append(self, serial_no: str, timestamps: Iterable[int], values: Iterable[float]):
+        """
+        Appends readings that are newer than the ones already stored for the sensor.
+        """
+        timestamps = array("q", timestamps)
+        values = array("d", values)
+        if len(timestamps) != len(values):
+            raise ValueError("Timestamps and values must have the same length!")
+        series = self.open(serial_no)
+        if series is not None:
+            if len(series) and len(timestamps) and timestamps[0] < series.timestamps[-1]:
+                raise ValueError(f"Readings for {serial_no} must be appended in time order!")
+            series.close()
+            del self._open[serial_no]
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path(serial_no, TIMESTAMPS_SUFFIX), "ab") as f:
+            timestamps.tofile(f)
+        with open(self._path(serial_no, VALUES_SUFFIX), "ab") as f:
+            values.tofile(f)
+
+    def build(self, persistence, chunk_size: int = 100_000) -> int:
+        """
+        (Re)creates the store from all measurements of the given SmartHousePersistence, including its archive.
+        Returns the number of readings written.
+        """
+        self.close()
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(self.directory):
+            if name.endswith(TIMESTAMPS_SUFFIX) or name.endswith(VALUES_SUFFIX):
+                os.remove(os.path.join(self.directory, name))
+        archived = set()
+        if persistence.archive is not None and os.path.isdir(persistence.archive.directory):
+            archived = set(os.listdir(persistence.archive.directory))
+        cursor = persistence.connection.cursor()
+        cursor.execute("SELECT serial_no, time_stamp, value FROM measurements ORDER BY serial_no, time_stamp")
+        count = 0
+        current = None
+        rows = cursor.fetchmany(chunk_size)
+        while rows:
+            for serial_no, group in _group_by_serial_no(rows):
+                if serial_no != current:
+                    count += self._append_archived(persistence, serial_no)
+                    archived.discard(file_name(serial_no))
+                    current = serial_no
+                self.append(serial_no, [to_epoch(r[1]) for r in group],
+                            [math.nan if r[2] is None else r[2] for r in group])
+                count += len(group)
+            rows = cursor.fetchmany(chunk_size)
+        cursor.close()
+        # sensors that only have archived readings, their directory name is the (file name safe) serial no
+        for serial_no in archived:
+            count += self._append_archived(persistence, serial_no)
+        return count
+
+    def _append_archived(self, persistence, serial_no: str) -> int:
+        if persistence.archive is None:
+            return 0
+        timestamps, values = persistence.archive.read(serial_no, EPOCH, datetime.max)
+        if len(timestamps):
+            self.append(serial_no, timestamps, values)
+        return len(timestamps)
+
+
+def _group_by_serial_no(rows: List[tuple]) -> Iterable[Tuple[str, List[tuple]]]:
+    start = 0
+    for i in range(1, len(rows) + 1):
+        if i == len(rows) or rows[i][0] != rows[start][0]:
+            yield rows[start][0], rows[start:i]
+            start = i
+
+
+def describe(values: Iterable[float]) -> Optional[Tuple[float, float, float]]:
+    """
+    Returns (minimum, maximum, average) of the values ignoring NaN, or None if there are none.
+    """
+    if isinstance(values, (memoryview, array)):
+        if len(values) == 0:
+            return None
+        total = sum(values)
+        if total == total:  # no NaN, so the builtins can run over the buffer directly
+            return min(values), max(values), total / len(values)
+    count = 0
+    total = 0.0
+    low = math.inf
+    high = -math.inf
+    for v in values:
+        if v == v:  # not NaN
+            count += 1
+            total += v
+            if v < low:
+                low = v
+            if v > high:
+                high = v
+    if count == 0:
+        return None
+    return low, high, total / count
+
+
+def hours_above_average(series: List[SensorSeries], day: date, min_count: int = 3) -> List[int]:
+    """
+    Returns the hours [0-23] of the given day in which more than min_count readings of the given series
+    were above the average of all their readings that day.
+    """
+    start = datetime(day.year, day.month, day.day)
+    end = start + timedelta(days=1, seconds=-1)
+    slices = [s.range(start, end) for s in series]
+    stats = describe(v for _, values in slices for v in values)
+    if stats is None:
+        return []
+    average = stats[2]
+    day_start = to_epoch(start)
+    counts = [0] * 24
+    for timestamps, values in slices:
+        for ts, v in zip(timestamps, values):
+            if v > average:
+                counts[(ts - day_start) // 3600] += 1
+    return [hour for hour in range(24) if counts[hour] > min_count]
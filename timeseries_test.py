@@ -0,0 +1,45 @@
+import os
+import tempfile
+import unittest
+from datetime import date, datetime
+from pathlib import Path
+from persistence import SmartHousePersistence, SmartHouseAnalytics
+from timeseries import TimeSeriesStore, describe
+from devices import TemperatureSensor
+
+
+class TimeSeriesTest(unittest.TestCase):
+    file_path = str(Path(__file__).parent.absolute()) + "/db.sqlite"
+
+    def test_describe(self):
+        self.assertEqual((1.0, 3.0, 2.0), describe([3.0, float("nan"), 1.0, 2.0]))
+        self.assertIsNone(describe([]))
+
+    def test_store(self):
+        p = SmartHousePersistence(TimeSeriesTest.file_path)
+        sensor = TemperatureSensor("d16d84de-79f1-4f9a")
+        from_ts = datetime.fromisoformat("2023-02-14T13:35:00")
+        to_ts = datetime.fromisoformat("2023-02-14T13:42:00")
+        with tempfile.TemporaryDirectory() as tmp:
+            store = TimeSeriesStore(os.path.join(tmp, "series"))
+            total = p.cursor.execute("SELECT COUNT(*) FROM measurements").fetchone()[0]
+            self.assertEqual(total, store.build(p))
+
+            timestamps, values = store.open(sensor.serial_no).range(from_ts, to_ts)
+            self.assertIsInstance(values, memoryview)
+            self.assertEqual([21.4786, 22.2991, 21.2237, 21.1827, 22.8388, 21.9996, 21.9651], list(values))
+            timestamps.release()
+            values.release()
+
+            with_store = SmartHouseAnalytics(p, store)
+            without_store = SmartHouseAnalytics(p)
+            for a, b in zip(without_store.describe_sensor_in_timespan(sensor, from_ts, to_ts),
+                            with_store.describe_sensor_in_timespan(sensor, from_ts, to_ts)):
+                self.assertAlmostEqual(a, b)
+            self.assertEqual([8, 13, 17, 18, 19, 20, 21],
+                             with_store.get_hours_when_humidity_above_average("Bathroom 1", date(2023, 2, 13)))
+            store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()